@@ -52,6 +52,10 @@ def create_app(config=Config):
     app.finnhub_client = finnhub.Client(app.config['FINNHUB_API_KEY']) \
         if app.config['FINNHUB_API_KEY'] else None
 
+    # start the deadline budget of calls to data providers for each request
+    from app.circuit_breakers import start_request_deadline
+    app.before_request(start_request_deadline)
+
     # incorporate the auth blueprint
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
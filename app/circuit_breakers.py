@@ -0,0 +1,257 @@
+import redis
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from threading import Lock
+from time import time, monotonic
+from flask import current_app, g
+
+
+class ProviderUnavailableError(Exception):
+    """
+    This class implements the base exception for calls to data providers
+    that are not made or not completed in time, so that callers can degrade
+    to stored data.
+    """
+
+    pass
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """
+    This class implements the exception for calls to a provider whose
+    circuit breaker is open.
+    """
+
+    pass
+
+
+class DeadlineExceededError(ProviderUnavailableError):
+    """
+    This class implements the exception for calls to a provider made or
+    still running after the deadline of the request.
+    """
+
+    pass
+
+
+# the thread pool running provider calls, so that calls without timeouts of
+# their own (such as scrapers) are abandoned once they run out of time
+_executor = None
+_executor_lock = Lock()
+
+# states of circuit breakers kept in process, used while Redis is unavailable
+_local_states = {}
+_local_states_lock = Lock()
+
+
+def _get_executor():
+    """
+    This helper function returns the thread pool for provider calls, and
+    creates it on first use with PROVIDER_MAX_WORKERS threads.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['PROVIDER_MAX_WORKERS'],
+                thread_name_prefix='provider')
+
+    return _executor
+
+
+def start_request_deadline():
+    """
+    This function starts the deadline budget of the current request, of
+    REQUEST_DEADLINE_SECONDS; it is registered to run before each request.
+    """
+
+    g.request_deadline = monotonic() + \
+        current_app.config['REQUEST_DEADLINE_SECONDS']
+
+
+def get_request_deadline():
+    """
+    This function returns the deadline of the current request or app context
+    as a value of time.monotonic(), or None if there is no deadline (such as
+    in background tasks).
+    """
+
+    return g.get('request_deadline', None)
+
+
+def set_request_deadline(deadline):
+    """
+    This function sets the deadline of the current app context, such as to
+    pass the deadline of a request on to threads working for it.
+    """
+
+    g.request_deadline = deadline
+
+
+def get_remaining_time(provider=None):
+    """
+    This function returns the number of seconds a call may take, which is
+    the remaining time of the request deadline, and no longer than the
+    timeout of the given provider (see PROVIDER_TIMEOUT_SECONDS). It raises
+    DeadlineExceededError if no time remains.
+    """
+
+    timeout = current_app.config['PROVIDER_TIMEOUT_SECONDS'].get(provider)
+    deadline = get_request_deadline()
+    if deadline is not None:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(
+                'The request deadline has been exceeded.')
+        timeout = remaining if timeout is None else min(timeout, remaining)
+
+    return timeout
+
+
+class CircuitBreaker(object):
+    """
+    This class implements the circuit breaker of a data provider, with its
+    state shared by all processes of the app in Redis (or kept in process
+    while Redis is unavailable):
+        - closed: calls are made, while failures are counted, until
+                  CIRCUIT_BREAKER_FAILURES failures within
+                  CIRCUIT_BREAKER_WINDOW_SECONDS open the breaker;
+        - open: calls are rejected for CIRCUIT_BREAKER_COOLDOWN_SECONDS;
+        - half-open: after the cooldown, a single trial call is made, which
+                     closes the breaker if it succeeds, or opens it again.
+    """
+
+    def __init__(self, provider):
+        """
+        This method initializes the breaker of the given provider name.
+        """
+
+        self.provider = provider
+        self.key = 'breaker:{}'.format(provider)
+        self.trial_key = 'breaker:{}:trial'.format(provider)
+        self.threshold = current_app.config['CIRCUIT_BREAKER_FAILURES']
+        self.window = current_app.config['CIRCUIT_BREAKER_WINDOW_SECONDS']
+        self.cooldown = current_app.config['CIRCUIT_BREAKER_COOLDOWN_SECONDS']
+
+    def _get_local_state(self):
+        """
+        This method returns the state of the breaker kept in process, as a
+        dictionary of 'failures', 'opened_at' and 'trial_at'.
+        """
+
+        return _local_states.setdefault(
+            self.provider, {'failures': 0, 'opened_at': 0, 'trial_at': 0})
+
+    def allow(self):
+        """
+        This method returns True if a call to the provider can be made, which
+        is when the breaker is closed, or half-open with no trial call made.
+        """
+
+        now = time()
+        try:
+            opened_at = float(current_app.redis.hget(self.key, 'opened_at') or
+                              0)
+            if now - opened_at >= self.cooldown and opened_at:
+                return bool(current_app.redis.set(self.trial_key, 1, nx=True,
+                                                  ex=self.cooldown))
+        except redis.exceptions.RedisError:
+            with _local_states_lock:
+                state = self._get_local_state()
+                opened_at = state['opened_at']
+                if now - opened_at >= self.cooldown and opened_at:
+                    if now - state['trial_at'] < self.cooldown:
+                        return False
+                    state['trial_at'] = now
+                    return True
+
+        return not opened_at
+
+    def record_success(self):
+        """This method closes the breaker after a successful call."""
+
+        try:
+            current_app.redis.delete(self.key, self.trial_key)
+        except redis.exceptions.RedisError:
+            with _local_states_lock:
+                _local_states.pop(self.provider, None)
+
+    def record_failure(self):
+        """
+        This method counts a failed call, and opens the breaker if there have
+        been enough failures, or if the call was a trial call.
+        """
+
+        now = time()
+        try:
+            pipe = current_app.redis.pipeline()
+            pipe.hincrby(self.key, 'failures', 1)
+            pipe.hget(self.key, 'opened_at')
+            pipe.expire(self.key, self.window)
+            failures, opened_at, _ = pipe.execute()
+            opening = failures >= self.threshold or bool(opened_at)
+            if opening:
+                pipe.hset(self.key, 'opened_at', now)
+                pipe.expire(self.key, self.window + self.cooldown * 10)
+                pipe.delete(self.trial_key)
+                pipe.execute()
+        except redis.exceptions.RedisError:
+            with _local_states_lock:
+                state = self._get_local_state()
+                state['failures'] += 1
+                opening = state['failures'] >= self.threshold or \
+                    bool(state['opened_at'])
+                if opening:
+                    state['opened_at'] = now
+                    state['trial_at'] = 0
+
+        if opening:
+            current_app.logger.warning(
+                'The circuit breaker of {} is open.'.format(self.provider))
+
+
+def call_provider(provider, func, *args, is_failure=None, **kwargs):
+    """
+    This function calls the input function of a data provider with the given
+    arguments, guarded by the circuit breaker of the provider, and within
+    the time remaining (see get_remaining_time), and returns its result.
+
+    It raises CircuitOpenError if the breaker rejects the call, and
+    DeadlineExceededError if no time remains or the call runs out of time,
+    in which case the call is abandoned; exceptions raised by the function
+    are passed on. Both count as failures of the provider.
+
+    Inputs:
+        'provider': name of the provider, such as 'gurufocus'.
+        'func': the function calling the provider, which is run in a thread
+                pool without the app context.
+        'is_failure': a function taking the result, and returning True if the
+                      result is a failure of the provider, such as responses
+                      of server errors. Defaulted to None.
+    """
+
+    timeout = get_remaining_time(provider)
+    breaker = CircuitBreaker(provider)
+    if not breaker.allow():
+        raise CircuitOpenError(
+            'The circuit breaker of {} is open.'.format(provider))
+
+    future = _get_executor().submit(func, *args, **kwargs)
+    try:
+        result = future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        future.cancel()
+        breaker.record_failure()
+        raise DeadlineExceededError(
+            'The call to {} ran out of time.'.format(provider))
+    except Exception:
+        breaker.record_failure()
+        raise
+
+    if is_failure is not None and is_failure(result):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    return result
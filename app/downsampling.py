@@ -0,0 +1,113 @@
+import numpy as np
+
+
+def lttb(x, y, num_of_points):
+    """
+    This function downsamples a series of points with the Largest-Triangle-
+    Three-Buckets (LTTB) algorithm, and returns a numpy array of the indices
+    of points kept, in ascending order.
+
+    The first and the last points are always kept; all other points are split
+    into ('num_of_points' - 2) buckets of (nearly) equal sizes, and the point
+    of each bucket forming the largest triangle with the point kept for the
+    previous bucket and the average point of the next bucket is kept. Triangle
+    areas are calculated for all points of a bucket at once, so the number of
+    steps taken in Python only grows with the number of points kept.
+
+    Inputs:
+        'x': a sequence of numbers in ascending order.
+        'y': a sequence of numbers of the same length as 'x'; NaNs are only
+             kept when all points of a bucket are NaNs.
+        'num_of_points': an integer, the number of points to keep, which must
+                         be at least 3. All points are kept if there are no
+                         more points than this.
+    """
+
+    if num_of_points < 3:
+        raise ValueError("At least 3 points must be kept for downsampling.")
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    num_of_values = len(x)
+    if num_of_values <= num_of_points:
+        return np.arange(num_of_values)
+
+    # get the starting index of each bucket, with the last point as the
+    # boundary of the last bucket
+    num_of_buckets = num_of_points - 2
+    edges = (np.arange(num_of_buckets + 1) * (num_of_values - 2) //
+             num_of_buckets + 1)
+
+    # get the average point of each bucket, ignoring NaNs in y, followed by
+    # the last point as the "next bucket" of the last bucket; the last point
+    # is left out of the sums, which otherwise run to the end of arrays
+    valid = ~np.isnan(y[:-1])
+    counts = np.add.reduceat(valid.astype(float), edges[:-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) /
+                              np.diff(edges), x[-1])
+        average_y = np.append(np.add.reduceat(np.where(valid, y[:-1], 0.),
+                                              edges[:-1]) / counts, y[-1])
+
+    indices = np.empty(num_of_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = num_of_values - 1
+
+    # pick one point per bucket, from left to right, since each bucket
+    # depends on the point kept for the previous bucket
+    kept = 0
+    for i in range(num_of_buckets):
+        start, end = edges[i], edges[i + 1]
+        with np.errstate(invalid='ignore'):
+            areas = np.abs(
+                (x[kept] - average_x[i + 1]) * (y[start:end] - y[kept]) -
+                (x[kept] - x[start:end]) * (average_y[i + 1] - y[kept]))
+        areas[np.isnan(areas)] = -1.
+        kept = start + int(np.argmax(areas))
+        indices[i + 1] = kept
+
+    return indices
+
+
+def downsample_series(data, num_of_points=None, start_date=None,
+                      end_date=None):
+    """
+    This function returns a dictionary of "<timestamp>: <value>", with points
+    of the input time series within the given date range, downsampled with
+    LTTB (see lttb) to the given number of points.
+
+    The closest points just outside of the date range are kept as well, so
+    that lines plotted for the range extend to both of its ends.
+
+    Inputs:
+        'data': a dictionary of "<timestamp>: <value>", where timestamps are
+                Python datetime objects in ascending order.
+        'num_of_points': an integer defaulted to be None, the maximum number
+                         of points to keep. All points in the date range are
+                         kept if None.
+        'start_date': a Python datetime object defaulted to be None, the start
+                      of the date range; the range is unbounded if None.
+        'end_date': a Python datetime object defaulted to be None, the end of
+                    the date range; the range is unbounded if None.
+    """
+
+    timestamps = list(data.keys())
+    values = list(data.values())
+
+    # clip the time series to the date range
+    if start_date is not None or end_date is not None:
+        datetimes = np.array(timestamps, dtype='datetime64[us]')
+        first = 0 if start_date is None else max(np.searchsorted(
+            datetimes, np.datetime64(start_date, 'us'), side='left') - 1, 0)
+        last = len(timestamps) if end_date is None else np.searchsorted(
+            datetimes, np.datetime64(end_date, 'us'), side='right') + 1
+        timestamps = timestamps[first:last]
+        values = values[first:last]
+
+    if num_of_points is None or len(timestamps) <= num_of_points:
+        return dict(zip(timestamps, values))
+
+    x = np.array(timestamps, dtype='datetime64[ms]').astype(np.int64)
+    y = np.array(values, dtype=float)
+
+    return {timestamps[i]: values[i] for i in lttb(x, y, num_of_points)}
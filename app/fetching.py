@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FetchTimeoutError
+from threading import Lock
+from time import monotonic
+from flask import current_app
+from app.circuit_breakers import get_request_deadline, set_request_deadline
+
+
+# the thread pool shared by all concurrent fetches of the process, which
+# bounds the number of upstream calls in flight at once
+_executor = None
+_executor_lock = Lock()
+
+
+def _get_executor():
+    """
+    This helper function returns the shared thread pool for fetching, and
+    creates it on first use with FETCH_MAX_WORKERS threads.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['FETCH_MAX_WORKERS'],
+                thread_name_prefix='fetch')
+
+    return _executor
+
+
+def _call_in_app_context(app, fetch, request_deadline=None):
+    """
+    This helper function calls the input fetch function within an app context
+    of the given app, since fetch functions may need the app config and
+    clients kept with the app, with the deadline of the request passed on (see
+    get_request_deadline).
+    """
+
+    with app.app_context():
+        if request_deadline is not None:
+            set_request_deadline(request_deadline)
+        return fetch()
+
+
+def fetch_concurrently(fetches, deadline_seconds=None):
+    """
+    This function calls the input fetch functions concurrently in the shared
+    thread pool, and returns a tuple of two dictionaries, (<results>,
+    <errors>), both keyed by the names of fetches; each fetch either has its
+    returned value in the results, or the exception it raised in the errors.
+
+    Each fetch has a deadline, counted from when all fetches are submitted,
+    and never later than the deadline of the current request if any; a fetch
+    missing its deadline gets a FetchTimeoutError in the errors, and its
+    result is dropped even if it completes later. The function returns once
+    all fetches have completed or missed their deadlines, so the time taken is
+    that of the slowest fetch, instead of the sum of all.
+
+    Fetch functions are called without arguments, and only do network calls;
+    their results should be saved by the caller (in the calling thread, since
+    database sessions are not shared between threads).
+
+    Inputs:
+        'fetches': a dictionary of "<name>: <fetch function>".
+        'deadline_seconds': a dictionary of "<name>: <number of seconds>",
+                            defaulted to None. Fetches not included take the
+                            deadline of FETCH_DEADLINE_SECONDS_DEFAULT.
+    """
+
+    app = current_app._get_current_object()
+    deadline_seconds = deadline_seconds or {}
+    default_deadline = app.config['FETCH_DEADLINE_SECONDS_DEFAULT']
+
+    # submit all fetches at once
+    executor = _get_executor()
+    start = monotonic()
+    request_deadline = get_request_deadline()
+    futures = {name: executor.submit(_call_in_app_context, app, fetch,
+                                     request_deadline)
+               for (name, fetch) in fetches.items()}
+
+    # collect the result of each fetch, waiting no longer than its deadline
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        deadline = start + deadline_seconds.get(name, default_deadline)
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline)
+        try:
+            results[name] = future.result(timeout=max(deadline - monotonic(),
+                                                      0))
+        except FetchTimeoutError as e:
+            future.cancel()
+            errors[name] = e
+        except Exception as e:
+            errors[name] = e
+
+    return results, errors
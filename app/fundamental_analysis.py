@@ -1,5 +1,8 @@
+import numpy as np
 from datetime import datetime
-from app.metrics import Metric
+from app.metrics import Metric, to_numeric
+from app.fundamentals_frame import FundamentalsFrame
+from app.valuation import QuoteGrid, get_valuation_ratio_arrays
 
 
 section_lookup = {
@@ -9,6 +12,7 @@ section_lookup = {
     'Equity-to-Asset': 'common_size_ratios',
     'Debt-to-Equity': 'common_size_ratios',
     'EBITDA': 'income_statement',
+    'EBIT': 'income_statement',
     'Interest Coverage': 'valuation_and_quality',
     'Altman Z-Score': 'valuation_and_quality',
     'Revenue': 'income_statement',
@@ -36,47 +40,28 @@ section_lookup = {
 }
 
 
-def derive_debt_to_cash(name, financials_history, start_date):
+def derive_total_debt(short_term_debt, long_term_debt):
     """
-    This function derives and returns the metric for Debt-to-Cash.
+    This function derives and returns the metric for total debt.
     """
 
-    cash = get_metric(name='Cash, Cash Equivalents, Marketable Securities',
-                      financials_history=financials_history,
-                      start_date=start_date)
-    short_term_debt = \
-        get_metric(name='Short-Term Debt & Capital Lease Obligation',
-                   financials_history=financials_history,
-                   start_date=start_date)
-    long_term_debt = \
-        get_metric(name='Long-Term Debt & Capital Lease Obligation',
-                   financials_history=financials_history,
-                   start_date=start_date)
-    debt_to_cash = (short_term_debt + long_term_debt) / cash
-    debt_to_cash.name = name
+    return short_term_debt + long_term_debt
+
+
+def derive_debt_to_cash(total_debt, cash):
+    """
+    This function derives and returns the metric for Debt-to-Cash.
+    """
 
-    return debt_to_cash
+    return total_debt / cash
 
 
-def derive_debt_to_ebitda(name, financials_history, start_date):
+def derive_debt_to_ebitda(total_debt, ebitda):
     """
     This function derives and returns the metric for Debt-to-EBITDA.
     """
 
-    short_term_debt = \
-        get_metric(name='Short-Term Debt & Capital Lease Obligation',
-                   financials_history=financials_history,
-                   start_date=start_date)
-    long_term_debt = \
-        get_metric(name='Long-Term Debt & Capital Lease Obligation',
-                   financials_history=financials_history,
-                   start_date=start_date)
-    ebitda = get_metric(name='EBITDA', financials_history=financials_history, 
-                        start_date=start_date)
-    debt_to_ebitda = (short_term_debt + long_term_debt) / ebitda
-    debt_to_ebitda.name = name
-
-    return debt_to_ebitda
+    return total_debt / ebitda
 
 
 def get_valuation_ratios(quote_history_data, metric_per_share_data, 
@@ -87,7 +72,8 @@ def get_valuation_ratios(quote_history_data, metric_per_share_data,
     the input quote history data and the input metric (per share) data.
     
     Input:
-        - "quote_history_data" - dictionary of "<timestamp>: <price>"
+        - "quote_history_data" - dictionary of "<timestamp>: <price>", or a 
+                                 QuoteGrid object shared by multiple ratios
         - "metric_per_share_data" - dictionary of "<timestamp>: <per share 
                                     metric value>", with only one record per 
                                     year
@@ -100,130 +86,55 @@ def get_valuation_ratios(quote_history_data, metric_per_share_data,
                              only positive ratios will be kept. 
     """
     
-    # get the ending month of fiscal years, usually either Sep or Dec
-    # this assumes the ending month is always the same across all fiscal years
-    # TODO - can insert code here to check the assumption and raise an exception
-    #        if the assumption does not hold for the input
-    metric_data_last_timestamp = list(metric_per_share_data.keys())[-1]
-    last_month_fiscal_years = metric_data_last_timestamp.month
-    
-    # create a new dictionary of <fiscal year>: <per share metric value> for 
-    # easy per share metric value look up by fiscal year
-    list_years = [timestamp.year for timestamp in metric_per_share_data]
-    dict_year_metric = dict(zip(list_years, metric_per_share_data.values()))
+    # calculate all ratios at once over the quote grid
+    valuation_ratios = get_valuation_ratio_arrays(
+        quote_history_data=quote_history_data, 
+        metric_per_share_data=metric_per_share_data,
+        get_latest_ratios=get_latest_ratios, 
+        only_positives=only_positives)
 
     # form a new dict of "<timestamp>: {'quote': <quote>, 'metric': <metric>, 
     # 'ratio': <ratio>}"
-    dict_timestamp_ratio = {}
-    for timestamp in quote_history_data:
-        
-        # get the annual values for the current year, the prev year and the 
-        # next year
-        metric_value = dict_year_metric.get(timestamp.year)
-        metric_value_prev_year = dict_year_metric.get(timestamp.year - 1)
-        metric_value_next_year = dict_year_metric.get(timestamp.year + 1)
-        
-        # initialize/reset the variable that holds the interpolated / 
-        # extrapolated value for the metric;
-        metric_value_derived = None
-        
-        # when the current month is ealier than or the same as the last month 
-        # of the fiscal year, use metric values of the current year and the 
-        # previous year for interpolation
-        if metric_value and metric_value_prev_year and \
-            timestamp.month <= last_month_fiscal_years:
-
-            # interpolate the monthly TTM value
-            metric_value_derived = \
-                metric_value_prev_year + \
-                (metric_value - metric_value_prev_year) * \
-                (timestamp.month + 12 - last_month_fiscal_years) / 12
-        
-        # when the current month is greater than the last month of the fiscal 
-        # year, use metric values of the current year and the next year for 
-        # interpolation
-        elif metric_value and metric_value_next_year and \
-            timestamp.month > last_month_fiscal_years:
-            
-            # interpolate the monthly TTM value
-            metric_value_derived = \
-                metric_value + \
-                (metric_value_next_year - metric_value) * \
-                (timestamp.month - last_month_fiscal_years) / 12
-
-        # when the current month is greater than the most recent month included 
-        # in the input financial history data, use just the metric value of the 
-        # current year
-        elif get_latest_ratios and timestamp > metric_data_last_timestamp:
-            metric_value_derived = metric_value if metric_value is not None \
-                                                else metric_value_prev_year
-            
-        # only keep records with positive interpolated/extrapolated metric 
-        # values at zero - investors don't really consider P/X ratios when they 
-        # are negative
-        if metric_value_derived is not None:
-
-            if only_positives:
-                if metric_value_derived > 0:
-                    dict_timestamp_ratio[timestamp] = {
-                        'quote': quote_history_data[timestamp], 
-                        'metric': metric_value_derived, 
-                        'ratio': quote_history_data[timestamp] / 
-                                 metric_value_derived}
-            else:
-                dict_timestamp_ratio[timestamp] = {
-                        'quote': quote_history_data[timestamp], 
-                        'metric': metric_value_derived, 
-                        'ratio': quote_history_data[timestamp] / 
-                                 metric_value_derived 
-                                 if metric_value_derived != 0 else 0}
-
-    return dict_timestamp_ratio
+    return {
+        timestamp: {'quote': quote, 'metric': metric, 'ratio': ratio}
+        for (timestamp, quote, metric, ratio) in zip(
+            valuation_ratios.timestamps, 
+            valuation_ratios.quotes.tolist(),
+            valuation_ratios.metrics.tolist(),
+            valuation_ratios.ratios.tolist())
+    }
 
 
-def derive_valuation_ratios(name, underlying_metric_name, financials_history, 
-                            quote_history_data, start_date):
+def derive_valuation_ratios(underlying_metric, quote_history_data, 
+                            start_date):
     """
     This function returns a metric that captures the history of price multiple 
     of a given underlying financial metric.
 
     Inputs:
-        "name": a string value, name of the output metric object to be returned
-        "underlying_metric_name": name of the underlying metric for the price
-                                  multiple, which can be used to look up for the
-                                  values in the input financials history payload
-        "financials_history": the input data payload of financials history
-        "quote_history": the input data payload of quote history
+        "underlying_metric": the metric object of the underlying per share 
+                             metric for the price multiple
+        "quote_history_data": the input data payload of quote history, or a 
+                              QuoteGrid object
         "start_date": a Python datetime object, the start date of a time window;
                       only valuation ratios/price multiples for dates within 
                       that time window will be included in the metric object to 
                       be returned 
     """
 
-    # get the underlying metric from the input financials history payload
-    underlying_metric = get_metric(
-        name=underlying_metric_name, 
-        financials_history=financials_history, 
-        start_date=start_date
-        )
-
-    # get the dictionary of <timestamp>: {<"ratio">: <price multiple>, ...}
-    dict_timestamp_ratio = get_valuation_ratios(
+    # get the arrays of valuation ratios / price multiples
+    valuation_ratios = get_valuation_ratio_arrays(
         quote_history_data=quote_history_data, 
         metric_per_share_data=underlying_metric.data,
         get_latest_ratios=True,
         only_positives=False
         )
-
-    # create a new metric for this valuation ratio / price multiple data
-    ratios = [dict_timestamp_ratio[timestamp]['ratio'] 
-              for timestamp in dict_timestamp_ratio]
     
     # save the valuation ratios in a Metric object
     valuation_ratio = Metric(
-        name=name, 
-        timestamps=list(dict_timestamp_ratio.keys()), 
-        values=ratios, 
+        name=underlying_metric.name, 
+        timestamps=valuation_ratios.timestamps, 
+        values=valuation_ratios.ratios, 
         start_date=start_date, 
         input_timestamps_format=None
         )
@@ -232,53 +143,237 @@ def derive_valuation_ratios(name, underlying_metric_name, financials_history,
     return valuation_ratio
 
 
-def get_metric(name, financials_history, start_date, convert_to_numeric=True, 
-               scale_factor=1.0, derive=None, quote_history_data=None, 
-               underlying_metric_name=None):
+def get_metric(name, fundamentals_frame, start_date, scale_factor=1.0):
     """
     This helper function extracts a metric's data from the financials history 
     data, based on the given metric name and start date of the financials 
     history to be considered.
+
+    The financials history data is given as a FundamentalsFrame, and the 
+    values of the returned metric are a view of the corresponding column.
     """
 
-    # if 'derive' function is given, derive the metric first
-    if derive:
-        if not quote_history_data:
-            return derive(name, financials_history, start_date)
-        else:
-            return derive(name, underlying_metric_name, financials_history, 
-                          quote_history_data, start_date)
+    # get the section of the metric in the financials history payload
+    section = section_lookup[name]
+
+    # manage edge cases of financial values (for insurance companies)
+    fields_not_in_insurance = [
+        'Altman Z-Score',
+        'Operating Income',
+        'Gross Margin %',
+        'Operating Margin %'
+    ]
+    field_name = name
+    if name == 'Cash, Cash Equivalents, Marketable Securities' and \
+        not fundamentals_frame.has(section, name):
+        field_name = 'Balance Statement Cash and cash equivalents'
+    elif name in fields_not_in_insurance and \
+        not fundamentals_frame.has(section, name):
+        field_name = None
+
+    # get values from the frame
+    if field_name is not None:
+        values = fundamentals_frame.column(section, field_name)
+        ttm_value = fundamentals_frame.ttm_value(section, field_name)
     else:
-        # get timestamps from the financials history payload
-        timestamps = financials_history['financials']['annuals']['Fiscal Year']
-
-        # get values from the financials history payload
-        values = financials_history['financials']['annuals']\
-                [section_lookup[name]].get(name)
-
-        # manage edge cases of financial values (for insurance companies)
-        fields_not_in_insurance = [
-            'Altman Z-Score',
-            'Operating Income',
-            'Gross Margin %',
-            'Operating Margin %'
-        ]
-        if name == 'Cash, Cash Equivalents, Marketable Securities' \
-            and values is None:
-            values = financials_history['financials']['annuals']\
-                     [section_lookup[name]].get(
-                     'Balance Statement Cash and cash equivalents')
-        elif name in fields_not_in_insurance and values is None:
-            values = [0] * len(timestamps)          
-
-        return Metric(
-            name=name, 
-            timestamps=timestamps,
-            values=values,
-            start_date=start_date,
-            convert_to_numeric=convert_to_numeric,
-            scale_factor=scale_factor
+        values = np.zeros(len(fundamentals_frame.fiscal_years))
+        ttm_value = 0.0 if fundamentals_frame.has_ttm else None
+
+    metric = Metric(
+        name=name, 
+        timestamps=fundamentals_frame.fiscal_periods,
+        values=values,
+        start_date=start_date,
+        scale_factor=scale_factor
     )
+    if ttm_value is not None:
+        metric.TTM_value = float(to_numeric(np.array([ttm_value]), 
+                                            scale_factor=scale_factor)[0])
+
+    return metric
+
+
+# a lookup of derived metrics, where each derived metric is an expression over 
+# other (base or derived) metrics;
+# metrics not included here are base metrics, extracted from the financials 
+# history payload directly
+metric_expressions = {
+    'Total Debt': {
+        'inputs': ['Short-Term Debt & Capital Lease Obligation',
+                   'Long-Term Debt & Capital Lease Obligation'],
+        'derive': derive_total_debt
+    },
+    'Debt-to-Cash': {
+        'inputs': ['Total Debt', 
+                   'Cash, Cash Equivalents, Marketable Securities'],
+        'derive': derive_debt_to_cash
+    },
+    'Debt-to-EBITDA': {
+        'inputs': ['Total Debt', 'EBITDA'],
+        'derive': derive_debt_to_ebitda
+    },
+    'PE Ratio': {
+        'inputs': ['Earnings per Share (Diluted)'],
+        'derive': derive_valuation_ratios,
+        'quote_history': True
+    },
+    'PB Ratio': {
+        'inputs': ['Book Value per Share'],
+        'derive': derive_valuation_ratios,
+        'quote_history': True
+    },
+    'Price-to-Free-Cash-Flow': {
+        'inputs': ['Free Cash Flow per Share'],
+        'derive': derive_valuation_ratios,
+        'quote_history': True
+    },
+    'Price-to-Operating-Cash-Flow': {
+        'inputs': ['Operating Cash Flow per Share'],
+        'derive': derive_valuation_ratios,
+        'quote_history': True
+    },
+    'PS Ratio': {
+        'inputs': ['Revenue per Share'],
+        'derive': derive_valuation_ratios,
+        'quote_history': True
+    },
+}
+
+
+class MetricGraph(object):
+    """
+    This class implements a lazily evaluated graph of metrics for a stock, 
+    where derived metrics are expressions (from 'metric_expressions') over 
+    base metrics from the financials history payload.
+
+    Metrics are only computed when requested, and are memoized, so each base 
+    metric is extracted exactly once per payload no matter how many derived 
+    metrics depend on it. Base metrics are views of the columns of a 
+    FundamentalsFrame built from the payload.
+    """
+
+    def __init__(self, financials_history=None, quote_history_data=None, 
+                 fundamentals_frame=None, quote_history_loader=None):
+        """
+        Constructor.
+
+        Inputs:
+            'financials_history': the data payload of financials history, 
+                                  defaulted to None. It is not needed if a 
+                                  FundamentalsFrame of it is given instead.
+            'quote_history_data': a dictionary of "<timestamp>: <price>", 
+                                  defaulted to None. It is only needed to 
+                                  evaluate valuation ratios.
+            'fundamentals_frame': a FundamentalsFrame object, defaulted to 
+                                  None. When None, it will be built from the 
+                                  financials history payload when first needed.
+            'quote_history_loader': a function returning the quote history 
+                                    data, defaulted to None. When given 
+                                    instead of 'quote_history_data', it will 
+                                    only be called when quote history data is 
+                                    first needed.
+        """
+
+        if financials_history is None and fundamentals_frame is None:
+            raise ValueError("Either the financials history payload or its "
+                             "FundamentalsFrame must be given.")
+
+        self.financials_history = financials_history
+        self._quote_history_data = quote_history_data
+        self._quote_history_loader = quote_history_loader
+        self._quote_grid = None
+        self._fundamentals_frame = fundamentals_frame
+        self._base_metrics = {}
+        self._metrics = {}
+
+    @property
+    def fundamentals_frame(self):
+        """
+        This method returns the FundamentalsFrame of the financials history, 
+        and builds it first if needed.
+        """
+
+        if self._fundamentals_frame is None:
+            self._fundamentals_frame = FundamentalsFrame.from_payload(
+                self.financials_history)
+
+        return self._fundamentals_frame
+
+    @property
+    def quote_history_data(self):
+        """
+        This method returns the quote history data, and loads it first if 
+        needed.
+        """
+
+        if self._quote_history_data is None and \
+            self._quote_history_loader is not None:
+            self._quote_history_data = self._quote_history_loader()
+
+        return self._quote_history_data
+
+    @property
+    def quote_grid(self):
+        """
+        This method returns the quote history data as a QuoteGrid object, 
+        which is built once and shared by all valuation ratios.
+        """
+
+        if self._quote_grid is None and self.quote_history_data is not None:
+            self._quote_grid = QuoteGrid(self.quote_history_data)
+
+        return self._quote_grid
+
+    def get_base(self, name, scale_factor=1.0):
+        """
+        This method returns the base metric of the given name with the full 
+        history from the financials history payload.
+        """
+
+        key = (name, scale_factor)
+        if key not in self._base_metrics:
+            self._base_metrics[key] = get_metric(
+                name=name, fundamentals_frame=self.fundamentals_frame, 
+                start_date=datetime(1900, 1, 1), scale_factor=scale_factor)
+
+        return self._base_metrics[key]
+
+    def get(self, name, start_date=datetime(1900, 1, 1), scale_factor=1.0):
+        """
+        This method returns the metric of the given name, with only records 
+        after the given start date.
+
+        Inputs:
+            'name': name of a base metric or a derived metric.
+            'start_date': a Python datetime object, defaulted to 1/1/1900.
+            'scale_factor': a float value, defaulted to 1.0. It only applies 
+                            to base metrics.
+        """
+
+        key = (name, start_date, scale_factor)
+        if key in self._metrics:
+            return self._metrics[key]
+
+        expression = metric_expressions.get(name)
+        if expression is None:
+            metric = self.get_base(name, scale_factor).since(start_date)
+        else:
+            if expression.get('quote_history') and \
+                self.quote_history_data is None:
+                raise ValueError(
+                    "Quote history data is needed to derive {}.".format(name))
+            inputs = [self.get(input_name, start_date) 
+                      for input_name in expression['inputs']]
+            if expression.get('quote_history'):
+                metric = expression['derive'](
+                    *inputs, quote_history_data=self.quote_grid, 
+                    start_date=start_date)
+            else:
+                metric = expression['derive'](*inputs)
+            metric.name = name
+        self._metrics[key] = metric
+
+        return metric
 
 
 # benchmark values and reverse indicators here are for financial strength 
@@ -287,7 +382,6 @@ _financial_strength_metrics_inputs = [
     {
         'name': 'Debt-to-Cash',
         'reverse': True,
-        'derive': derive_debt_to_cash,
         'benchmark': None,
         'type': 'float',
         'scale_factor': 1.0
@@ -295,7 +389,6 @@ _financial_strength_metrics_inputs = [
     {
         'name': 'Equity-to-Asset',
         'reverse': False,
-        'derive': None,
         'benchmark': None,
         'type': 'float',
         'scale_factor': 1.0
@@ -303,7 +396,6 @@ _financial_strength_metrics_inputs = [
     {
         'name': 'Debt-to-Equity',
         'reverse': True,
-        'derive': None,
         'benchmark': 0.09,
         'type': 'float',
         'scale_factor': 1.0
@@ -311,7 +403,6 @@ _financial_strength_metrics_inputs = [
     {
         'name': 'Debt-to-EBITDA',
         'reverse': True,
-        'derive': derive_debt_to_ebitda,
         'benchmark': None,
         'type': 'float',
         'scale_factor': 1.0
@@ -319,7 +410,6 @@ _financial_strength_metrics_inputs = [
     {
         'name': 'Interest Coverage',
         'reverse': False,
-        'derive': None,
         'benchmark': 10.2,
         'type': 'float',
         'scale_factor': 1.0
@@ -327,7 +417,6 @@ _financial_strength_metrics_inputs = [
     {
         'name': 'Altman Z-Score',
         'reverse': False,
-        'derive': None,
         'benchmark': 3.0,
         'type': 'float',
         'scale_factor': 1.0
@@ -335,7 +424,6 @@ _financial_strength_metrics_inputs = [
     {
         'name': 'Shares Outstanding (Diluted Average)',
         'reverse': True,
-        'derive': None,
         'benchmark': None,
         'type': 'float',
         'scale_factor': 1.0
@@ -349,7 +437,6 @@ _growth_metrics_inputs = [
     {
         'name': 'Revenue',
         'reverse': False,
-        'derive': None,
         'benchmark': 0.1398,
         'type': 'percent',
         'scale_factor': 1.0
@@ -357,7 +444,6 @@ _growth_metrics_inputs = [
     {
         'name': 'Operating Income',
         'reverse': False,
-        'derive': None,
         'benchmark': 0.468,
         'type': 'percent',
         'scale_factor': 1.0
@@ -365,7 +451,6 @@ _growth_metrics_inputs = [
     {
         'name': 'Net Income',
         'reverse': False,
-        'derive': None,
         'benchmark': 0.7325,
         'type': 'percent',
         'scale_factor': 1.0
@@ -373,7 +458,6 @@ _growth_metrics_inputs = [
     {
         'name': 'Cash Flow from Operations',
         'reverse': False,
-        'derive': None,
         'benchmark': 0.1813,
         'type': 'percent',
         'scale_factor': 1.0
@@ -386,7 +470,6 @@ _profitability_metrics_inputs = [
         {
             'name': 'Gross Margin %',
             'reverse': False,
-            'derive': None,
             'benchmark': 0.3832,
             'type': 'percent',
             'scale_factor': 1/100
@@ -394,7 +477,6 @@ _profitability_metrics_inputs = [
         {
             'name': 'Operating Margin %',
             'reverse': False,
-            'derive': None,
             'benchmark': 0.1456,
             'type': 'percent',
             'scale_factor': 1/100
@@ -402,7 +484,6 @@ _profitability_metrics_inputs = [
         {
             'name': 'Net Margin %',
             'reverse': False,
-            'derive': None,
             'benchmark': 0.1046,
             'type': 'percent',
             'scale_factor': 1/100
@@ -410,7 +491,6 @@ _profitability_metrics_inputs = [
         {
             'name': 'FCF Margin %',
             'reverse': False,
-            'derive': None,
             'benchmark': 0.1875,
             'type': 'percent',
             'scale_factor': 1/100
@@ -418,7 +498,6 @@ _profitability_metrics_inputs = [
         {
             'name': 'ROE %',
             'reverse': False,
-            'derive': None,
             'benchmark': 0.196,
             'type': 'percent',
             'scale_factor': 1/100
@@ -430,45 +509,35 @@ _profitability_metrics_inputs = [
 _valuation_metrics_inputs = [
         {
             'name': 'PE Ratio',
-            'underlying-metric': 'Earnings per Share (Diluted)',
             'reverse': True,
-            'derive': derive_valuation_ratios,
             'benchmark': None,
             'type': 'float',
             'scale_factor': 1.0
         },
         {
             'name': 'PB Ratio',
-            'underlying-metric': 'Book Value per Share',
             'reverse': True,
-            'derive': derive_valuation_ratios,
             'benchmark': None,
             'type': 'float',
             'scale_factor': 1.0
         },
         {
             'name': 'Price-to-Free-Cash-Flow',
-            'underlying-metric': 'Free Cash Flow per Share',
             'reverse': True,
-            'derive': derive_valuation_ratios,
             'benchmark': None,
             'type': 'float',
             'scale_factor': 1.0
         },
         {
             'name': 'Price-to-Operating-Cash-Flow',
-            'underlying-metric': 'Operating Cash Flow per Share',
             'reverse': True,
-            'derive': derive_valuation_ratios,
             'benchmark': None,
             'type': 'float',
             'scale_factor': 1.0
         },
         {
             'name': 'PS Ratio',
-            'underlying-metric': 'Revenue per Share',
             'reverse': True,
-            'derive': derive_valuation_ratios,
             'benchmark': None,
             'type': 'float',
             'scale_factor': 1.0
@@ -480,7 +549,6 @@ _dividend_metrics_inputs = [
         {
             'name': 'Dividends per Share',
             'reverse': False,
-            'derive': None,
             'benchmark': None,
             'type': 'float',
             'scale_factor': 1.0
@@ -488,7 +556,6 @@ _dividend_metrics_inputs = [
         {
             'name': 'Dividend Payout Ratio',
             'reverse': True,
-            'derive': None,
             'benchmark': None,
             'type': 'float',
             'scale_factor': 1.0
@@ -552,6 +619,129 @@ def _get_average_rating(data_indicators, debug=False):
     return sum_of_ratings / num_of_ratings if num_of_ratings > 0 else None
 
 
+# settings of each category of indicators, in the order of display;
+# 'growth' is True for categories where the indicators are the 3-year growth 
+# rates of the underlying metrics
+_indicator_categories = [
+    {
+        'key': 'financial_strength',
+        'inputs': _financial_strength_metrics_inputs,
+        'growth': False,
+        'round_current': False,
+        'rating_kwargs': {}
+    },
+    {
+        'key': 'growth',
+        'inputs': _growth_metrics_inputs,
+        'growth': True,
+        'round_current': True,
+        'rating_kwargs': {'latest': 'Other'}
+    },
+    {
+        'key': 'profitability',
+        'inputs': _profitability_metrics_inputs,
+        'growth': False,
+        'round_current': True,
+        'rating_kwargs': {}
+    },
+    {
+        'key': 'valuation',
+        'inputs': _valuation_metrics_inputs,
+        'growth': False,
+        'round_current': False,
+        'rating_kwargs': {'trend_threshold_value': None}
+    },
+    {
+        'key': 'dividend',
+        'inputs': _dividend_metrics_inputs,
+        'growth': False,
+        'round_current': True,
+        'rating_kwargs': {}
+    },
+]
+
+
+def _get_indicator_name(item, category):
+    """
+    This helper function returns the name of the indicator for the given 
+    input item of the given category.
+    """
+
+    if category['growth']:
+        return '3-Year {} Growth'.format(item['name'])
+
+    return item['name']
+
+
+# a lookup of all indicators by name, for evaluating indicators one at a time
+indicator_registry = {
+    _get_indicator_name(item, category): (item, category)
+    for category in _indicator_categories for item in category['inputs']
+}
+
+
+def _get_indicator_data(item, category, metric_graph, start_date, debug):
+    """
+    This helper function calculates and returns the data of a single 
+    indicator, given its input item and category.
+    """
+
+    metric = metric_graph.get(name=item['name'], start_date=start_date, 
+                              scale_factor=item['scale_factor'])
+
+    # growth indicators are rated on the growth metric of the underlying 
+    # metric
+    if category['growth']:
+        rated_metric = metric.get_growth_metric()
+        growth_rate = metric.growth_rate(num_of_years=3)
+        current = float("{:.2f}".format(growth_rate)) if growth_rate else None
+    else:
+        rated_metric = metric
+        current = float("{:.2f}".format(metric.TTM_value)) \
+            if category['round_current'] else metric.TTM_value
+
+    return {
+        'Object': metric,
+        'Current': current,
+        'Type': item['type'],
+        'Rating': rated_metric.rating(benchmark_value=item['benchmark'], 
+                                      reverse=item['reverse'],
+                                      debug=debug,
+                                      **category['rating_kwargs'])
+    }
+
+
+def get_fundamental_indicator(name, financials_history=None, 
+                              quote_history_data=None, 
+                              start_date=datetime(1900, 1, 1), debug=False, 
+                              metric_graph=None):
+    """
+    This function calculates and returns the data of a single fundamental 
+    indicator, given the name of the indicator. Only metrics needed for this 
+    indicator will be computed.
+
+    It returns None if there is no indicator of the given name.
+
+    Inputs:
+        'name': name of the indicator, such as 'ROE %', or '3-Year Revenue 
+                Growth'.
+        Other inputs are the same as those of get_fundamental_indicators.
+    """
+
+    if name not in indicator_registry:
+        return None
+
+    if metric_graph is None:
+        metric_graph = MetricGraph(financials_history=financials_history, 
+                                   quote_history_data=quote_history_data)
+
+    item, category = indicator_registry[name]
+
+    return _get_indicator_data(item=item, category=category, 
+                               metric_graph=metric_graph, 
+                               start_date=start_date, debug=debug)
+
+
 def get_fundamental_indicators(financials_history, 
                                quote_history_data,
                                start_date=datetime(1900, 1, 1),
@@ -560,7 +750,8 @@ def get_fundamental_indicators(financials_history,
                                profitability_name='Profitability',
                                valuation_name='Stock Valuation',
                                dividend_name='Dividend Growth',
-                               debug=False):
+                               debug=False,
+                               metric_graph=None):
     """
     This function gets raw data from the input financials history data after a 
     pre-specified start date,creates and returns a dictionary of indicators 
@@ -572,148 +763,39 @@ def get_fundamental_indicators(financials_history,
         'start_date': the early date since when data in the input financials
                       history will be considered - a Python's datetime object;
                       defaulted to be datetime(1900, 1, 1)
+        'metric_graph': a MetricGraph object, defaulted to None. When given, 
+                        metrics will be taken from this graph (and memoized 
+                        there) instead of a new graph built from the input 
+                        financials history and quote history data.
     """
 
-    data_indicators = {}
+    # build a metric graph for the input data if one is not given
+    if metric_graph is None:
+        metric_graph = MetricGraph(financials_history=financials_history, 
+                                   quote_history_data=quote_history_data)
+
+    # names of categories of indicators
+    category_names = {
+        'financial_strength': financial_strength_name,
+        'growth': growth_name,
+        'profitability': profitability_name,
+        'valuation': valuation_name,
+        'dividend': dividend_name
+    }
 
-    ######################
-    # Financial strength #
-    ######################
-
-    data_indicators[financial_strength_name] = {}
-    for item in _financial_strength_metrics_inputs:
-        name = item['name']
-        metric = get_metric(name=name, 
-                            financials_history=financials_history, 
-                            start_date=start_date,
-                            scale_factor=item['scale_factor'],
-                            derive=item['derive'])
-        data_indicators[financial_strength_name][name] = \
-            {
-                'Object': metric,
-                'Current': metric.TTM_value,
-                'Type': item['type'],
-                'Rating': metric.rating(benchmark_value=item['benchmark'], 
-                                        reverse=item['reverse'],
-                                        debug=debug)
-            }
-    
-    # get the average rating
-    data_indicators[financial_strength_name]['Average Rating'] = \
-        _get_average_rating(
-            data_indicators[financial_strength_name], debug=debug)
-
-    ############
-    #  Growth  #
-    ############
-
-    data_indicators[growth_name] = {}
-    for item in _growth_metrics_inputs:
-        name = item['name']
-        metric = get_metric(name=name, 
-                            financials_history=financials_history, 
-                            start_date=start_date,
-                            scale_factor=item['scale_factor'],
-                            derive=item['derive'])
-        growth_metric = metric.get_growth_metric()
-        data_indicators[growth_name][growth_metric.name] = \
-            {
-                'Object': metric,
-                'Current': float("{:.2f}".format(
-                    metric.growth_rate(num_of_years=3))) \
-                        if metric.growth_rate(num_of_years=3) else None,
-                'Type': item['type'],
-                'Rating': growth_metric.rating(
-                    benchmark_value=item['benchmark'], reverse=item['reverse'], 
-                    debug=debug, latest='Other')
-            }
-
-    # get the average rating
-    data_indicators[growth_name]['Average Rating'] = \
-        _get_average_rating(
-            data_indicators[growth_name], debug=debug)
-
-    #################
-    # Profitability #
-    #################
-
-    data_indicators[profitability_name] = {}
-    for item in _profitability_metrics_inputs:
-        name = item['name']
-        metric = get_metric(name=name, 
-                            financials_history=financials_history, 
-                            start_date=start_date,
-                            scale_factor=item['scale_factor'],
-                            derive=item['derive'])
-        data_indicators[profitability_name][name] = \
-            {
-                'Object': metric,
-                'Current': float("{:.2f}".format(metric.TTM_value)),
-                'Type': item['type'],
-                'Rating': metric.rating(benchmark_value=item['benchmark'], 
-                                        reverse=item['reverse'],
-                                        debug=debug)
-            }
-    # get the average rating
-    data_indicators[profitability_name]['Average Rating'] = \
-        _get_average_rating(
-            data_indicators[profitability_name], debug=debug)
-
-    ################
-    #   Valuation  #
-    # ##############
-
-    data_indicators[valuation_name] = {}
-    for item in _valuation_metrics_inputs:
-        name = item['name']
-        metric = get_metric(name=name, 
-                            underlying_metric_name=item['underlying-metric'],
-                            financials_history=financials_history, 
-                            quote_history_data=quote_history_data,
-                            start_date=start_date,
-                            scale_factor=item['scale_factor'],
-                            derive=item['derive'])
-        data_indicators[valuation_name][name] = \
-            {
-                'Object': metric,
-                'Current': metric.TTM_value,
-                'Type': item['type'],
-                'Rating': metric.rating(benchmark_value=item['benchmark'], 
-                                        reverse=item['reverse'],
-                                        debug=debug,
-                                        trend_threshold_value=None)
-            }
-    
-    # get the average rating
-    data_indicators[valuation_name]['Average Rating'] = \
-        _get_average_rating(
-            data_indicators[valuation_name], debug=debug) 
-
-    ###################
-    # Dividend Growth #
-    ###################
-
-    data_indicators[dividend_name] = {}
-    for item in _dividend_metrics_inputs:
-        name = item['name']
-        metric = get_metric(name=name, 
-                            financials_history=financials_history, 
-                            start_date=start_date,
-                            scale_factor=item['scale_factor'],
-                            derive=item['derive'])
-        data_indicators[dividend_name][name] = \
-            {
-                'Object': metric,
-                'Current': float("{:.2f}".format(metric.TTM_value)),
-                'Type': item['type'],
-                'Rating': metric.rating(benchmark_value=item['benchmark'], 
-                                        reverse=item['reverse'],
-                                        debug=debug)
-            }
-    # get the average rating
-    data_indicators[dividend_name]['Average Rating'] = \
-        _get_average_rating(
-            data_indicators[dividend_name], debug=debug)
+    data_indicators = {}
+    for category in _indicator_categories:
+        category_name = category_names[category['key']]
+        data_indicators[category_name] = {}
+        for item in category['inputs']:
+            data_indicators[category_name][
+                _get_indicator_name(item, category)] = _get_indicator_data(
+                    item=item, category=category, metric_graph=metric_graph, 
+                    start_date=start_date, debug=debug)
+
+        # get the average rating
+        data_indicators[category_name]['Average Rating'] = \
+            _get_average_rating(data_indicators[category_name], debug=debug)
 
     # return the constructed dictionary
     return data_indicators
@@ -0,0 +1,173 @@
+import io
+import numpy as np
+from app.metrics import parse_fiscal_periods
+
+
+def _to_float_rows(rows):
+    """
+    This helper function converts a list of rows of raw values (usually
+    strings) to a 2-D float numpy array, where values that can't be converted
+    become NaNs.
+    """
+
+    # try converting all rows at once, which works for clean payloads
+    try:
+        return np.array(rows, dtype=float)
+    except (TypeError, ValueError):
+        pass
+
+    # otherwise convert row by row, and value by value for rows that need it
+    array = np.empty((len(rows), len(rows[0]) if rows else 0), dtype=float)
+    for i, row in enumerate(rows):
+        try:
+            array[i] = np.array(row, dtype=float)
+        except (TypeError, ValueError):
+            for j, value in enumerate(row):
+                try:
+                    array[i, j] = float(value)
+                except (TypeError, ValueError):
+                    array[i, j] = np.nan
+
+    return array
+
+
+class FundamentalsFrame(object):
+    """
+    This class implements a 2-D, aligned store of all annual metrics of a
+    stock, built once from its financials history payload.
+
+    Values are kept in a (fiscal period x metric) float64 matrix, with one
+    column per (section, metric name), and TTM values are kept separately.
+    Values that can't be converted to numbers are saved as NaNs.
+
+    Columns are stored contiguously, so metrics built from a column are views
+    of the matrix rather than copies.
+    """
+
+    def __init__(self, fiscal_years, keys, values, ttm_values, has_ttm):
+        """
+        Constructor.
+
+        Inputs:
+            'fiscal_years': a sequence of fiscal period strings, in the format
+                            of '%Y-%m', excluding 'TTM'.
+            'keys': a sequence of (section, metric name) tuples, one for each
+                    column of the input values.
+            'values': a 2-D float numpy array of the shape (# of fiscal
+                      periods, # of keys).
+            'ttm_values': a 1-D float numpy array of the TTM values, one for
+                          each key.
+            'has_ttm': a boolean value, True if the source payload included
+                       TTM values.
+        """
+
+        self.fiscal_years = tuple(fiscal_years)
+        self.fiscal_periods = parse_fiscal_periods(self.fiscal_years)
+        self.keys = [tuple(key) for key in keys]
+        self.columns = {key: j for j, key in enumerate(self.keys)}
+        self.values = np.asfortranarray(values, dtype=float)
+        self.ttm_values = np.asarray(ttm_values, dtype=float)
+        self.has_ttm = bool(has_ttm)
+
+        # the frame is shared by all metrics built from it
+        self.values.setflags(write=False)
+        self.ttm_values.setflags(write=False)
+
+    @classmethod
+    def from_payload(cls, financials_history, type='annuals'):
+        """
+        This method builds a frame from a financials history payload, which
+        for now is the payload returned by the GuruFocus API.
+
+        Inputs:
+            'financials_history': the financials history payload.
+            'type': a string object, defaulted to be 'annuals'.
+        """
+
+        data = financials_history['financials'][type]
+        fiscal_years = data['Fiscal Year']
+        fiscal_periods = parse_fiscal_periods(fiscal_years)
+
+        # collect all fields with one value per fiscal period
+        keys = []
+        rows = []
+        for section in data:
+            if not isinstance(data[section], dict):
+                continue
+            for name, values in data[section].items():
+                if isinstance(values, list) and \
+                    len(values) == len(fiscal_years):
+                    keys.append((section, name))
+                    rows.append(values)
+
+        # convert all values at once, and split out the TTM values
+        array = _to_float_rows(rows).reshape((len(rows), len(fiscal_years)))
+        values = array[:, fiscal_periods.positions].T
+        if fiscal_periods.ttm_position is not None:
+            ttm_values = array[:, fiscal_periods.ttm_position]
+        else:
+            ttm_values = np.full(len(keys), np.nan)
+
+        return cls(
+            fiscal_years=[fiscal_years[i] for i in fiscal_periods.positions],
+            keys=keys, values=values, ttm_values=ttm_values,
+            has_ttm=fiscal_periods.ttm_position is not None)
+
+    def has(self, section, name):
+        """
+        This method checks if the frame has a column for the given metric.
+        """
+
+        return (section, name) in self.columns
+
+    def column(self, section, name):
+        """
+        This method returns the values of the given metric for all fiscal
+        periods, as a read-only view of the frame.
+        """
+
+        return self.values[:, self.columns[(section, name)]]
+
+    def ttm_value(self, section, name):
+        """
+        This method returns the TTM value of the given metric, which is None
+        if the source payload had no TTM values.
+        """
+
+        if not self.has_ttm:
+            return None
+
+        return float(self.ttm_values[self.columns[(section, name)]])
+
+    def to_bytes(self):
+        """
+        This method serializes the frame into compact (compressed) bytes, e.g.
+        for caching.
+        """
+
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            fiscal_years=np.array(self.fiscal_years, dtype=str),
+            sections=np.array([key[0] for key in self.keys], dtype=str),
+            names=np.array([key[1] for key in self.keys], dtype=str),
+            values=np.ascontiguousarray(self.values),
+            ttm_values=self.ttm_values,
+            has_ttm=np.array(self.has_ttm))
+
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        This method deserializes a frame from bytes created by to_bytes.
+        """
+
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            return cls(
+                fiscal_years=arrays['fiscal_years'].tolist(),
+                keys=zip(arrays['sections'].tolist(),
+                         arrays['names'].tolist()),
+                values=arrays['values'],
+                ttm_values=arrays['ttm_values'],
+                has_ttm=arrays['has_ttm'].item())
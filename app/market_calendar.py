@@ -0,0 +1,247 @@
+import pytz
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+from dateutil.easter import easter
+from flask import current_app
+
+
+def _get_nth_weekday(year, month, weekday, n):
+    """
+    This helper function returns the date of the n-th given weekday (0 for
+    Monday) of a month, or the last one if n is -1.
+    """
+
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 +
+                                 7 * (n - 1))
+
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _get_observed_date(day):
+    """
+    This helper function returns the date a holiday is observed on, which is
+    the previous Friday for Saturdays, and the next Monday for Sundays.
+    """
+
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def get_nyse_holidays(year):
+    """
+    This function returns a tuple of two sets of dates for the given year,
+    (<holidays>, <early closes>), following the rules of the New York Stock
+    Exchange (also followed by Nasdaq).
+    """
+
+    holidays = {
+        _get_nth_weekday(year, 1, 0, 3),    # Martin Luther King Jr. Day
+        _get_nth_weekday(year, 2, 0, 3),    # Washington's Birthday
+        easter(year) - timedelta(days=2),   # Good Friday
+        _get_nth_weekday(year, 5, 0, -1),   # Memorial Day
+        _get_observed_date(date(year, 7, 4)),   # Independence Day
+        _get_nth_weekday(year, 9, 0, 1),    # Labor Day
+        _get_nth_weekday(year, 11, 3, 4),   # Thanksgiving Day
+        _get_observed_date(date(year, 12, 25))  # Christmas Day
+    }
+
+    # New Year's Day is not observed on the previous Friday, which would
+    # close the last trading day of the previous year
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(_get_observed_date(date(year, 1, 1)))
+
+    # Juneteenth National Independence Day is observed since 2022
+    if year >= 2022:
+        holidays.add(_get_observed_date(date(year, 6, 19)))
+
+    # the market closes early on the day before Independence Day, the day
+    # after Thanksgiving Day, and Christmas Eve, for weekdays not closed
+    early_closes = {day for day in [
+        date(year, 7, 3),
+        _get_nth_weekday(year, 11, 3, 4) + timedelta(days=1),
+        date(year, 12, 24)] if day.weekday() < 5 and day not in holidays}
+
+    return holidays, early_closes
+
+
+# rules of holidays and early closes by name, see MARKET_CALENDARS in config
+holiday_rules = {'nyse': get_nyse_holidays}
+
+
+class MarketCalendar(object):
+    """
+    This class implements the trading calendar of an exchange, including
+    regular sessions, holidays and early closes, to tell when prices can
+    change, so that data is not refreshed while the market is closed.
+
+    All times taken and returned are naive datetime objects in UTC, like
+    datetime.utcnow().
+    """
+
+    def __init__(self, timezone, open, close, early_close=None,
+                 holiday_rules=None, closures=(), settle_minutes=15):
+        """
+        This method initializes the calendar.
+
+        Inputs:
+            'timezone': name of the timezone of the exchange, such as
+                        'America/New_York'.
+            'open': a string of the format '%H:%M', the local time of opening.
+            'close': a string of the format '%H:%M', the local time of
+                     closing.
+            'early_close': a string of the format '%H:%M', the local time of
+                           closing on days of early closes. Defaulted to None.
+            'holiday_rules': name of the rules of holidays and early closes,
+                             see holiday_rules. Defaulted to None, for no
+                             holidays.
+            'closures': a sequence of strings of the format '%Y-%m-%d', dates
+                        of unscheduled closures, such as national days of
+                        mourning.
+            'settle_minutes': number of minutes after closing during which
+                              prices may still change, such as with closing
+                              auctions. Defaulted to 15.
+        """
+
+        self.timezone = pytz.timezone(timezone)
+        self.open = datetime.strptime(open, '%H:%M').time()
+        self.close = datetime.strptime(close, '%H:%M').time()
+        self.early_close = datetime.strptime(early_close, '%H:%M').time() \
+            if early_close else self.close
+        self.holiday_rules = holiday_rules
+        self.closures = {datetime.strptime(day, '%Y-%m-%d').date()
+                         for day in closures}
+        self.settle = timedelta(minutes=settle_minutes)
+
+    @lru_cache(maxsize=16)
+    def _get_holidays(self, year):
+        """
+        This method returns the holidays and early closes of the given year,
+        see get_nyse_holidays.
+        """
+
+        if self.holiday_rules is None:
+            return set(), set()
+
+        return holiday_rules[self.holiday_rules](year)
+
+    def _to_utc(self, day, local_time):
+        """
+        This method converts a local time of the exchange on the given date
+        to a naive datetime object in UTC.
+        """
+
+        local = self.timezone.localize(datetime.combine(day, local_time))
+        return local.astimezone(pytz.utc).replace(tzinfo=None)
+
+    def get_session(self, day):
+        """
+        This method returns the session of the given local date as a tuple of
+        (<open>, <close>), where the close includes the settling time after
+        closing, or None if the market is closed on that day.
+        """
+
+        holidays, early_closes = self._get_holidays(day.year)
+        if day.weekday() >= 5 or day in holidays or day in self.closures:
+            return None
+
+        close = self.early_close if day in early_closes else self.close
+        return (self._to_utc(day, self.open),
+                self._to_utc(day, close) + self.settle)
+
+    def _get_local_date(self, t):
+        """
+        This method returns the local date of the exchange at the given time.
+        """
+
+        return pytz.utc.localize(t).astimezone(self.timezone).date()
+
+    def is_open(self, t):
+        """
+        This method returns True if prices can change at the given time.
+        """
+
+        session = self.get_session(self._get_local_date(t))
+        return session is not None and session[0] <= t < session[1]
+
+    def get_next_open(self, t):
+        """
+        This method returns the time of the next opening of the market after
+        the given time, or the given time itself if the market is open.
+        """
+
+        day = self._get_local_date(t)
+        while True:
+            session = self.get_session(day)
+            if session is not None and t < session[1]:
+                return max(t, session[0])
+            day += timedelta(days=1)
+
+    def get_last_close(self, t):
+        """
+        This method returns the time of the last closing (including the
+        settling time) of the market at or before the given time.
+        """
+
+        day = self._get_local_date(t)
+        while True:
+            session = self.get_session(day)
+            if session is not None and session[1] <= t:
+                return session[1]
+            day -= timedelta(days=1)
+
+    def get_next_refresh_time(self, last_update, interval):
+        """
+        This method returns the earliest time data last updated at the given
+        time should be refreshed, which is one interval after the update if
+        the market is open then, or if the market has traded since the update
+        (for one last refresh after closing); otherwise it is deferred to the
+        next opening of the market.
+
+        Inputs:
+            'last_update': a naive datetime object in UTC, the time of the
+                           last update.
+            'interval': a timedelta object, the minimal interval between two
+                        refreshes.
+        """
+
+        t = last_update + interval
+        if self.is_open(t) or last_update < self.get_last_close(t):
+            return t
+
+        return self.get_next_open(t)
+
+    def is_refresh_due(self, last_update, interval, now=None):
+        """
+        This method returns True if data last updated at the given time should
+        be refreshed now (see get_next_refresh_time), or if it has never been
+        updated (when 'last_update' is None).
+        """
+
+        if last_update is None:
+            return True
+
+        now = datetime.utcnow() if now is None else now
+        return now >= self.get_next_refresh_time(last_update, interval)
+
+
+_market_calendars = {}
+
+
+def get_market_calendar(exchange=None):
+    """
+    This function returns the MarketCalendar of the given exchange, as
+    configured in MARKET_CALENDARS, defaulted to MARKET_CALENDAR_DEFAULT.
+    """
+
+    exchange = exchange or current_app.config['MARKET_CALENDAR_DEFAULT']
+    if exchange not in _market_calendars:
+        _market_calendars[exchange] = MarketCalendar(
+            **current_app.config['MARKET_CALENDARS'][exchange])
+
+    return _market_calendars[exchange]
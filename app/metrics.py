@@ -1,6 +1,9 @@
 import numpy as np
 import statistics
+from collections import namedtuple
 from datetime import datetime
+from functools import lru_cache
+from itertools import compress
 from numpy.lib.function_base import median
 from sklearn.linear_model import LinearRegression
 
@@ -69,6 +72,103 @@ def get_growth_rate(x, values_in_range, num_of_years, log_scale):
         return None
 
 
+# the parsed index of a sequence of fiscal periods, shared by all metrics 
+# built from the same sequence of timestamp strings
+FiscalPeriods = namedtuple(
+    'FiscalPeriods', 
+    ['timestamps', 'months', 'positions', 'ttm_position', 'length'])
+
+
+@lru_cache(maxsize=256)
+def _parse_fiscal_periods(timestamps, timestamps_format):
+    """
+    This helper function does the actual parsing for parse_fiscal_periods, and 
+    is cached by the (hashable) tuple of input timestamp strings.
+    """
+
+    # locate the 'TTM' entries, which are not actual dates
+    positions = np.array([i for i, timestamp in enumerate(timestamps) 
+                          if timestamp != 'TTM'], dtype=np.int64)
+    ttm_positions = [i for i, timestamp in enumerate(timestamps) 
+                     if timestamp == 'TTM']
+    ttm_position = ttm_positions[-1] if ttm_positions else None
+    dates = [timestamps[i] for i in positions]
+
+    # convert the strings in one vectorized pass for the formats used by the 
+    # data providers, and fall back to strptime for anything else
+    try:
+        if timestamps_format == '%Y-%m':
+            months = np.array(dates, dtype='datetime64[M]')
+        elif timestamps_format == '%Y%m':
+            months = np.array([date[:4] + '-' + date[4:] for date in dates], 
+                              dtype='datetime64[M]')
+        else:
+            raise ValueError("Unsupported format for vectorized parsing.")
+    except ValueError:
+        months = np.array(
+            [datetime.strptime(date, timestamps_format) for date in dates], 
+            dtype='datetime64[M]')
+
+    # the parsed index is shared, so make sure it can't be modified in place
+    months.setflags(write=False)
+    positions.setflags(write=False)
+    parsed_timestamps = tuple(months.astype('datetime64[us]').astype(object))
+
+    return FiscalPeriods(timestamps=parsed_timestamps, months=months, 
+                         positions=positions, ttm_position=ttm_position, 
+                         length=len(timestamps))
+
+
+def parse_fiscal_periods(timestamps, timestamps_format='%Y-%m'):
+    """
+    This function parses a sequence of fiscal period strings, such as the 
+    'Fiscal Year' list from the GuruFocus financials payload, and returns a 
+    FiscalPeriods object.
+
+    Results are cached, so metrics built from the same sequence of timestamps 
+    share the same parsed index instead of parsing the strings again.
+
+    Inputs:
+        'timestamps': a sequence of strings in the format given by 
+                      'timestamps_format'; entries equal to 'TTM' are excluded 
+                      from the parsed dates, and the position of the last one 
+                      is saved as 'ttm_position'.
+        'timestamps_format': a string defaulted to '%Y-%m'.
+    """
+
+    return _parse_fiscal_periods(tuple(timestamps), timestamps_format)
+
+
+def to_numeric(values, scale_factor=1.0, str_defaulted_to=0):
+    """
+    This function converts the input values to float values multiplied by the 
+    given scale factor, and defaults values that can't be converted to the 
+    given default value.
+
+    If the input values are already a float numpy array, where NaNs mark 
+    values that could not be converted (such as a column of a 
+    FundamentalsFrame), the conversion is vectorized, and the input array is 
+    returned as is when no changes are needed.
+    """
+
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        missing = np.isnan(values)
+        if scale_factor == 1.0 and not missing.any():
+            return values
+        return np.where(missing, str_defaulted_to, values * scale_factor)
+
+    # TODO - occasionally a value could be None if the input values are 
+    # from analyst estimates (Guru). Defaulting those values to 0 for now.
+    _values = []
+    for value in values:
+        try:
+            _values.append(float(value) * scale_factor)
+        except:
+            _values.append(str_defaulted_to)
+
+    return _values
+
+
 class Metric(object):
     """
     This class implements metrics from financial reports.
@@ -84,7 +184,8 @@ class Metric(object):
             - "name": name of the metric.
             - "timestamps": a list (or list-like) of strings in the format 
                             specified by the other input 
-                            'input_timestamps_format'
+                            'input_timestamps_format', or a FiscalPeriods 
+                            object of already parsed timestamps
             - "values": a sequence of values (could be strings) of the metric,
                         with each value corresponding to the timestamp of the 
                         same position in the input sequence of timestamps
@@ -104,53 +205,117 @@ class Metric(object):
                               when converted to numeric values.
         """
 
+        # get the shared, parsed index of the input timestamps, if they are 
+        # strings of the given format or an already parsed index
+        if isinstance(timestamps, FiscalPeriods):
+            self.fiscal_periods = timestamps
+        elif input_timestamps_format is not None:
+            self.fiscal_periods = parse_fiscal_periods(
+                timestamps, input_timestamps_format)
+        else:
+            self.fiscal_periods = None
+
         # raise an error if the length of input timestamps is different from 
         # that of the input values
-        if len(timestamps) != len(values):
+        num_of_timestamps = self.fiscal_periods.length \
+            if self.fiscal_periods is not None else len(timestamps)
+        if num_of_timestamps != len(values):
             raise ValueError("The lengths of input timestamps and values must" 
                              "be equal.")
 
         # if requested, ensure all values are converted to numeric values 
         # (float)
-        # TODO - occasionally a value could be None if the input values are 
-        # from analyst estimates (Guru). Defaulting those values to 0 for now.
         if convert_to_numeric:
-            _values = []
-            for value in values:
-                try:
-                    _values.append(float(value) * scale_factor)
-                except:
-                    _values.append(str_defaulted_to)
+            _values = to_numeric(values, scale_factor=scale_factor, 
+                                 str_defaulted_to=str_defaulted_to)
         else:
             _values = values
 
         # save the input data as a dictionary of "<timestamp>: <value>";
         # save the input "value" corresponding to the timestamp "TTM" 
         # separately
-        self.data = {}
-        for i in range(len(timestamps)):
-            if timestamps[i] != 'TTM':
-                # if an input timestamp format is given, assume the input 
-                # "timestamps" are strings - convert them to python timestamps;
-                if input_timestamps_format is not None:
-                    timestamp = datetime.strptime(timestamps[i], 
-                                                  input_timestamps_format)
-                # otherwise assume the input "timestamps" are already python 
-                # timestamps, so get the value in the input timestamp list 
-                # directly in that case
+        self._array = None
+        if self.fiscal_periods is not None:
+            is_after_start_date = \
+                self.fiscal_periods.months > np.datetime64(start_date, 'us')
+            positions = self.fiscal_periods.positions[is_after_start_date]
+            if isinstance(_values, np.ndarray):
+                # keep a view of the input array when the selected positions 
+                # are contiguous, which is the usual case
+                if len(positions) > 0 and \
+                    positions[-1] - positions[0] + 1 == len(positions):
+                    self._array = _values[positions[0]:(positions[-1] + 1)]
                 else:
-                    timestamp = timestamps[i]
-
-                if timestamp > start_date:
-                    self.data[timestamp] = _values[i]
+                    self._array = _values[positions]
+                values_selected = self._array.tolist()
             else:
-                self.TTM_value = _values[i]
+                values_selected = [_values[i] for i in positions]
+            self.data = dict(zip(
+                compress(self.fiscal_periods.timestamps, is_after_start_date), 
+                values_selected))
+            if self.fiscal_periods.ttm_position is not None:
+                self.TTM_value = _values[self.fiscal_periods.ttm_position]
+        else:
+            # otherwise assume the input "timestamps" are already python 
+            # timestamps, so get the value in the input timestamp list 
+            # directly in that case
+            self.data = {}
+            for i in range(len(timestamps)):
+                if timestamps[i] != 'TTM':
+                    if timestamps[i] > start_date:
+                        self.data[timestamps[i]] = _values[i]
+                else:
+                    self.TTM_value = _values[i]
 
         # save other needed attributes
         self.name = name
         self.timestamps = tuple(self.data.keys())
         self.values = tuple(self.data.values())
 
+    @property
+    def array(self):
+        """
+        This method returns the values of the metric in a float numpy array. 
+        
+        For metrics built from a float array, such as a column of a 
+        FundamentalsFrame, it's a view of the input array.
+        """
+
+        if self._array is None or len(self._array) != len(self.values):
+            self._array = np.array(self.values, dtype=float)
+
+        return self._array
+
+    def since(self, start_date, metric_class=None):
+        """
+        This method returns a new metric holding only the records of the
+        current metric after the given start date. The TTM value, if any, is
+        kept as is.
+
+        Inputs:
+            'start_date': a Python datetime object.
+            'metric_class': the class of the new metric, defaulted to None.
+                            When None, the new metric will be a Metric.
+        """
+
+        metric = (metric_class or Metric)(
+            name=self.name, timestamps=self.timestamps, values=self.values,
+            start_date=start_date, input_timestamps_format=None,
+            convert_to_numeric=False)
+        metric.fiscal_periods = self.fiscal_periods
+
+        # keep a view of the values of the current metric, when the records
+        # kept are the latest ones
+        offset = len(self.timestamps) - len(metric.timestamps)
+        if self._array is not None and \
+            metric.timestamps == self.timestamps[offset:]:
+            metric._array = self._array[offset:]
+
+        if hasattr(self, 'TTM_value'):
+            metric.TTM_value = self.TTM_value
+
+        return metric
+
     def get_timestamps_str(self, timestamps_format='%Y-%m'):
         """
         This method returns the saved timestamps in the string format.
@@ -169,13 +334,13 @@ class Metric(object):
                              "must be identical.")
         else:
             name_sum = '{} + {}'.format(self.name, other.name)
-            timestamps_sum = self.get_timestamps_str()
             values_sum = list(
                 np.array(self.values) + np.array(other.values))
             summation = Metric(name=name_sum, 
-                               timestamps=timestamps_sum,
+                               timestamps=self.timestamps,
                                values=values_sum,
-                               start_date=datetime(1900, 1, 1))
+                               start_date=datetime(1900, 1, 1),
+                               input_timestamps_format=None)
             summation.TTM_value = self.TTM_value + other.TTM_value
 
             return summation
@@ -190,16 +355,16 @@ class Metric(object):
                              "must be identical.")
         else:
             name_division = '{} / {}'.format(self.name, other.name)
-            timestamps_division = self.get_timestamps_str()
             a = np.array(self.values)
             b = np.array(other.values)
             values_division = list(
                 np.divide(a, b, out=np.zeros_like(a, dtype=float), where=(b!=0))
                 )
             division = Metric(name=name_division, 
-                              timestamps=timestamps_division,
+                              timestamps=self.timestamps,
                               values=values_division,
-                              start_date=datetime(1900, 1, 1))
+                              start_date=datetime(1900, 1, 1),
+                              input_timestamps_format=None)
             
             # calculate the TTM value of the division, and assign a None value 
             # if the denominator is zero
@@ -283,11 +448,10 @@ class Metric(object):
 
         # creates and returns the new metric
         name = str(num_of_years) + '-Year ' + self.name + ' Growth'
-        timestamps = [
-            timestamp.strftime('%Y-%m') for timestamp in self.timestamps]
         start_date = datetime(1900, 1, 1)
-        metric = Metric(name=name, timestamps=timestamps, 
-                        values=values_growth_rate, start_date=start_date)
+        metric = Metric(name=name, timestamps=self.timestamps, 
+                        values=values_growth_rate, start_date=start_date, 
+                        input_timestamps_format=None)
         metric.TTM_value = metric.values[-1]
         return metric
 
@@ -3,7 +3,8 @@ import jwt
 import json
 import rq
 import redis
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import partial
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import current_app, url_for
 from flask_login import UserMixin
@@ -13,8 +14,15 @@ from app import db, login
 from app.search import query_index, add_to_index, remove_from_index
 from app.stocksdata import get_quote, get_quote_history, \
                            get_financials_history, get_analyst_estimates, \
-                           get_quote_details
-from app.fundamental_analysis import get_fundamental_indicators
+                           get_quote_details, get_company_profile
+from app.fundamental_analysis import get_fundamental_indicators, \
+    get_fundamental_indicator, MetricGraph
+from app.fundamentals_frame import FundamentalsFrame
+from app.metrics import parse_fiscal_periods
+from app.valuation import DataSpans, get_max_years_overlap
+from app.fetching import fetch_concurrently
+from app.market_calendar import get_market_calendar
+from app.circuit_breakers import ProviderUnavailableError
 
 
 class SearchableMixin(object):
@@ -121,6 +129,13 @@ class Stock(db.Model):
     quote_details_paylod = db.Column(db.Text)
     last_quote_details_update = db.Column(db.DateTime, index=True, default=None)
     dividend_yield = db.Column(db.Float, index=True)
+    first_fiscal_period = db.Column(db.DateTime, index=True, default=None)
+    last_fiscal_period = db.Column(db.DateTime, index=True, default=None)
+    last_quarterly_fiscal_period = db.Column(db.DateTime, index=True, 
+                                             default=None)
+    first_quote_date = db.Column(db.DateTime, index=True, default=None)
+    last_quote_date = db.Column(db.DateTime, index=True, default=None)
+    max_years_overlap = db.Column(db.Integer, index=True, default=None)
     stock_notes = db.relationship(
         'StockNote', foreign_keys='StockNote.stock_id', backref='stock', 
         lazy='dynamic')
@@ -139,13 +154,132 @@ class Stock(db.Model):
                      value is 60.
         """
 
-        # only update the quote if it's been more than the number of 'delay' 
-        # seconds since the last update
-        now = time()
-        if not self.last_quote_update or \
-            (now - self.last_quote_update) > delay:
-            self.quote_payload = json.dumps(get_quote(self.symbol))
-            self.last_quote_update = time()
+        if self._is_quote_due(delay=delay):
+            self._save_quote(get_quote(self.symbol))
+
+    @classmethod
+    def update_quotes(cls, stocks, delay=60):
+        """
+        This class method gets the latest quotes for all input stocks in bulk, 
+        with quotes of stocks due (see update_quote) fetched concurrently, and 
+        all of them saved with a single commit. 
+
+        Quotes that fail or miss their deadline are left as they are.
+
+        Input:
+            - stocks: a sequence of Stock objects.
+            - delay: number of seconds within which a quote will not be 
+                     updated. The default value is 60.
+        """
+
+        stocks_due = {stock.symbol: stock for stock in stocks 
+                      if stock._is_quote_due(delay=delay)}
+        if not stocks_due:
+            return
+
+        # the Finnhub API has no batch endpoint for quotes, so quotes are 
+        # fetched by symbol concurrently
+        deadline = current_app.config['FETCH_DEADLINE_SECONDS'].get(
+            'quote', current_app.config['FETCH_DEADLINE_SECONDS_DEFAULT'])
+        results, errors = fetch_concurrently(
+            {symbol: partial(get_quote, symbol) for symbol in stocks_due}, 
+            deadline_seconds={symbol: deadline for symbol in stocks_due})
+
+        # the quotes are flushed as a single batch of updates of the same 
+        # columns, in one transaction
+        for symbol, data in results.items():
+            stocks_due[symbol]._save_quote(data)
+        db.session.commit()
+
+        for symbol in errors:
+            current_app.logger.warning(
+                'Unable to refresh quote of {}: {!r}'.format(
+                    symbol, errors[symbol]))
+
+    def _is_quote_due(self, delay=60):
+        """
+        This method returns True if the quote should be updated, which is 
+        when it's been more than the number of 'delay' seconds since the last 
+        update, and the market has been open since then (see 
+        MarketCalendar.get_next_refresh_time).
+        """
+
+        if 'quote' in self._get_deferred_refreshes():
+            return False
+
+        return not self.last_quote_update or \
+            get_market_calendar().is_refresh_due(
+                datetime.utcfromtimestamp(self.last_quote_update), 
+                timedelta(seconds=delay))
+
+    def _save_quote(self, data, timestamp=None):
+        """
+        This method saves the fetched quote data, with the time of the quote 
+        in epoch seconds defaulted to now.
+        """
+
+        self.quote_payload = json.dumps(data)
+        self.last_quote_update = time() if timestamp is None else timestamp
+
+    @classmethod
+    def save_quotes(cls, quotes):
+        """
+        This class method saves the input quotes of stocks in bulk, with a 
+        single commit; quotes older than those saved are skipped.
+
+        Input:
+            - quotes: a dictionary of "<symbol>: (<quote>, <time of the quote 
+                      in epoch seconds>)".
+        """
+
+        if not quotes:
+            return
+
+        for stock in cls.query.filter(cls.symbol.in_(list(quotes))).all():
+            data, timestamp = quotes[stock.symbol]
+            if not stock.last_quote_update or \
+                stock.last_quote_update < timestamp:
+                stock._save_quote(data, timestamp=timestamp)
+        db.session.commit()
+
+    def refresh_financials_history(self, update_interval_days=30):
+        """
+        This method fetches for newer data of stock financials and saves it in 
+        the app database, if the time lapse since the last update has already 
+        exceeded the given update interval (in days).
+        """
+
+        if self._is_financials_history_due(
+                update_interval_days=update_interval_days):
+            self._refresh_dataset(
+                'financials_history', 
+                partial(get_financials_history, self.symbol))
+
+    def _is_financials_history_due(self, update_interval_days=30):
+        """
+        This method returns True if the financials history payload should be 
+        refreshed (see refresh_financials_history).
+        """
+
+        if 'financials_history' in self._get_deferred_refreshes():
+            return False
+
+        # the payload should be refreshed if the last update timestamp is 
+        # None (never initialized/updated before), or if the time lapse has 
+        # exceeded the present update internal
+        last_update_time = self.last_financials_history_update or \
+            datetime(1900, 1, 1)
+        lapse_days = (datetime.utcnow() - last_update_time).days
+        return lapse_days > update_interval_days
+
+    def _save_financials_history(self, data):
+        """
+        This method saves the fetched financials history data, and its spans.
+        """
+
+        self.financials_history_payload = json.dumps(data)
+        self.last_financials_history_update = datetime.utcnow()
+        self.set_financials_history_spans(data)
 
     def get_financials_history_data(self, update_interval_days=30):
         """
@@ -154,25 +288,52 @@ class Stock(db.Model):
         update has already exceeded the given update interval (in days).
         """
 
-        # update the financials history payload column if the last update
-        # timestamp is None (never initialized/updated before), or if the time 
-        # lapse has exceeded the present update internal
-        last_update_time = self.last_financials_history_update or \
-            datetime(1900, 1, 1)
-        now = datetime.utcnow()
-        lapse_days = (now - last_update_time).days
-        if lapse_days > update_interval_days:
-            self.financials_history_payload = \
-                json.dumps(get_financials_history(self.symbol))
-            self.last_financials_history_update = now
-            db.session.commit()
+        self.refresh_financials_history(
+            update_interval_days=update_interval_days)
 
         return json.loads(self.financials_history_payload)
+
+    def get_fundamentals_frame(self, expiration_seconds=86400):
+        """
+        This method returns the FundamentalsFrame of the saved financials 
+        history payload, refreshing the payload first if needed.
+
+        Frames are cached in Redis by the payload version, so the payload 
+        only needs to be parsed and converted once per version. 
+
+        Inputs:
+            'expiration_seconds': number of seconds to keep a cached frame in 
+                                  Redis. Defaulted to 86400.
+        """
+
+        self.refresh_financials_history()
+
+        # look for a cached frame of the current payload version
+        key = 'fundamentals_frame:{}:{}'.format(
+            self.symbol, self.last_financials_history_update.isoformat())
+        try:
+            data = current_app.redis.get(key)
+        except redis.exceptions.RedisError:
+            data = None
+        if data:
+            return FundamentalsFrame.from_bytes(data)
+
+        # build the frame otherwise, and cache it
+        frame = FundamentalsFrame.from_payload(
+            json.loads(self.financials_history_payload))
+        try:
+            current_app.redis.set(key, frame.to_bytes(), 
+                                  ex=expiration_seconds)
+        except redis.exceptions.RedisError:
+            pass
+
+        return frame
     
     def get_last_financials_report_date(self, type='annuals'):
         """
         This method gets the date of the last financials report in the saved 
-        financials history data.
+        financials history data, from the spans saved with the payload (see 
+        set_financials_history_spans).
 
         The returned date will be a Python datetime object.
 
@@ -187,19 +348,98 @@ class Stock(db.Model):
             raise ValueError(
                 "The input value must be either 'annuals' or 'quarterly'.")
 
-        # get the saved financials history data
-        data = self.get_financials_history_data()
+        # refresh the saved financials history data if needed, and save the 
+        # spans of data saved before spans were kept
+        self.refresh_financials_history()
+        if self.last_fiscal_period is None:
+            self.update_data_spans()
+            db.session.commit()
 
-        # find the appropriate "latest" date given the report type requested
-        dates_list = data['financials'][type]['Fiscal Year']
-        while True:
-            latest_date = dates_list[-1]
-            if latest_date == 'TTM':
-                dates_list.remove('TTM')
-            else:
-                break
+        return self.last_fiscal_period if type == 'annuals' \
+            else self.last_quarterly_fiscal_period
+
+    def set_financials_history_spans(self, data):
+        """
+        This method saves the first and the last annual fiscal periods, and 
+        the last quarterly fiscal period, of the input financials history 
+        payload data, so that they don't need to be parsed out of the payload 
+        later; 'TTM' periods are excluded.
+        """
+
+        periods = {}
+        for type in ['annuals', 'quarterly']:
+            try:
+                periods[type] = parse_fiscal_periods(
+                    data['financials'][type]['Fiscal Year']).timestamps
+            except (KeyError, TypeError):
+                periods[type] = ()
+
+        self.first_fiscal_period = min(periods['annuals'], default=None)
+        self.last_fiscal_period = max(periods['annuals'], default=None)
+        self.last_quarterly_fiscal_period = max(periods['quarterly'], 
+                                                default=None)
+        self._set_max_years_overlap()
+
+    def set_quote_history_spans(self, data):
+        """
+        This method saves the first and the last dates of the input quote 
+        history data, a dictionary of "<timestamp>: <price>".
+        """
+
+        self.first_quote_date = min(data.keys(), default=None)
+        self.last_quote_date = max(data.keys(), default=None)
+        self._set_max_years_overlap()
 
-        return datetime.strptime(latest_date, '%Y-%m')
+    def _set_max_years_overlap(self):
+        """
+        This method saves the maximum number of years of overlap between the 
+        saved financials history and quote history, if spans of both are 
+        saved.
+        """
+
+        spans = [self.first_fiscal_period, self.last_fiscal_period, 
+                 self.first_quote_date, self.last_quote_date]
+        self.max_years_overlap = get_max_years_overlap(*spans) \
+            if None not in spans else None
+
+    def update_data_spans(self):
+        """
+        This method parses the saved financials history and quote history 
+        payloads, and saves their spans. It is only needed for payloads saved 
+        before spans were kept, since spans are otherwise saved whenever a 
+        payload is.
+        """
+
+        if self.financials_history_payload:
+            self.set_financials_history_spans(
+                json.loads(self.financials_history_payload))
+        if self.quote_history_payload:
+            self.set_quote_history_spans({
+                datetime.strptime(key, '%m-%d-%Y %H:%M'): value for \
+                (key, value) in json.loads(self.quote_history_payload).items()})
+
+    def get_data_spans(self):
+        """
+        This method returns a DataSpans object of the saved financials history 
+        and quote history, used to derive dates and durations for stock 
+        valuation plotting without parsing the payloads, or None if spans of 
+        both payloads aren't available.
+        """
+
+        if self.max_years_overlap is None and \
+            self.financials_history_payload and self.quote_history_payload:
+            self.update_data_spans()
+            db.session.commit()
+
+        if self.max_years_overlap is None:
+            return None
+
+        return DataSpans(
+            first_fiscal_period=self.first_fiscal_period, 
+            last_fiscal_period=self.last_fiscal_period, 
+            first_quote_date=self.first_quote_date, 
+            last_quote_date=self.last_quote_date, 
+            max_years_overlap=self.max_years_overlap)
 
     def get_analyst_estimates_data(self, update_interval_days=30):
         """
@@ -211,16 +451,85 @@ class Stock(db.Model):
         """
 
         # fetches for newer data if update is needed
-        now = datetime.utcnow()
-        if not self.last_analyst_estimates_update or (now - \
-            self.last_analyst_estimates_update).days > update_interval_days:
-            self.analyst_estimates_payload = json.dumps(
-                get_analyst_estimates(self.symbol))
-            self.last_analyst_estimates_update = now
-            db.session.commit()
+        if self._is_analyst_estimates_due(
+                update_interval_days=update_interval_days):
+            self._refresh_dataset(
+                'analyst_estimates', 
+                partial(get_analyst_estimates, self.symbol))
 
         return json.loads(self.analyst_estimates_payload)
 
+    def _is_analyst_estimates_due(self, update_interval_days=30):
+        """
+        This method returns True if the analyst estimates payload should be 
+        refreshed (see get_analyst_estimates_data).
+        """
+
+        if 'analyst_estimates' in self._get_deferred_refreshes():
+            return False
+
+        now = datetime.utcnow()
+        return not self.last_analyst_estimates_update or (now - \
+            self.last_analyst_estimates_update).days > update_interval_days
+
+    def _save_analyst_estimates(self, data):
+        """
+        This method saves the fetched analyst estimates data.
+        """
+
+        self.analyst_estimates_payload = json.dumps(data)
+        self.last_analyst_estimates_update = datetime.utcnow()
+
+    def refresh_quote_history(self, interval='1mo', type='close', delay=24):
+        """
+        This method downloads and saves the quote history payload, if it has 
+        never been saved or the last refresh is older than the given delay.
+
+        Inputs:
+            'type': the type of stock price. Default is 'close' (closing price)
+            'delay': the minimal number of hours allowed between two refreshes;
+                     Default is 24 hours.
+        """
+
+        # creates/refreshes the quote history and save it 
+        if self._is_quote_history_due(delay=delay):
+
+            # download quote history from the web, and save it
+            self._refresh_dataset(
+                'quote_history', 
+                partial(get_quote_history, symbol=self.symbol, 
+                        interval=interval, header=type))
+
+    def _is_quote_history_due(self, delay=24):
+        """
+        This method returns True if the quote history payload should be 
+        refreshed (see refresh_quote_history).
+        """
+
+        if 'quote_history' in self._get_deferred_refreshes():
+            return False
+
+        return get_market_calendar().is_refresh_due(
+            self.last_quote_history_update, timedelta(hours=delay))
+
+    def _save_quote_history(self, raw_data):
+        """
+        This method saves the fetched quote history data, a dictionary of 
+        "<timestamp>: <price>".
+        """
+
+        # convert all timestamp values to strings and save
+        raw_data_timestamp_to_str = {key.strftime('%m-%d-%Y %H:%M'): value \
+                                     for (key, value) in raw_data.items()}
+        self.quote_history_payload = json.dumps(raw_data_timestamp_to_str)
+
+        # update the saved timestamp for the last quote history update, 
+        # and the saved spans of data, as precise as the saved timestamps
+        self.last_quote_history_update = datetime.utcnow()
+        self.set_quote_history_spans({
+            datetime.strptime(key, '%m-%d-%Y %H:%M'): value for \
+            (key, value) in raw_data_timestamp_to_str.items()})
+
     def get_quote_history_data(self, start_date='01-01-1900', end_date=None, 
                                interval='1mo', type='close', delay=24):
         """
@@ -238,27 +547,9 @@ class Stock(db.Model):
                      Default is 24 hours.
         """
 
-        # creates/refreshes the quote history and save it 
+        # creates/refreshes the quote history if needed
+        self.refresh_quote_history(interval=interval, type=type, delay=delay)
         now = datetime.utcnow()
-        if not self.last_quote_history_update or \
-            (now - self.last_quote_history_update).total_seconds() > \
-                (delay * 3600):
-
-            # download quote history from the web
-            raw_data = get_quote_history(symbol=self.symbol, 
-                                         interval=interval,
-                                         header=type)
-            
-            # convert all timestamp values to strings and save
-            raw_data_timestamp_to_str = {key.strftime('%m-%d-%Y %H:%M'): value \
-                                         for (key, value) in raw_data.items()}
-            self.quote_history_payload = json.dumps(raw_data_timestamp_to_str)
-
-            # update the saved timestamp for the last quote history update
-            self.last_quote_history_update = now
-
-            # commit database changes 
-            db.session.commit()
 
         # load quote data from the saved quote history payload, with 
         # pre-specified start and end dates
@@ -281,16 +572,281 @@ class Stock(db.Model):
                           Defaulted to 24.
         """
 
+        if self._is_quote_details_due(delay_hours=delay_hours):
+            self._refresh_dataset(
+                'quote_details', partial(get_quote_details, self.symbol))
+
+        return json.loads(self.quote_details_paylod)
+
+    def _is_quote_details_due(self, delay_hours=24):
+        """
+        This method returns True if the quote details payload should be 
+        refreshed (see get_quote_details_data).
+        """
+
+        if 'quote_details' in self._get_deferred_refreshes():
+            return False
+
         now = datetime.utcnow()
-        if not self.last_quote_details_update or \
+        return not self.last_quote_details_update or \
             (now - self.last_quote_details_update).total_seconds() >= \
-                delay_hours * 3600:
-            data, self.dividend_yield = get_quote_details(self.symbol)
-            self.quote_details_paylod = json.dumps(data)
-            self.last_quote_details_update = now
-            db.session.commit()
+                delay_hours * 3600
 
-        return json.loads(self.quote_details_paylod)
+    def _save_quote_details(self, fetched):
+        """
+        This method saves the fetched quote details data, and the dividend 
+        yield, both returned as a tuple by get_quote_details.
+        """
+
+        data, self.dividend_yield = fetched
+        self.quote_details_paylod = json.dumps(data)
+        self.last_quote_details_update = datetime.utcnow()
+
+    def _get_deferred_refreshes(self):
+        """
+        This method returns the names of datasets whose refreshes are 
+        deferred for the lifetime of this object (usually a request), since 
+        they failed or missed their deadlines in refresh_data while an older 
+        payload was saved.
+        """
+
+        return getattr(self, '_deferred_refreshes', set())
+
+    def _get_saved_payloads(self):
+        """
+        This method returns the saved payloads of all datasets of the stock, 
+        in a dictionary of "<dataset name>: <payload>", where payloads never 
+        saved are None.
+        """
+
+        return {
+            'quote': self.quote_payload, 
+            'quote_history': self.quote_history_payload, 
+            'financials_history': self.financials_history_payload, 
+            'analyst_estimates': self.analyst_estimates_payload, 
+            'quote_details': self.quote_details_paylod
+        }
+
+    def use_saved_data(self, names=('quote_history', 'financials_history', 
+                                    'analyst_estimates')):
+        """
+        This method defers refreshes of all datasets of the stock for the 
+        lifetime of this object, so that only saved payloads are used and 
+        nothing is fetched or committed, such as for read-only requests. 
+
+        It returns True if payloads of the given datasets are all saved, 
+        which are by default those needed for stock valuation.
+        """
+
+        saved_payloads = self._get_saved_payloads()
+        self._deferred_refreshes = set(saved_payloads)
+
+        return all(saved_payloads[name] for name in names)
+
+    def _refresh_dataset(self, name, fetch):
+        """
+        This method refreshes the given dataset of the stock by calling the 
+        input fetch function (see get_due_fetches), and commits the saved 
+        data.
+
+        If the data provider is unavailable (see ProviderUnavailableError) 
+        while an older payload was saved, the stored data is used instead, and 
+        the refresh is deferred for the lifetime of this object.
+        """
+
+        try:
+            data = fetch()
+        except ProviderUnavailableError as e:
+            if not self._get_saved_payloads()[name]:
+                raise
+            self._deferred_refreshes = self._get_deferred_refreshes() | {name}
+            current_app.logger.warning(
+                'Unable to refresh {} of {}: {!r}'.format(
+                    name, self.symbol, e))
+            return
+
+        self.save_fetched_data(name, data)
+        db.session.commit()
+
+    def get_due_fetches(self):
+        """
+        This method returns the fetches needed to refresh datasets of the 
+        stock that have never been saved or are due (by the default update 
+        intervals), in a dictionary of "<dataset name>: <fetch function>". 
+        Fetch functions take no arguments and only do network calls; the 
+        fetched data is saved by save_fetched_data.
+        """
+
+        fetches = {}
+        if self._is_quote_due():
+            fetches['quote'] = partial(get_quote, self.symbol)
+        if self._is_quote_history_due():
+            fetches['quote_history'] = partial(
+                get_quote_history, symbol=self.symbol, interval='1mo', 
+                header='close')
+        if self._is_financials_history_due():
+            fetches['financials_history'] = partial(
+                get_financials_history, self.symbol)
+        if self._is_analyst_estimates_due():
+            fetches['analyst_estimates'] = partial(
+                get_analyst_estimates, self.symbol)
+        if self._is_quote_details_due():
+            fetches['quote_details'] = partial(get_quote_details, self.symbol)
+
+        return fetches
+
+    def save_fetched_data(self, name, data):
+        """
+        This method saves the data fetched for the given dataset, see 
+        get_due_fetches.
+        """
+
+        getattr(self, '_save_' + name)(data)
+
+    def refresh_data(self, names=None):
+        """
+        This method refreshes all datasets of the stock that are due, with 
+        upstream calls issued concurrently (see fetch_concurrently), and 
+        commits the saved data once. 
+
+        Datasets that fail or miss their deadlines are left as they are; if 
+        an older payload was saved, it is used for the rest of the lifetime 
+        of this object, otherwise the dataset is fetched again when needed.
+
+        Inputs:
+            'names': a sequence of dataset names, defaulted to None. When 
+                     given, only these datasets are refreshed; otherwise all 
+                     datasets are, see get_due_fetches.
+        """
+
+        Stock.refresh_stocks_data([self], names=names)
+
+    @classmethod
+    def refresh_stocks_data(cls, stocks, names=None):
+        """
+        This class method refreshes the datasets of all input stocks that are 
+        due, as refresh_data does for a single stock, with upstream calls of 
+        all stocks issued concurrently, and the saved data committed once.
+
+        It returns a set of symbols of stocks with any of the datasets failed 
+        while no older payload was saved, so that the datasets are still 
+        missing.
+
+        Inputs:
+            'stocks': a sequence of Stock objects.
+            'names': a sequence of dataset names, defaulted to None. When 
+                     given, only these datasets are refreshed.
+        """
+
+        # gather the fetches of all stocks, keyed by "(<symbol>, <dataset>)"
+        stocks = {stock.symbol: stock for stock in stocks}
+        deadlines = current_app.config['FETCH_DEADLINE_SECONDS']
+        fetches = {}
+        deadline_seconds = {}
+        for symbol, stock in stocks.items():
+            for name, fetch in stock.get_due_fetches().items():
+                if names is None or name in names:
+                    fetches[(symbol, name)] = fetch
+                    if name in deadlines:
+                        deadline_seconds[(symbol, name)] = deadlines[name]
+        if not fetches:
+            return set()
+
+        results, errors = fetch_concurrently(
+            fetches, deadline_seconds=deadline_seconds)
+        for (symbol, name), data in results.items():
+            stocks[symbol].save_fetched_data(name, data)
+        db.session.commit()
+
+        # defer refreshes of failed datasets with older payloads saved
+        symbols_missing_data = set()
+        for (symbol, name), error in errors.items():
+            stock = stocks[symbol]
+            if stock._get_saved_payloads()[name]:
+                stock._deferred_refreshes = \
+                    stock._get_deferred_refreshes() | {name}
+            else:
+                symbols_missing_data.add(symbol)
+            current_app.logger.warning(
+                'Unable to refresh {} of {}: {!r}'.format(name, symbol, error))
+
+        return symbols_missing_data
+
+    @classmethod
+    def get_stocks(cls, symbols):
+        """
+        This class method returns the stocks of the input symbols in bulk, 
+        with all symbols looked up in the app database at once, and company 
+        profiles of symbols not found there fetched concurrently, so that new 
+        stocks can be added with a single commit.
+
+        It returns a tuple of three objects: 
+            - a dictionary of "<symbol>: <Stock object>" of stocks found;
+            - a list of symbols that do not exist;
+            - a list of symbols whose profiles could not be fetched (failed or 
+              missed their deadlines), which may be looked up again later.
+
+        Inputs:
+            'symbols': a sequence of stock symbols.
+        """
+
+        stocks = {stock.symbol: stock for stock in 
+                  cls.query.filter(cls.symbol.in_(symbols)).all()}
+        symbols_new = [symbol for symbol in dict.fromkeys(symbols) 
+                       if symbol not in stocks]
+        if not symbols_new:
+            return stocks, [], []
+
+        # fetch the profiles of new symbols concurrently
+        deadline = current_app.config['FETCH_DEADLINE_SECONDS'].get(
+            'company_profile', 
+            current_app.config['FETCH_DEADLINE_SECONDS_DEFAULT'])
+        results, errors = fetch_concurrently(
+            {symbol: partial(get_company_profile, symbol) 
+             for symbol in symbols_new}, 
+            deadline_seconds={symbol: deadline for symbol in symbols_new})
+
+        symbols_invalid = []
+        for symbol in symbols_new:
+            if symbol in errors:
+                current_app.logger.warning(
+                    'Unable to fetch the profile of {}: {!r}'.format(
+                        symbol, errors[symbol]))
+            elif not results[symbol]:
+                symbols_invalid.append(symbol)
+            else:
+                stocks[symbol] = cls(symbol=symbol, 
+                                     name=results[symbol]['name'])
+                db.session.add(stocks[symbol])
+        db.session.commit()
+
+        return stocks, symbols_invalid, list(errors)
+
+    def get_metric_graph(self):
+        """
+        This method returns a MetricGraph object built from the saved 
+        financials history and quote history payloads.
+
+        The graph is kept with the stock object and only rebuilt when the 
+        financials history payload has been updated, so that metrics 
+        requested by different callers during the same request are extracted 
+        only once.
+        """
+
+        # refresh the financials history payload if needed; the quote history 
+        # data will only be loaded when a metric first needs it
+        self.refresh_financials_history()
+
+        # rebuild the graph if the payload has changed since the last build
+        version = self.last_financials_history_update
+        if getattr(self, '_metric_graph', None) is None or \
+            self._metric_graph_version != version:
+            self._metric_graph = MetricGraph(
+                fundamentals_frame=self.get_fundamentals_frame(), 
+                quote_history_loader=self.get_quote_history_data)
+            self._metric_graph_version = version
+
+        return self._metric_graph
 
     def get_fundamental_indicator_data(self, start_date='01-01-1900', 
                                        debug=False):
@@ -307,11 +863,38 @@ class Stock(db.Model):
                           Defaulted to be 1/1/1900.
         """
         
+        metric_graph = self.get_metric_graph()
+
         return get_fundamental_indicators(
-            financials_history=self.get_financials_history_data(), 
-            quote_history_data=self.get_quote_history_data(),
+            financials_history=None, 
+            quote_history_data=None,
+            start_date=datetime.strptime(start_date, '%m-%d-%Y'),
+            debug=debug,
+            metric_graph=metric_graph
+        )
+
+    def get_fundamental_indicator(self, indicator_name, 
+                                  start_date='01-01-1900', debug=False):
+        """
+        This method gets/calculates a single fundamental indicator from the 
+        saved financials history payload, and returns its data in a 
+        dictionary; only metrics needed for this indicator are extracted.
+
+        It returns None if there is no indicator of the given name.
+
+        Inputs:
+            'indicator_name': name of the indicator, such as 'ROE %'.
+            'start_date': a string in the format of '%m-%d-%Y'.
+                          Only data of financials history after this date will 
+                          be used when deriving the indicator.
+                          Defaulted to be 1/1/1900.
+        """
+
+        return get_fundamental_indicator(
+            name=indicator_name, 
             start_date=datetime.strptime(start_date, '%m-%d-%Y'),
-            debug=debug
+            debug=debug,
+            metric_graph=self.get_metric_graph()
         )
 
     def get_posts(self):
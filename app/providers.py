@@ -0,0 +1,513 @@
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from threading import Lock
+from time import monotonic, sleep
+from flask import current_app
+from yahoo_fin import stock_info
+from app.circuit_breakers import call_provider, get_remaining_time, \
+    get_request_deadline, set_request_deadline
+
+
+class Provider(object):
+    """
+    This class implements the interface of market data providers, with one
+    method per dataset, named 'get_<dataset>'; providers only implement the
+    methods of datasets they provide (see provides).
+
+    Datasets, and what their methods return, are:
+        - 'quote': a dictionary of the latest quote of the given symbol, with
+                   items of Finnhub quotes ('c', 'd', 'dp', 'h', 'l', 'o',
+                   'pc' and 't'), and 'currency', or None if the symbol does
+                   not exist;
+        - 'company_profile': a dictionary with the 'name' of the company, or
+                             None if the symbol does not exist;
+        - 'stock_symbols': a list of symbols of stocks on the given exchange;
+        - 'symbol_search': a tuple of (<list of matches>, <total number of
+                           matches>) for the given query, page and number of
+                           stocks per page;
+        - 'financials_history': the financials history payload;
+        - 'analyst_estimates': the analyst estimates payload;
+        - 'quote_history': a dictionary of "<timestamp>: <price>";
+        - 'quote_details': a tuple of (<dictionary of quote details>,
+                           <dividend yield>).
+    """
+
+    name = None
+
+    def provides(self, dataset):
+        """
+        This method returns True if the provider implements the given
+        dataset.
+        """
+
+        return hasattr(self, 'get_' + dataset)
+
+
+class FinnhubProvider(Provider):
+    """
+    This class implements the provider of quotes, company profiles and
+    symbols via the Finnhub API, with the client configured for the app.
+    """
+
+    name = 'finnhub'
+
+    def get_quote(self, symbol):
+        # check if the api client has been configured
+        if not current_app.finnhub_client:
+            return None
+
+        payload = current_app.finnhub_client.quote(symbol)
+
+        # set the currency to USD for all, since the Finnhub API
+        # always defaults it to USD in its response
+        payload['currency'] = 'USD'
+
+        # also convert the epoch number of the time field to a python datetime
+        # string, since the Finnhub API always defaults the market time to an
+        # epoch value in its response
+        payload['t'] = str(datetime.fromtimestamp(int(payload['t'])))
+
+        return payload
+
+    def get_company_profile(self, symbol):
+        # check if the api client has been configured
+        if not current_app.finnhub_client:
+            return None
+
+        # fetch company profile from Finnhub
+        response = current_app.finnhub_client.company_profile2(symbol=symbol)
+        if len(response) == 0:
+            return None
+
+        # prepare the company profile payload
+        profile_payload = {}
+        profile_payload['name'] = response['name']
+
+        return profile_payload
+
+    def get_stock_symbols(self, exchange='US'):
+        # check if the api client has been configured
+        if not current_app.finnhub_client:
+            return []
+
+        response = current_app.finnhub_client.stock_symbols(exchange)
+
+        return [item['symbol'] for item in response]
+
+    def get_symbol_search(self, query, page, stocks_per_page):
+        # check if the api client has been configured
+        if not current_app.finnhub_client:
+            return [], 0
+
+        # perform the search via an API
+        response = current_app.finnhub_client.symbol_lookup(query)
+
+        # prepare the search results
+        total = response['count']
+        if not isinstance(page, int) or page < 1:
+            raise ValueError("Invalidate page value.")
+        elif (page - 1) * stocks_per_page < total:
+            matched_symbols = response['result'][
+                ((page - 1) * stocks_per_page):
+                min(page * stocks_per_page, total)]
+        else:
+            matched_symbols = []
+
+        return matched_symbols, total
+
+
+def get_guru_data(symbol, data_type):
+    """
+    This helper function pulls data via the GuruFocus API, for the given symbol
+    and data type.
+
+    Input:
+        symbol: stock ticker symbol
+        data_type: possible values include:
+            'financials'
+            'analyst_estimate'
+            ...
+            (for more choices, checkout the API documentation here:
+            https://www.gurufocus.com/api.php)
+    """
+
+    api_token = current_app.config['GURU_API_KEY']
+    base_url = 'https://api.gurufocus.com/public/user/' + api_token + '/stock/'
+    constructed_url = base_url + symbol + '/' + data_type
+
+    # call the API guarded by its circuit breaker, where server errors and
+    # rate limiting count as failures of the API
+    r = call_provider('gurufocus', requests.get, constructed_url,
+                      timeout=get_remaining_time('gurufocus'),
+                      is_failure=lambda r: r.status_code in [429] or
+                                           r.status_code >= 500)
+    if r.status_code != 200:
+        return "Error: the GuruFocus API service failed."
+    else:
+        return r.json()
+
+
+class GuruFocusProvider(Provider):
+    """
+    This class implements the provider of financials and analyst estimates
+    via the GuruFocus API.
+    """
+
+    name = 'gurufocus'
+
+    def get_financials_history(self, symbol):
+        return get_guru_data(symbol, data_type='financials')
+
+    def get_analyst_estimates(self, symbol):
+        return get_guru_data(symbol, data_type='analyst_estimate')
+
+
+class YahooProvider(Provider):
+    """
+    This class implements the provider of quote history, quote details and
+    quotes by scraping Yahoo Finance, via the "yahoo_fin" library.
+
+    For more details, check out the author's documentation here:
+    https://theautomatic.net/yahoo_fin-documentation/
+    """
+
+    name = 'yahoo'
+
+    def get_quote(self, symbol):
+        # get the quote guarded by the circuit breaker of Yahoo Finance, and
+        # convert it to the format of Finnhub quotes
+        data = call_provider('yahoo', stock_info.get_quote_data, symbol)
+
+        return {
+            'c': data['regularMarketPrice'],
+            'd': data['regularMarketChange'],
+            'dp': data['regularMarketChangePercent'],
+            'h': data['regularMarketDayHigh'],
+            'l': data['regularMarketDayLow'],
+            'o': data['regularMarketOpen'],
+            'pc': data['regularMarketPreviousClose'],
+            't': str(datetime.fromtimestamp(int(data['regularMarketTime']))),
+            'currency': data.get('currency', 'USD')
+        }
+
+    def get_quote_history(self, symbol, start_date=None, end_date=None,
+                          interval='1mo', header='close'):
+        # default the end date to 1 day before utcnow to hack around a
+        # duplication bug in the yahoo_fin library
+        if end_date is None:
+            end_date = datetime.utcnow() - timedelta(days=1)
+
+        # get the quote history in Pandas dataframe via a web scraper, guarded
+        # by the circuit breaker of Yahoo Finance
+        df_quote_history = call_provider('yahoo', stock_info.get_data, symbol,
+                                         start_date=start_date,
+                                         end_date=end_date,
+                                         interval=interval)
+
+        # construct the output dictionary of "<timestamp>: <price>"
+        data = {}
+        df_selected_price = df_quote_history[header]
+        for timestamp in dict(df_selected_price):
+            data[timestamp.to_pydatetime()] = df_selected_price[timestamp]
+
+        return data
+
+    def get_quote_details(self, symbol):
+        # download data, guarded by the circuit breaker of Yahoo Finance,
+        # which may raise ProviderUnavailableError
+        data_downloaded = call_provider('yahoo', stock_info.get_quote_table,
+                                        symbol)
+
+        try:
+            # return the downloaded data if it's a dictionary, otherwise raise
+            # an exception
+            if isinstance(data_downloaded, dict):
+                # standardize the downloaded data - this is API specific
+                data = {}
+                data['Market Cap'] = '$' + data_downloaded['Market Cap']
+                data['Beta (5Y Monthly)'] = \
+                    data_downloaded['Beta (5Y Monthly)']
+                # add dollar sign
+                _low, _high = [s.strip() for s in
+                               data_downloaded['52 Week Range'].split('-')]
+                data['52 Week Range'] = '$' + _low + ' - ' + '$' + _high
+                data['Earnings Date'] = data_downloaded['Earnings Date']
+                # when the date is nan save the value as 'N/A'
+                data['Ex-Dividend Date'] = \
+                    data_downloaded['Ex-Dividend Date'] \
+                    if data_downloaded['Ex-Dividend Date'] == \
+                        data_downloaded['Ex-Dividend Date'] else 'N/A'
+                data['Forward Dividend & Yield'] = \
+                    data_downloaded['Forward Dividend & Yield']
+
+                # get the numeric value of the dividend yield
+                s = data_downloaded['Forward Dividend & Yield']
+                dividend_yield_str = s[(s.find('(') + 1):s.find('%')]
+                try:
+                    dividend_yield = float(dividend_yield_str) / 100
+                except:
+                    dividend_yield = 0
+
+                return data, dividend_yield
+            else:
+                raise TypeError("Invalid data type for quote details - only "
+                                "dict is accepted.")
+
+        except:
+            # raise a more informational exception
+            raise ConnectionAbortedError(
+                'Unable to download quote details data.')
+
+
+class StubProvider(Provider):
+    """
+    This class implements a local provider of all datasets, with synthetic
+    data derived from symbols only, for tests and benchmarks; no network call
+    is made. Symbols starting with 'X' do not exist.
+    """
+
+    name = 'stub'
+
+    def __init__(self, latency=0, name='stub'):
+        """
+        This method initializes the provider, with the given number of
+        seconds taken by each call, and the name to register it by.
+        """
+
+        self.latency = latency
+        self.name = name
+
+    def _get_price(self, symbol):
+        return 10. + sum(ord(c) for c in symbol) % 90
+
+    def get_quote(self, symbol):
+        sleep(self.latency)
+        if symbol.startswith('X'):
+            return None
+
+        price = self._get_price(symbol)
+        return {'c': price, 'd': 1., 'dp': 100. / (price - 1.), 'h': price,
+                'l': price - 1., 'o': price - 1., 'pc': price - 1.,
+                't': str(datetime.utcnow().replace(microsecond=0)),
+                'currency': 'USD'}
+
+    def get_company_profile(self, symbol):
+        sleep(self.latency)
+        return None if symbol.startswith('X') else \
+            {'name': '{} Inc.'.format(symbol)}
+
+    def get_stock_symbols(self, exchange='US'):
+        sleep(self.latency)
+        return ['AAPL', 'AMZN', 'GOOG', 'MSFT']
+
+    def get_symbol_search(self, query, page, stocks_per_page):
+        sleep(self.latency)
+        matches = [{'symbol': symbol, 'description': '{} Inc.'.format(symbol)}
+                   for symbol in self.get_stock_symbols()
+                   if query.upper() in symbol]
+        return matches[((page - 1) * stocks_per_page):
+                       (page * stocks_per_page)], len(matches)
+
+    def get_financials_history(self, symbol):
+        sleep(self.latency)
+        years = range(datetime.utcnow().year - 11, datetime.utcnow().year)
+        return {'financials': {'annuals': {
+            'Fiscal Year': ['{}-12'.format(year) for year in years] + ['TTM'],
+            'income_statement': {
+                'Revenue': [str(100 + 10 * i) for i in range(12)],
+                'Shares Outstanding (Diluted Average)':
+                    [str(10 - 0.1 * i) for i in range(12)]}}}}
+
+    def get_analyst_estimates(self, symbol):
+        sleep(self.latency)
+        return {'annual': {'date': [], 'revenue_estimate': []}}
+
+    def get_quote_history(self, symbol, start_date=None, end_date=None,
+                          interval='1mo', header='close'):
+        sleep(self.latency)
+        price = self._get_price(symbol)
+        now = datetime.utcnow()
+        return {datetime(year, month, 1): price + month
+                for year in range(now.year - 10, now.year + 1)
+                for month in range(1, 13) if datetime(year, month, 1) <= now}
+
+    def get_quote_details(self, symbol):
+        sleep(self.latency)
+        return {'Market Cap': '$1B', 'Beta (5Y Monthly)': 1.0,
+                '52 Week Range': '$10 - $100', 'Earnings Date': 'N/A',
+                'Ex-Dividend Date': 'N/A',
+                'Forward Dividend & Yield': 'N/A (N/A)'}, 0
+
+
+# providers by name, see register_provider
+providers = {}
+
+
+def register_provider(provider):
+    """
+    This function registers the input provider by its name, so that it can
+    be configured as a provider of datasets in DATASET_PROVIDERS.
+    """
+
+    providers[provider.name] = provider
+
+
+register_provider(FinnhubProvider())
+register_provider(GuruFocusProvider())
+register_provider(YahooProvider())
+register_provider(StubProvider())
+
+
+# recent latencies of calls to providers, by "(<provider>, <dataset>)", for
+# the delays of hedged requests
+_latencies = {}
+_latencies_lock = Lock()
+_max_num_of_latencies = 200
+
+# the thread pool running hedged requests
+_executor = None
+_executor_lock = Lock()
+
+
+def _get_executor():
+    """
+    This helper function returns the thread pool for hedged requests, and
+    creates it on first use with PROVIDER_MAX_WORKERS threads.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['PROVIDER_MAX_WORKERS'],
+                thread_name_prefix='hedging')
+
+    return _executor
+
+
+def _record_latency(name, dataset, seconds):
+    """
+    This helper function records the latency of a successful call.
+    """
+
+    with _latencies_lock:
+        _latencies.setdefault(
+            (name, dataset), deque(maxlen=_max_num_of_latencies)).append(seconds)
+
+
+def get_hedge_delay(name, dataset):
+    """
+    This function returns the number of seconds to wait for the given
+    provider before a hedged request is sent to the next provider, which is
+    the 95th percentile of recent latencies of the provider for the dataset,
+    or HEDGE_DELAY_DEFAULT_SECONDS while there are too few calls recorded.
+    """
+
+    with _latencies_lock:
+        latencies = sorted(_latencies.get((name, dataset), []))
+    if len(latencies) < 20:
+        return current_app.config['HEDGE_DELAY_DEFAULT_SECONDS']
+
+    return latencies[int(0.95 * (len(latencies) - 1))]
+
+
+def _call(name, dataset, *args, **kwargs):
+    """
+    This helper function calls the given provider for the given dataset, and
+    records the latency of the call.
+    """
+
+    start = monotonic()
+    result = getattr(providers[name], 'get_' + dataset)(*args, **kwargs)
+    _record_latency(name, dataset, monotonic() - start)
+
+    return result
+
+
+def _call_in_app_context(app, request_deadline, name, dataset, *args,
+                         **kwargs):
+    """
+    This helper function calls _call within an app context of the given app,
+    with the deadline of the request passed on.
+    """
+
+    with app.app_context():
+        if request_deadline is not None:
+            set_request_deadline(request_deadline)
+        return _call(name, dataset, *args, **kwargs)
+
+
+def _fetch_hedged(dataset, names, *args, **kwargs):
+    """
+    This helper function calls the first two of the given providers for the
+    given dataset, with a hedged request: the second provider is only called
+    if the first has not answered within its hedge delay (see
+    get_hedge_delay), or has failed, and whichever answers first is taken.
+    """
+
+    app = current_app._get_current_object()
+    request_deadline = get_request_deadline()
+
+    def submit(name):
+        return _get_executor().submit(_call_in_app_context, app,
+                                      request_deadline, name, dataset, *args,
+                                      **kwargs)
+
+    primary = submit(names[0])
+    done, _ = wait([primary], timeout=get_hedge_delay(names[0], dataset))
+    if done and primary.exception() is None:
+        return primary.result()
+
+    pending = {primary, submit(names[1])}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=get_remaining_time(),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = error or future.exception()
+
+    raise error or TimeoutError(
+        'No provider of {} answered in time.'.format(dataset))
+
+
+def fetch_dataset(dataset, *args, **kwargs):
+    """
+    This function returns the given dataset from its providers, which are
+    tried in the order configured in DATASET_PROVIDERS, falling back to the
+    next provider when a provider fails; the error of the last provider is
+    raised if all fail. Datasets in HEDGED_DATASETS are requested with hedged
+    requests to their first two providers (see _fetch_hedged) instead.
+
+    Inputs:
+        'dataset': name of the dataset, see Provider.
+        'args' and 'kwargs': arguments of the dataset, such as the symbol.
+    """
+
+    names = [name for name in current_app.config['DATASET_PROVIDERS'][dataset]
+             if providers[name].provides(dataset)]
+
+    if dataset in current_app.config['HEDGED_DATASETS'] and len(names) > 1:
+        try:
+            return _fetch_hedged(dataset, names, *args, **kwargs)
+        except Exception as e:
+            if len(names) == 2:
+                raise
+            current_app.logger.warning(
+                'Unable to get {} from {}: {!r}'.format(
+                    dataset, ', '.join(names[:2]), e))
+            names = names[2:]
+
+    for i, name in enumerate(names):
+        try:
+            return _call(name, dataset, *args, **kwargs)
+        except Exception as e:
+            if i == len(names) - 1:
+                raise
+            current_app.logger.warning(
+                'Unable to get {} from {}: {!r}'.format(dataset, name, e))
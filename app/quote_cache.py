@@ -0,0 +1,157 @@
+import json
+import redis
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app.market_calendar import get_market_calendar
+
+
+# quotes kept in process, by symbol, each as a tuple of (<time cached>,
+# <quote>, <time of the quote>); entries are only used for a few seconds
+# before Redis is checked again, and the least recently cached entries are
+# dropped first
+_quotes = OrderedDict()
+_quotes_lock = Lock()
+_max_num_of_quotes = 1024
+
+# the Redis hash of quotes not yet saved to the app database, and the key
+# set while a job to save them is scheduled
+_unsaved_quotes_key = 'quotes:unsaved'
+_saving_scheduled_key = 'quotes:saving_scheduled'
+
+
+def _get_quote_key(symbol):
+    """
+    This helper function returns the Redis key of the cached quote of the
+    given symbol.
+    """
+
+    return 'quote:{}'.format(symbol)
+
+
+def _is_fresh(timestamp, max_age):
+    """
+    This helper function returns True if a quote of the given time (in epoch
+    seconds) is still fresh, which is within the maximum age, or until the
+    market opens again (see MarketCalendar.get_next_refresh_time).
+    """
+
+    return not get_market_calendar().is_refresh_due(
+        datetime.utcfromtimestamp(timestamp), timedelta(seconds=max_age))
+
+
+def get_cached_quote(symbol, max_age=None):
+    """
+    This function returns the cached quote of the given symbol as a tuple of
+    (<quote>, <time of the quote in epoch seconds>), or None if no quote
+    fresh enough is cached (see _is_fresh). Quotes are looked up in process
+    first, and then in Redis.
+
+    Inputs:
+        'symbol': the stock symbol.
+        'max_age': the maximum number of seconds since the time of the quote,
+                   which is never less than QUOTE_MIN_DELAY_SECONDS, so that
+                   clients cannot ask for fresher quotes than the server
+                   allows. Defaulted to None, for QUOTE_MIN_DELAY_SECONDS.
+    """
+
+    max_age = max(max_age or 0, current_app.config['QUOTE_MIN_DELAY_SECONDS'])
+    now = time()
+
+    # look up the quote in process
+    with _quotes_lock:
+        entry = _quotes.get(symbol)
+    if entry and \
+        now - entry[0] <= current_app.config['QUOTE_LOCAL_CACHE_SECONDS']:
+        quote, timestamp = entry[1:]
+        return (quote, timestamp) if _is_fresh(timestamp, max_age) else None
+
+    # look up the quote in Redis, and keep it in process for a while
+    try:
+        data = current_app.redis.get(_get_quote_key(symbol))
+    except redis.exceptions.RedisError:
+        data = None
+    if not data:
+        return None
+
+    quote, timestamp = json.loads(data)
+    _set_local_quote(symbol, quote, timestamp)
+
+    return (quote, timestamp) if _is_fresh(timestamp, max_age) else None
+
+
+def _set_local_quote(symbol, quote, timestamp):
+    """
+    This helper function keeps the quote of the given symbol in process.
+    """
+
+    with _quotes_lock:
+        _quotes.pop(symbol, None)
+        _quotes[symbol] = (time(), quote, timestamp)
+        while len(_quotes) > _max_num_of_quotes:
+            _quotes.popitem(last=False)
+
+
+def set_cached_quote(symbol, quote, timestamp=None, unsaved=True):
+    """
+    This function caches the quote of the given symbol, both in process and
+    in Redis (for QUOTE_CACHE_SECONDS), so that it is shared by all processes
+    of the app.
+
+    Newly fetched quotes are also queued to be saved to the app database in
+    batches, by a background job scheduled at most once per
+    QUOTE_SAVING_SECONDS (see save_unsaved_quotes in tasks.py). It returns
+    False if the quote was not queued, since Redis is unavailable, so that the
+    caller should save it instead.
+
+    Inputs:
+        'symbol': the stock symbol.
+        'quote': the quote data, which should be JSON serializable.
+        'timestamp': the time of the quote in epoch seconds, defaulted to None
+                     for now.
+        'unsaved': a boolean, True (default) if the quote is not saved to the
+                   app database yet.
+    """
+
+    timestamp = time() if timestamp is None else timestamp
+    _set_local_quote(symbol, quote, timestamp)
+
+    data = json.dumps([quote, timestamp])
+    try:
+        pipe = current_app.redis.pipeline()
+        pipe.set(_get_quote_key(symbol), data,
+                 ex=current_app.config['QUOTE_CACHE_SECONDS'])
+        if unsaved:
+            pipe.hset(_unsaved_quotes_key, symbol, data)
+            pipe.set(_saving_scheduled_key, 1, nx=True,
+                     ex=current_app.config['QUOTE_SAVING_SECONDS'] * 10)
+        results = pipe.execute()
+
+        # schedule a job to save queued quotes, unless one is scheduled
+        if unsaved and results[-1]:
+            current_app.task_queue.enqueue(
+                'app.tasks.save_unsaved_quotes',
+                current_app.config['QUOTE_SAVING_SECONDS'])
+    except redis.exceptions.RedisError:
+        return False
+
+    return True
+
+
+def pop_unsaved_quotes():
+    """
+    This function removes all quotes queued to be saved to the app database,
+    and returns them in a dictionary of "<symbol>: (<quote>, <time of the
+    quote>)". A new saving job is scheduled for quotes queued after this.
+    """
+
+    pipe = current_app.redis.pipeline()
+    pipe.delete(_saving_scheduled_key)
+    pipe.hgetall(_unsaved_quotes_key)
+    pipe.delete(_unsaved_quotes_key)
+    _, data, _ = pipe.execute()
+
+    return {symbol.decode(): tuple(json.loads(value))
+            for (symbol, value) in data.items()}
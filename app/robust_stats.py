@@ -0,0 +1,106 @@
+import numpy as np
+
+
+def _get_num_to_cut(num_of_values, num_to_cut, cut_fraction):
+    """
+    This helper function returns the number of values to cut from each end
+    of a sorted sequence, either given directly or as a fraction of the total
+    number of values.
+    """
+
+    if cut_fraction is not None:
+        if not 0 <= cut_fraction < 0.5:
+            raise ValueError("The fraction to cut must be in [0, 0.5).")
+        num_to_cut = int(cut_fraction * num_of_values)
+
+    if 2 * num_to_cut >= num_of_values:
+        raise ValueError("Too few values to cut {} values from each end."
+                         .format(num_to_cut))
+
+    return num_to_cut
+
+
+def trimmed_mean(values, num_to_trim=12, trim_fraction=None):
+    """
+    This function returns the mean of the input values, after removing the
+    given number of the lowest values and of the highest values.
+
+    Only the values at the trimming boundaries are located (with
+    np.partition), instead of sorting all values.
+
+    Inputs:
+        'values': a sequence of numbers.
+        'num_to_trim': an integer defaulted to be 12, the number of values to
+                       remove from each end.
+        'trim_fraction': a float value defaulted to be None. When given, the
+                         number of values to remove from each end is this
+                         fraction of all values, instead of 'num_to_trim'.
+    """
+
+    values = np.asarray(values, dtype=float)
+    num_to_trim = _get_num_to_cut(len(values), num_to_trim, trim_fraction)
+    if num_to_trim == 0:
+        return float(values.mean())
+
+    partitioned = np.partition(
+        values, [num_to_trim - 1, len(values) - num_to_trim])
+
+    return float(partitioned[num_to_trim:len(values) - num_to_trim].mean())
+
+
+def winsorized_mean(values, num_to_clip=12, clip_fraction=None):
+    """
+    This function returns the mean of the input values, after replacing the
+    given number of the lowest values (and of the highest values) with the
+    lowest (and the highest) of the remaining values.
+
+    Inputs:
+        'values': a sequence of numbers.
+        'num_to_clip': an integer defaulted to be 12, the number of values to
+                       replace at each end.
+        'clip_fraction': a float value defaulted to be None. When given, the
+                         number of values to replace at each end is this
+                         fraction of all values, instead of 'num_to_clip'.
+    """
+
+    values = np.asarray(values, dtype=float)
+    num_to_clip = _get_num_to_cut(len(values), num_to_clip, clip_fraction)
+    if num_to_clip == 0:
+        return float(values.mean())
+
+    low, high = num_to_clip, len(values) - num_to_clip - 1
+    partitioned = np.partition(values, [low, high])
+
+    return float(np.clip(values, partitioned[low], partitioned[high]).mean())
+
+
+def median(values):
+    """
+    This function returns the median of the input values.
+    """
+
+    return float(np.median(np.asarray(values, dtype=float)))
+
+
+# estimators available by name
+estimators = {
+    'trimmed_mean': trimmed_mean,
+    'winsorized_mean': winsorized_mean,
+    'median': median
+}
+
+
+def get_estimator(estimator):
+    """
+    This function returns the estimator function for the input, which is
+    either the name of an estimator, or a function that takes a sequence of
+    numbers and returns a number (returned as is).
+    """
+
+    if callable(estimator):
+        return estimator
+
+    try:
+        return estimators[estimator]
+    except KeyError:
+        raise ValueError("Unknown estimator: {}.".format(estimator))
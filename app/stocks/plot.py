@@ -1,14 +1,23 @@
+import base64
 import itertools
+import numpy as np
+from collections import namedtuple, OrderedDict
 from datetime import datetime
 from statistics import mean
 from bokeh.plotting import figure
 from bokeh.embed import components
 from bokeh.resources import CDN
-from bokeh.models import HoverTool, CheckboxGroup, CustomJS, Span
+from bokeh.models import HoverTool, CheckboxGroup, CustomJS, Span, \
+                         ColumnDataSource, BoxZoomTool
+from bokeh.events import DoubleTap
 from bokeh.palettes import Dark2_5 as palette
 from bokeh.layouts import column
 from app.metrics import Metric, TotalMetric
-from app.fundamental_analysis import get_valuation_ratios
+from app.robust_stats import get_estimator
+from app.downsampling import downsample_series
+from app.valuation import QuoteGrid, get_valuation_ratio_arrays, \
+                          get_suffix_extreme_sums, get_data_spans, \
+                          get_allowed_durations
 
 def example_plot():
     """
@@ -39,85 +48,55 @@ def example_plot():
 
 
 def _get_average_price_multiple(quote_history_data, metric_per_share_data, \
-    min_num_of_ratios = 36):
+    min_num_of_ratios = 36, estimator='trimmed_mean'):
     """
     This function calculates and returns the average price-to-metric ratio.
     
     Input:
-        - "quote_history_data" - dictionary of "<timestamp>: <price>"
+        - "quote_history_data" - dictionary of "<timestamp>: <price>", or a 
+                                 QuoteGrid object
         - "metric_per_share_data" - dictionary of "<timestamp>: <per share 
                                     metric value>", with only one record per 
                                     year
         - 'min_num_of_ratios' - minimum number of ratios needed to calculate the
                                 average valuation ratios, before removing 
                                 outliers
+        - 'estimator' - the name of an estimator from app.robust_stats, or a 
+                        function returning the average of a sequence of 
+                        ratios; defaulted to 'trimmed_mean', which removes the 
+                        12 highest ratios (1 year) and the 12 lowest ratios
     """
 
-    # get a dictionary of { <timestamp>: {<"ratio">: <price multiple>, ...} }
-    dict_timestamp_ratio = get_valuation_ratios(
+    # get all valuation ratios, to prep for the calculation of the average 
+    # ratio
+    ratios = get_valuation_ratio_arrays(
         quote_history_data=quote_history_data, 
         metric_per_share_data=metric_per_share_data
-        )
-            
-    # get all valuation ratios to a list, to prep for the calculation of the 
-    # average ratio
-    list_ratios = [dict_timestamp_ratio[timestamp]['ratio'] for timestamp in \
-        dict_timestamp_ratio]
+        ).ratios
 
     # discard valualtion ratio calculations if the total number of valid \
     # ratios is too little
-    if len(list_ratios) < min_num_of_ratios:
+    if len(ratios) < min_num_of_ratios:
         return None
 
-    # remove 12 highest ratios (1 year), and 12 lowest ratios
-    for _ in range(12):
-        list_ratios.remove(min(list_ratios))
-        list_ratios.remove(max(list_ratios))
-        
-    return sum(list_ratios) / len(list_ratios)
+    return get_estimator(estimator)(ratios)
 
 
-def get_normal_price(metric_name, section_name, start_date, quote_history_data, 
-                     financials_history, analyst_estimates):
+def _get_estimated_per_share_data(metric_name, analyst_estimates, 
+                                  num_of_shares, start_date):
     """
-    This function returns normal prices with respect to the pre-specified 
-    metric, based on the historical average price multiple of the same metric.
-    """
-
-    # convert the input start date to a datetime object
-    # TODO - generalize this code later
-    start_date_datetime_obj = datetime.strptime(start_date, '%m-%d-%Y')
-
-    # get the sequence of historical shares outstanding (diluted average)
-    num_of_shares = \
-        Metric(name='Shares Outstanding (Diluted Average)',
-               timestamps=financials_history['financials']['annuals']\
-                   ['Fiscal Year'],
-               values=financials_history['financials']['annuals']\
-                   ['income_statement']['Shares Outstanding (Diluted Average)'],
-               start_date=start_date_datetime_obj)
+    This helper function returns the per share data of analyst estimates of 
+    the given metric, in a dictionary of "<timestamp>: <per share value>".
 
-    # get the sequence of historical values of the pre-specified metric, with
-    # number of shares set
-    metric = TotalMetric(name=metric_name, 
-                         timestamps=financials_history['financials']['annuals']\
-                             ['Fiscal Year'],
-                         values=financials_history['financials']['annuals']\
-                             [section_name][metric_name],
-                         start_date=start_date_datetime_obj)
-
-    metric.num_of_shares = num_of_shares.values
-
-    # calculate the historical average price multiple
-    average_price_multiple = \
-        _get_average_price_multiple(quote_history_data=quote_history_data,
-                                    metric_per_share_data=metric.per_share_data)
-    # return special values if the average price multiple calculations did not 
-    # return valid values
-    if not average_price_multiple:
-        return None, {}, None
+    Inputs:
+        'metric_name': name of the metric, such as 'Revenue'.
+        'analyst_estimates': the analyst estimates data of the stock.
+        'num_of_shares': the metric object of shares outstanding, whose TTM 
+                         value is used for estimates only given in totals.
+        'start_date': a Python datetime object; only estimates after this date 
+                      are included.
+    """
 
-    # get the per share data of analyst estimates
     field_lookup = {
         'EBIT': {
             'field_name': 'ebit_estimate',
@@ -143,7 +122,7 @@ def get_normal_price(metric_name, section_name, start_date, quote_history_data,
                    timestamps=analyst_estimates['annual']['date'],
                    values=analyst_estimates['annual'][\
                         field_lookup[metric_name]['field_name']],
-                   start_date=start_date_datetime_obj,
+                   start_date=start_date,
                    input_timestamps_format='%Y%m')
         metric_estimated_per_share_data = metric_estimated.data
     else:
@@ -152,11 +131,59 @@ def get_normal_price(metric_name, section_name, start_date, quote_history_data,
                         timestamps=analyst_estimates['annual']['date'],
                         values=analyst_estimates['annual'][\
                             field_lookup[metric_name]['field_name']],
-                        start_date=start_date_datetime_obj,
+                        start_date=start_date,
                         input_timestamps_format='%Y%m')
         metric_estimated.num_of_shares = [num_of_shares.TTM_value]
         metric_estimated_per_share_data = metric_estimated.per_share_data
 
+    return metric_estimated_per_share_data
+
+
+def get_normal_price(metric_name, start_date, quote_history_data, 
+                     metric_graph, analyst_estimates, estimator='trimmed_mean'):
+    """
+    This function returns normal prices with respect to the pre-specified 
+    metric, based on the historical average price multiple of the same metric.
+
+    Metrics from the financials history are taken from the input metric graph 
+    (a MetricGraph object), so they are extracted at most once per payload.
+
+    The average price multiple is calculated with the input estimator, which 
+    is either the name of an estimator from app.robust_stats (defaulted to 
+    'trimmed_mean'), or a function taking a sequence of ratios.
+    """
+
+    # convert the input start date to a datetime object
+    # TODO - generalize this code later
+    start_date_datetime_obj = datetime.strptime(start_date, '%m-%d-%Y')
+
+    # get the sequence of historical shares outstanding (diluted average)
+    num_of_shares = metric_graph.get(
+        name='Shares Outstanding (Diluted Average)', 
+        start_date=start_date_datetime_obj)
+
+    # get the sequence of historical values of the pre-specified metric, with
+    # number of shares set
+    metric = metric_graph.get_base(name=metric_name).since(
+        start_date_datetime_obj, metric_class=TotalMetric)
+
+    metric.num_of_shares = num_of_shares.values
+
+    # calculate the historical average price multiple
+    average_price_multiple = \
+        _get_average_price_multiple(quote_history_data=quote_history_data,
+                                    metric_per_share_data=metric.per_share_data,
+                                    estimator=estimator)
+    # return special values if the average price multiple calculations did not 
+    # return valid values
+    if not average_price_multiple:
+        return None, {}, None
+
+    # get the per share data of analyst estimates
+    metric_estimated_per_share_data = _get_estimated_per_share_data(
+        metric_name=metric_name, analyst_estimates=analyst_estimates, 
+        num_of_shares=num_of_shares, start_date=start_date_datetime_obj)
+
     # calculate the normal prices with respect to historical values as well as 
     # the analyst estimated values of the pre-specified metric
     metric_combined_per_share_data = \
@@ -167,11 +194,121 @@ def get_normal_price(metric_name, section_name, start_date, quote_history_data,
         metric_combined_per_share_data}, metric_combined_per_share_data
 
 
+def _get_normal_price_label(average_price_multiple):
+    """
+    This helper function returns the legend label of normal prices.
+    """
+
+    return 'Normal Price (Ratio {:5.2f})'.format(average_price_multiple)
+
+
+def encode_series(data, encoding='json'):
+    """
+    This function encodes a time series in a compact columnar form for 
+    client side plotting, and returns a dictionary of:
+        {'x': <timestamps in epoch milliseconds>, 'y': <values>, 
+         'encoding': <encoding>}
+
+    Inputs:
+        'data': a dictionary of "<timestamp>: <value>", where timestamps are 
+                Python datetime objects.
+        'encoding': a string object, either 'json' (defaulted), where 'x' and 
+                    'y' are lists of numbers (NaNs as nulls), or 'base64', 
+                    where 'x' is base64 encoded float64 values, and 'y' is 
+                    base64 encoded float32 values.
+    """
+
+    x = np.array(list(data.keys()), dtype='datetime64[ms]').astype(np.int64)
+    y = np.array(list(data.values()), dtype=float)
+
+    if encoding == 'base64':
+        return {
+            'x': base64.b64encode(x.astype('<f8').tobytes()).decode('ascii'),
+            'y': base64.b64encode(y.astype('<f4').tobytes()).decode('ascii'),
+            'encoding': encoding
+        }
+    elif encoding == 'json':
+        return {
+            'x': x.tolist(),
+            'y': [None if np.isnan(value) else value for value in y.tolist()],
+            'encoding': encoding
+        }
+
+    raise ValueError("Unknown encoding: {}.".format(encoding))
+
+
+def stock_valuation_plot_data(quote_history_data, normal_price_data, 
+                              average_price_multiple, encoding='json', 
+                              max_num_of_points=None):
+    """
+    This function returns the data of a "price" vs "normal price" plot, to be 
+    swapped into the data sources of a plot rendered by stock_valuation_plot 
+    on the client side, instead of rendering a new plot.
+
+    Inputs:
+        Inputs are the same as those of stock_valuation_plot, except for 
+        'encoding', see encode_series.
+    """
+
+    return {
+        'plot_spec': 'valuation',
+        'sources': {
+            'valuation_price': encode_series(
+                downsample_series(quote_history_data, max_num_of_points), 
+                encoding),
+            'valuation_normal_price': encode_series(normal_price_data, 
+                                                    encoding)
+        },
+        'labels': {
+            'valuation_normal_price_legend': 
+                _get_normal_price_label(average_price_multiple)
+        }
+    }
+
+
+def valuation_price_range_data(quote_history_data, start_date, end_date, 
+                               max_num_of_points=None, encoding='json'):
+    """
+    This function returns the price data of a "price" vs "normal price" plot 
+    for the given date range only, to be swapped into the plot on the client 
+    side after zooming in, so that the plot shows exact prices once the range 
+    is short enough.
+
+    Inputs:
+        'quote_history_data': a dictionary of "<timestamp>: <price>" for the 
+                              whole plot.
+        'start_date': a Python datetime object, the start of the date range.
+        'end_date': a Python datetime object, the end of the date range.
+        'max_num_of_points': an integer defaulted to be None, the maximum 
+                             number of prices to return, see 
+                             downsample_series.
+        'encoding': see encode_series.
+    """
+
+    return {
+        'plot_spec': 'valuation',
+        'sources': {
+            'valuation_price': encode_series(
+                downsample_series(quote_history_data, max_num_of_points, 
+                                  start_date=start_date, end_date=end_date), 
+                encoding)
+        },
+        'labels': {}
+    }
+
+
 def stock_valuation_plot(quote_history_data, normal_price_data, 
-                         average_price_multiple):
+                         average_price_multiple, max_num_of_points=None):
     """
     This function sets up the payload needed for BokehJS to render 
     a "price" vs "normal price" plot against timestamps.
+
+    Prices are downsampled to at most 'max_num_of_points' points (all prices 
+    are plotted if None), see downsample_series. The plot can be zoomed in 
+    along the time axis by dragging over it, and reset by double tapping; on 
+    each change of the time range, the page function 
+    on_valuation_range_change(start, end) is called if defined, so that 
+    prices of the range can be requested (see valuation_price_range_data).
     """
 
     # set up tooltips & formats
@@ -186,43 +323,58 @@ def stock_valuation_plot(quote_history_data, normal_price_data,
         }
     )
 
+    # set up zooming along the time axis only
+    zoom_tool = BoxZoomTool(dimensions='width')
+
     # initiate a Bokeh figure object
     p = figure(width=650,
                height=400,
                x_axis_type='datetime',
                x_axis_label='Time',
                y_axis_label='Price',
-               tools=[hover_tool])
+               tools=[hover_tool, zoom_tool])
 
-    # deactivate the Bokeh toolbar
+    # deactivate the Bokeh toolbar, while keeping zooming active
     p.toolbar_location = None
-
-    # add a line for quote history
-    p.line(list(quote_history_data.keys()),
-           list(quote_history_data.values()),
+    p.toolbar.active_drag = zoom_tool
+
+    # reset the plot on double taps, and pass changes of the time range on 
+    # to the page
+    p.js_on_event(DoubleTap, CustomJS(args={'p': p}, code='p.reset.emit();'))
+    range_callback = CustomJS(code="""
+        if (typeof on_valuation_range_change === 'function') {
+            on_valuation_range_change(cb_obj.start, cb_obj.end);
+        }
+    """)
+    p.x_range.js_on_change('start', range_callback)
+    p.x_range.js_on_change('end', range_callback)
+
+    # add a line for quote history; data sources are named, so that data 
+    # can be swapped on the client side (see stock_valuation_plot_data)
+    price_data = downsample_series(quote_history_data, max_num_of_points)
+    price_source = ColumnDataSource(
+        data={'x': list(price_data.keys()), 'y': list(price_data.values())},
+        name='valuation_price')
+    p.line('x', 'y', source=price_source,
            legend_label='Stock Price',
            color='black',
            line_width=2)
 
     # add a line for "normal prices" by year
-    p.line(list(normal_price_data.keys()),
-           list(normal_price_data.values()),
-           legend_label = 'Normal Price (Ratio {:5.2f})'.format(
-               average_price_multiple),
+    normal_price_source = ColumnDataSource(
+        data={'x': list(normal_price_data.keys()), 
+              'y': list(normal_price_data.values())},
+        name='valuation_normal_price')
+    p.line('x', 'y', source=normal_price_source,
+           legend_label = _get_normal_price_label(average_price_multiple),
            line_width = 2)
+    p.legend.items[-1].name = 'valuation_normal_price_legend'
 
     # add markers on top of the line for "normal prices"
-    p.dot(list(normal_price_data.keys()),
-          list(normal_price_data.values()),
-          size=25)
+    p.dot('x', 'y', source=normal_price_source, size=25)
     
     # shade the area under the line for "normal prices"
-    p.varea(
-        x=list(normal_price_data.keys()),
-        y1=0,
-        y2=list(normal_price_data.values()),
-        alpha=0.2
-    )
+    p.varea(x='x', y1=0, y2='y', source=normal_price_source, alpha=0.2)
 
     # customizations
     p.title.align = 'center'
@@ -242,7 +394,8 @@ def stock_valuation_plot(quote_history_data, normal_price_data,
     return payload
 
 
-def get_valplot_dates(quote_history, financials_history, num_of_years=20):
+def get_valplot_dates(quote_history, metric_graph, num_of_years=20, 
+                      spans=None):
     """
     This function calculates and returns dates needed to filter the quote 
     history and the financials history for stock valuation plotting, as well as 
@@ -256,40 +409,29 @@ def get_valplot_dates(quote_history, financials_history, num_of_years=20):
     Inputs:
         'quote_history': a dictionary object, and each item in it looks like 
                          "<timestamp>: <price>".
-        'financials_history': a dictionary object, which for now holds the 
-                              payload data returned by the GuruFocus API for 
-                              historical financials .
+        'metric_graph': a MetricGraph object, built from the payload data of 
+                        historical financials.
         'num_of_years': # of years of quote history intended to be included in 
                         valuation plotting. But the actual # of years available 
                         for valuation plotting might be less than this number.
+        'spans': a DataSpans object of the quote history and the financials 
+                 history, defaulted to None. When given, such as the spans 
+                 saved with a stock, 'quote_history' and 'metric_graph' are 
+                 not needed, and no data is parsed.
     """
 
-    # get the earliest and latest dates in the quote history data
-    earliest_date_quote = min(quote_history.keys())
-    latest_date_quote = max(quote_history.keys())
-
-    # get the earliest and latest dates in the financial history data
-
-    # in order to properly preprocess the payload data returned by the 
-    # financials API, create a metric object using the payload, and then get 
-    # the timestamps from the metric object
-    num_of_shares = \
-        Metric(name='Shares Outstanding (Diluted Average)',
-               timestamps=financials_history['financials']['annuals']\
-                   ['Fiscal Year'],
-               values=financials_history['financials']['annuals']\
-                   ['income_statement']['Shares Outstanding (Diluted Average)'],
-               start_date=datetime(1900, 1, 1))
-    earliest_date_financials = min(num_of_shares.timestamps)
-    latest_date_financials = max(num_of_shares.timestamps)
-
-    # get the maximum number of years of overlap between the quote and the 
-    # financials history data, which is an integer and the floor of the years 
-    # delta 
-    earliest_date_overlap = max(earliest_date_financials, earliest_date_quote)
-    latest_date_overlap = min(latest_date_financials, latest_date_quote)
-    max_years_overlap = int(
-        (latest_date_overlap - earliest_date_overlap).days / 365.2425)
+    # get the earliest and latest dates in the quote history data and the 
+    # financials history data
+    if spans is None:
+        spans = get_data_spans(quote_history=quote_history, 
+                               metric_graph=metric_graph)
+    earliest_date_quote = spans.first_quote_date
+
+    # get the overlap between the quote and the financials history data
+    earliest_date_overlap = max(spans.first_fiscal_period, 
+                                spans.first_quote_date)
+    latest_date_overlap = min(spans.last_fiscal_period, spans.last_quote_date)
+    max_years_overlap = spans.max_years_overlap
 
     # set the end date to utcnow, in the format of '%m-%d-%Y'
     now = datetime.utcnow()
@@ -313,7 +455,8 @@ def get_valplot_dates(quote_history, financials_history, num_of_years=20):
            max_years_overlap
 
 
-def get_durations(quote_history, financials_history, min_years=3, max_years=20):
+def get_durations(quote_history, metric_graph, min_years=3, max_years=20, 
+                  spans=None):
     """
     This function returns a list of acceptable durations for stock valuation 
     plotting.
@@ -330,39 +473,366 @@ def get_durations(quote_history, financials_history, min_years=3, max_years=20):
     Inputs:
         'quote_history': a dictionary object, and each item in it looks like 
                          "<timestamp>: <price>".
-        'financials_history': a dictionary object, which for now holds the 
-                              payload data returned by the GuruFocus API for 
-                              historical financials .
+        'metric_graph': a MetricGraph object, built from the payload data of 
+                        historical financials.
         'min_years': an integer defaulted to be 3, the minimum number of years 
                      allowed for the average price multiple calculation.
         'max_years': an integer defaulted to be 20, the maximum number of years 
                      allowed for the average price multiple calculation.
+        'spans': a DataSpans object, defaulted to None, see get_valplot_dates.
     """
 
     # get the total number of years that can possibly be used for valuation 
     # plotting, based on the input quote history and the input financials 
     # history data
-    _, _, _, max_years_overlap = get_valplot_dates(
-        quote_history=quote_history, financials_history=financials_history)   
-
-    # get the maximum number of years allowed for average price multiple 
-    # calculation, which is the lesser of the two below:
-    #   (1) the max # years overlap between the quote and the financials history
-    #   (2) the max # years allowed passed as an input
-    max_duration = min(max_years_overlap, max_years)
-
-    # return None if the maximum number of years allowed derived above is less 
-    # than the minimum number of years allowed passed as an input
-    if max_duration < min_years:
-        return None
+    if spans is None:
+        spans = get_data_spans(quote_history=quote_history, 
+                               metric_graph=metric_graph)
+
+    return get_allowed_durations(max_years_overlap=spans.max_years_overlap, 
+                                 min_years=min_years, max_years=max_years)
+
+
+# results of stock valuation for a metric and a duration; 'quote_history_data' 
+# is the subset of quote history used for plotting
+ValuationResult = namedtuple('ValuationResult', [
+    'average_price_multiple', 'normal_price_data', 'valuation_metric_data', 
+    'quote_history_data', 'start_date_quote_history', 
+    'start_date_financials_history'])
+
+
+class ValuationEngine(object):
+    """
+    This class implements an engine that calculates average price multiples 
+    and normal prices of a stock for all valuation metrics and all durations 
+    at once, so that switching between durations or metrics is a lookup.
+
+    For each metric, valuation ratios are calculated once over the full quote 
+    history. The ratios used for any duration are a contiguous range of them, 
+    so the trimmed average price multiple of each duration is derived from 
+    cumulative sums of the ratios, and sums of the lowest and the highest 
+    ratios of each range.
+    """
+
+    # metrics supported for stock valuation
+    metric_names = ['Revenue', 'EBIT', 'EBITDA', 'Net Income']
+
+    def __init__(self, quote_history, metric_graph, analyst_estimates, 
+                 min_years=3, max_years=20, min_num_of_ratios=36, 
+                 num_of_outliers=12, spans=None):
+        """
+        Constructor.
+
+        Inputs:
+            'quote_history': a dictionary object, and each item in it looks 
+                             like "<timestamp>: <price>".
+            'metric_graph': a MetricGraph object, built from the payload data 
+                            of historical financials.
+            'analyst_estimates': the analyst estimates data of the stock.
+            'min_years' & 'max_years': the range of durations (in years) 
+                                       allowed, see get_durations.
+            'min_num_of_ratios': minimum number of ratios needed to calculate 
+                                 the average valuation ratios, before removing 
+                                 outliers
+            'num_of_outliers': number of the highest ratios, and of the lowest 
+                               ratios, to remove before averaging
+            'spans': a DataSpans object of the quote history and the 
+                     financials history, defaulted to None. When None, it is 
+                     derived from the data.
+        """
+
+        self.quote_history = quote_history
+        self.metric_graph = metric_graph
+        self.analyst_estimates = analyst_estimates
+        self.min_num_of_ratios = min_num_of_ratios
+        self.num_of_outliers = num_of_outliers
+
+        # build the quote grid in chronological order, and get the allowed 
+        # durations
+        self.quote_grid = QuoteGrid(dict(sorted(quote_history.items())))
+        self.spans = spans or get_data_spans(quote_history=quote_history, 
+                                             metric_graph=metric_graph)
+        self.durations = get_durations(
+            quote_history=None, metric_graph=None, min_years=min_years, 
+            max_years=max_years, spans=self.spans)
+
+        # the end date is the same for all durations
+        _, _, self.end_date, self.max_years_overlap = get_valplot_dates(
+            quote_history=None, metric_graph=None, spans=self.spans)
+        self.end_datetime = datetime.strptime(self.end_date, '%m-%d-%Y')
+
+        self._dates = {}
+        self._metric_data = {}
+        self._average_price_multiples = {}
+        self._results = {}
+
+        # precompute average price multiples of all metrics and durations; 
+        # metrics missing from the financials history are skipped here, and 
+        # only raise errors if requested
+        for metric_name in self.metric_names:
+            try:
+                for num_of_years in (self.durations or []):
+                    self.get_average_price_multiple(metric_name, num_of_years)
+            except KeyError:
+                continue
+
+    def _get_dates(self, num_of_years):
+        """
+        This method returns the start dates of quote history and financials 
+        history for valuation plotting over the given number of years.
+        """
+
+        # every duration beyond the max # of years overlap uses all data
+        key = min(num_of_years, self.max_years_overlap + 1)
+        if key not in self._dates:
+            start_date_quote_history, start_date_financials_history, _, _ = \
+                get_valplot_dates(quote_history=None, metric_graph=None, 
+                                  num_of_years=num_of_years, 
+                                  spans=self.spans)
+            self._dates[key] = (start_date_quote_history, 
+                                start_date_financials_history)
+
+        return self._dates[key]
+
+    def _get_metric_data(self, metric_name):
+        """
+        This method calculates and returns data of the given metric shared by 
+        all durations, including the per share data, valuation ratios over 
+        the full quote history, and their cumulative and extreme sums.
+        """
+
+        if metric_name in self._metric_data:
+            return self._metric_data[metric_name]
+
+        # get the full history of the metric and its per share data
+        num_of_shares = self.metric_graph.get(
+            name='Shares Outstanding (Diluted Average)')
+        metric = self.metric_graph.get_base(name=metric_name).since(
+            datetime(1900, 1, 1), metric_class=TotalMetric)
+        metric.num_of_shares = num_of_shares.values
+        per_share_data = metric.per_share_data
+
+        # get valuation ratios of all months, up to the end date
+        valuation_ratios = get_valuation_ratio_arrays(
+            quote_history_data=self.quote_grid, 
+            metric_per_share_data=per_share_data)
+        timestamps = np.array(valuation_ratios.timestamps, 
+                              dtype='datetime64[us]')
+        end = np.searchsorted(timestamps, 
+                              np.datetime64(self.end_datetime, 'us'), 
+                              side='right')
+        ratios = valuation_ratios.ratios[:end]
+
+        # get the timestamp of the earliest fiscal year each ratio depends on, 
+        # which is the previous fiscal year for months up to the last month 
+        # of the fiscal year, and the current fiscal year otherwise
+        fiscal_year_timestamps = {timestamp.year: timestamp 
+                                  for timestamp in per_share_data}
+        last_month_fiscal_years = list(per_share_data.keys())[-1].month \
+            if per_share_data else 12
+        earliest_fiscal_timestamps = np.array([
+            fiscal_year_timestamps[timestamp.year - 1 if 
+                timestamp.month <= last_month_fiscal_years else 
+                timestamp.year]
+            for timestamp in valuation_ratios.timestamps[:end]], 
+            dtype='datetime64[us]')
+
+        lowest_sums, highest_sums = get_suffix_extreme_sums(
+            ratios.tolist(), self.num_of_outliers)
+        self._metric_data[metric_name] = {
+            'num_of_shares': num_of_shares,
+            'per_share_data': per_share_data,
+            'estimated_per_share_data': _get_estimated_per_share_data(
+                metric_name=metric_name, 
+                analyst_estimates=self.analyst_estimates, 
+                num_of_shares=num_of_shares, 
+                start_date=datetime(1900, 1, 1)),
+            'timestamps': timestamps[:end],
+            'earliest_fiscal_timestamps': earliest_fiscal_timestamps,
+            'ratios': ratios,
+            'cumulative_sums': np.concatenate([[0.], np.cumsum(ratios)]),
+            'lowest_sums': lowest_sums,
+            'highest_sums': highest_sums
+        }
+
+        return self._metric_data[metric_name]
+
+    def get_average_price_multiple(self, metric_name, num_of_years, 
+                                   estimator='trimmed_mean'):
+        """
+        This method returns the average price multiple of the given metric 
+        over the given number of years; it returns None if there are not 
+        enough ratios.
+
+        The default estimator, 'trimmed_mean', removes the highest and the 
+        lowest ratios using the precomputed sums; other estimators (see 
+        get_normal_price) are applied to the ratios of the time window.
+        """
+
+        start_date_quote_history, start_date_financials_history = \
+            self._get_dates(num_of_years)
+        key = (metric_name, start_date_quote_history, 
+               start_date_financials_history, estimator)
+        if key in self._average_price_multiples:
+            return self._average_price_multiples[key]
+
+        # ratios in the time window are those of months since the start date 
+        # of quote history, that only depend on fiscal years after the start 
+        # date of financials history
+        metric_data = self._get_metric_data(metric_name)
+        start = max(
+            np.searchsorted(
+                metric_data['timestamps'], 
+                np.datetime64(datetime.strptime(
+                    start_date_quote_history, '%m-%d-%Y'), 'us'), 
+                side='left'),
+            np.searchsorted(
+                metric_data['earliest_fiscal_timestamps'], 
+                np.datetime64(datetime.strptime(
+                    start_date_financials_history, '%m-%d-%Y'), 'us'), 
+                side='right'))
+        end = len(metric_data['timestamps'])
+        num_of_ratios = end - start
+
+        # discard valualtion ratio calculations if the total number of valid 
+        # ratios is too little
+        if num_of_ratios < self.min_num_of_ratios:
+            average_price_multiple = None
+        elif estimator != 'trimmed_mean':
+            average_price_multiple = get_estimator(estimator)(
+                metric_data['ratios'][start:end])
+        else:
+            average_price_multiple = float(
+                (metric_data['cumulative_sums'][end] - 
+                 metric_data['cumulative_sums'][start] - 
+                 metric_data['lowest_sums'][start] - 
+                 metric_data['highest_sums'][start]) / 
+                (num_of_ratios - 2 * self.num_of_outliers))
+
+        self._average_price_multiples[key] = average_price_multiple
+
+        return average_price_multiple
+
+    def get(self, metric_name, num_of_years, estimator='trimmed_mean'):
+        """
+        This method returns a ValuationResult object of the given metric over 
+        the given number of years.
+
+        Inputs:
+            'metric_name': name of the valuation metric, such as 'Revenue'.
+            'num_of_years': # of years of quote history intended to be 
+                            included in valuation plotting, see 
+                            get_valplot_dates.
+            'estimator': the estimator of the average price multiple, see 
+                         get_normal_price. Defaulted to 'trimmed_mean'.
+        """
+
+        start_date_quote_history, start_date_financials_history = \
+            self._get_dates(num_of_years)
+        key = (metric_name, start_date_quote_history, 
+               start_date_financials_history, estimator)
+        if key in self._results:
+            return self._results[key]
+
+        # get the subset of quote history data for plotting
+        start_datetime_quote_history = datetime.strptime(
+            start_date_quote_history, '%m-%d-%Y')
+        quote_history_data = {
+            timestamp: price for (timestamp, price) in 
+            self.quote_history.items() 
+            if start_datetime_quote_history <= timestamp <= self.end_datetime}
+
+        average_price_multiple = self.get_average_price_multiple(
+            metric_name, num_of_years, estimator=estimator)
+        if not average_price_multiple:
+            result = ValuationResult(
+                None, {}, None, quote_history_data, start_date_quote_history, 
+                start_date_financials_history)
+        else:
+
+            # calculate the normal prices with respect to historical values 
+            # as well as the analyst estimated values of the metric, after 
+            # the start date of financials history
+            metric_data = self._get_metric_data(metric_name)
+            start_datetime_financials_history = datetime.strptime(
+                start_date_financials_history, '%m-%d-%Y')
+            metric_combined_per_share_data = {
+                timestamp: value for (timestamp, value) in 
+                {**metric_data['per_share_data'], 
+                 **metric_data['estimated_per_share_data']}.items()
+                if timestamp > start_datetime_financials_history}
+            normal_price_data = {
+                timestamp: max(0, average_price_multiple * 
+                               metric_combined_per_share_data[timestamp]) 
+                for timestamp in metric_combined_per_share_data}
+            result = ValuationResult(
+                average_price_multiple, normal_price_data, 
+                metric_combined_per_share_data, quote_history_data, 
+                start_date_quote_history, start_date_financials_history)
+
+        self._results[key] = result
+
+        return result
+
+
+# valuation engines kept in process, by stock symbol and versions of the 
+# payloads they were built from; the oldest engines are dropped first
+_valuation_engines = OrderedDict()
+_max_num_of_valuation_engines = 32
+
+
+def get_valuation_data_versions(stock):
+    """
+    This function returns a tuple of values identifying the versions of data 
+    used for stock valuation of the input stock: the timestamps of the last 
+    updates of the payloads used, and today's date (since valuation plots 
+    end today).
+    """
+
+    return (stock.last_financials_history_update, 
+            stock.last_quote_history_update, 
+            stock.last_analyst_estimates_update, datetime.utcnow().date())
+
+
+def get_valuation_engine(stock):
+    """
+    This function returns a ValuationEngine object for the input stock, 
+    built from its saved payloads (refreshed first if needed).
+
+    Engines are kept in process by the versions of the payloads, so repeated 
+    requests for other durations or metrics of the same stock reuse the 
+    precomputed results.
+
+    Inputs:
+        'stock': a Stock object.
+    """
+
+    # refresh the payloads if needed, and get the analyst estimates data
+    stock.refresh_financials_history()
+    stock.refresh_quote_history()
+    analyst_estimates = stock.get_analyst_estimates_data()
+
+    key = (stock.symbol,) + get_valuation_data_versions(stock)
+    if key in _valuation_engines:
+        _valuation_engines.move_to_end(key)
+        return _valuation_engines[key]
 
-    # return all allowed durations (in years) in a list
-    return [(value + 1) for value in \
-            range(max_duration) if (value + 1) >= min_years]
+    engine = ValuationEngine(
+        quote_history=stock.get_quote_history_data(start_date='01-01-1800', 
+                                                   end_date='01-01-9999'),
+        metric_graph=stock.get_metric_graph(),
+        analyst_estimates=analyst_estimates, 
+        spans=stock.get_data_spans())
+    engine.data_versions = key[1:]
+    _valuation_engines[key] = engine
+    while len(_valuation_engines) > _max_num_of_valuation_engines:
+        _valuation_engines.popitem(last=False)
+
+    return engine
 
 
 def timeseries_plot(name, data_list, symbols, 
-                    start_date=datetime(1900, 1, 1)):
+                    start_date=datetime(1900, 1, 1), max_num_of_points=None):
     """
     This function constructs a time-series plot for data included in the input 
     list, for timestamps after the given start date.
@@ -377,6 +847,10 @@ def timeseries_plot(name, data_list, symbols,
                    the dictionary object in the same location from 'data_list'.
         'start_date': a Python datetime object. Only data after this date will 
                       be used for plotting.
+        'max_num_of_points': an integer defaulted to be None, the maximum 
+                             number of points plotted for each set of data, 
+                             see downsample_series. All data is plotted if 
+                             None.
     """
 
     # validate inputs
@@ -426,21 +900,29 @@ def timeseries_plot(name, data_list, symbols,
         if i == 0:
             output_data = data
 
-        # add a line for quote history
-        p.line(list(data.keys()),
-               list(data.values()),
+        # add a line for quote history; data sources are named, so that data 
+        # can be swapped on the client side (see timeseries_plot_data)
+        plotted_data = downsample_series(data, max_num_of_points)
+        source = ColumnDataSource(
+            data={'x': list(plotted_data.keys()), 
+                  'y': list(plotted_data.values())},
+            name='timeseries_{}'.format(i))
+        p.line('x', 'y', source=source,
                legend_label=symbols[i] + ': ' + name,
                color=color,
                line_width=2)
 
         # add markers on top of the line
-        p.dot(list(data.keys()), list(data.values()), size=25, color=color)
+        p.dot('x', 'y', source=source, size=25, color=color)
 
-        # add a horizontal line for the average of y's
+        # add a horizontal line for the average of y's, of all data
+        average_source = ColumnDataSource(
+            data={'x': list(plotted_data.keys()), 
+                  'y': [mean(data.values())]*len(plotted_data.keys())},
+            name='timeseries_average_{}'.format(i))
         list_average_lines.append(
             p.line(
-                list(data.keys()), 
-                [mean(data.values())]*len(data.keys()),
+                'x', 'y', source=average_source,
                 color=color,
                 line_dash="dashed",
                 line_width=3
@@ -485,3 +967,39 @@ def timeseries_plot(name, data_list, symbols,
     payload['div'] = div
 
     return payload, output_data
+
+
+def timeseries_plot_data(data_list, symbols, start_date=datetime(1900, 1, 1), 
+                         encoding='json', max_num_of_points=None):
+    """
+    This function returns the data of a time-series plot, to be swapped into 
+    the data sources of a plot rendered by timeseries_plot (for the same 
+    symbols) on the client side, instead of rendering a new plot.
+
+    Inputs:
+        Inputs are the same as those of timeseries_plot, except for 
+        'encoding', see encode_series.
+    """
+
+    # validate inputs
+    if len(data_list) != len(symbols):
+        raise ValueError('The lengths of data_list and symbols must be equal.')
+
+    sources = {}
+    for i in range(len(data_list)):
+        data = {
+            timestamp: data_list[i][timestamp] for timestamp in data_list[i] 
+            if timestamp >= start_date
+        }
+        plotted_data = downsample_series(data, max_num_of_points)
+        sources['timeseries_{}'.format(i)] = encode_series(plotted_data, 
+                                                           encoding)
+        sources['timeseries_average_{}'.format(i)] = encode_series(
+            dict.fromkeys(plotted_data, mean(data.values())), encoding)
+
+    return {
+        'plot_spec': 'timeseries',
+        'symbols': list(symbols),
+        'sources': sources,
+        'labels': {}
+    }
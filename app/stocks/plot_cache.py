@@ -0,0 +1,73 @@
+import json
+import redis
+from collections import OrderedDict
+from flask import current_app
+
+
+# rendered plot payloads kept in process, by cache key; the least recently
+# used payloads are dropped first
+_plot_payloads = OrderedDict()
+_max_num_of_plot_payloads = 256
+
+
+def get_plot_payload_key(kind, symbols, data_versions, **params):
+    """
+    This function returns the cache key of a plot payload.
+
+    Inputs:
+        'kind': a string object, the kind of plot, such as 'valuation'.
+        'symbols': a sequence of stock symbols included in the plot.
+        'data_versions': a sequence of values identifying the versions of data
+                         plotted, such as timestamps of the last updates of
+                         payloads; each value is converted to a string.
+        'params': other parameters of the plot, such as the duration and the
+                  valuation metric.
+    """
+
+    return 'plot:{}:{}:{}:{}'.format(
+        kind, ','.join(symbols), ','.join(str(v) for v in data_versions),
+        ','.join('{}={}'.format(name, params[name]) for name in sorted(params)))
+
+
+def get_cached_plot_payload(key, build, expiration_seconds=86400):
+    """
+    This function returns the plot payload of the given cache key, which is
+    looked up in process first, and then in Redis. The payload is built by
+    calling the input function only if it is not cached, and then cached in
+    both places.
+
+    A copy of the payload is returned, so callers can add items to it.
+
+    Inputs:
+        'key': the cache key, see get_plot_payload_key.
+        'build': a function that builds and returns the plot payload, which
+                 should be a JSON serializable dictionary.
+        'expiration_seconds': number of seconds to keep a payload in Redis.
+                              Defaulted to 86400.
+    """
+
+    # look up the payload in process
+    if key in _plot_payloads:
+        _plot_payloads.move_to_end(key)
+        return dict(_plot_payloads[key])
+
+    # look up the payload in Redis, and build it if not found
+    try:
+        data = current_app.redis.get(key)
+    except redis.exceptions.RedisError:
+        data = None
+    if data:
+        payload = json.loads(data)
+    else:
+        payload = build()
+        try:
+            current_app.redis.set(key, json.dumps(payload),
+                                  ex=expiration_seconds)
+        except redis.exceptions.RedisError:
+            pass
+
+    _plot_payloads[key] = payload
+    while len(_plot_payloads) > _max_num_of_plot_payloads:
+        _plot_payloads.popitem(last=False)
+
+    return dict(payload)
@@ -1,6 +1,7 @@
 import json
 import re
 from time import time
+from hashlib import md5
 from datetime import datetime
 from langdetect import detect, LangDetectException
 from flask import flash, redirect, url_for, render_template, request, \
@@ -10,14 +11,162 @@ from app import db
 from app.models import Stock, StockNote, Post
 from app.main.forms import EmptyForm, SearchForm, SubmitPostForm
 from app.stocksdata import get_company_profile, search_stocks_by_symbol, \
-                           section_lookup_by_metric
+                           get_quote
 from app.fundamental_analysis import get_estimated_return, \
                                      get_fundamental_start_date
 from app.stocks import bp
-from app.stocks.plot import get_valplot_dates, get_durations, \
-                            get_normal_price, stock_valuation_plot, \
-                            timeseries_plot
+from app.stocks.plot import get_valuation_engine, stock_valuation_plot, \
+                            stock_valuation_plot_data, timeseries_plot, \
+                            timeseries_plot_data, \
+                            valuation_price_range_data, \
+                            get_valuation_data_versions
 from app.stocks.forms import NoteForm, CompareForm
+from app.quote_cache import get_cached_quote, set_cached_quote
+from app.streaming import add_stream_viewer
+from app.stocks.plot_cache import get_cached_plot_payload, \
+                                  get_plot_payload_key
+from app.robust_stats import estimators
+
+
+def _get_plot_mode():
+    """
+    This helper function returns the plot mode and the data encoding of plot 
+    payloads requested, from request arguments 'plot_mode' and 'encoding'.
+
+    The plot mode is either 'bokeh' (default), for a full payload rendered by 
+    Bokeh, or 'data', for only the plot data; the encoding is either 'json' 
+    (default) or 'base64', see encode_series.
+    """
+
+    plot_mode = request.args.get('plot_mode', 'bokeh', type=str)
+    encoding = request.args.get('encoding', 'json', type=str)
+
+    return 'data' if plot_mode == 'data' else 'bokeh', \
+        'base64' if encoding == 'base64' else 'json'
+
+
+def _get_max_num_of_points():
+    """
+    This helper function returns the maximum number of points to plot for 
+    each time series, from the request argument 'width' - the width of the 
+    plot on the page in pixels - so that no more than one point is plotted 
+    per pixel, regardless of the length of time series.
+    """
+
+    width = request.args.get(
+        'width', current_app.config['PLOT_WIDTH_DEFAULT'], type=int)
+
+    return min(max(width, 100), current_app.config['PLOT_WIDTH_MAX'])
+
+
+def _get_epoch_date(name):
+    """
+    This helper function returns the date of the given request argument in 
+    epoch milliseconds (as used by BokehJS), as a Python datetime object, or 
+    None if the argument is missing or out of range.
+    """
+
+    value = request.args.get(name, None, type=float)
+    if value is None:
+        return None
+
+    try:
+        return datetime.utcfromtimestamp(value / 1000)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def _get_estimator():
+    """
+    This helper function returns the name of the estimator of average price 
+    multiples requested, from the request argument 'estimator', falling back 
+    to the default for unknown estimators.
+    """
+
+    estimator = request.args.get(
+        'estimator', 
+        current_app.config['STOCK_VALUATION_ESTIMATOR_DEFAULT'], 
+        type=str)
+    if estimator not in estimators:
+        estimator = current_app.config['STOCK_VALUATION_ESTIMATOR_DEFAULT']
+
+    return estimator
+
+
+def _get_valuation_payload(stock, valuation_engine, valuation_metric, 
+                           num_of_years, estimator, plot_mode, encoding, 
+                           max_num_of_points):
+    """
+    This helper function returns the payload of the stock valuation plot, 
+    including the plot (see _get_plot_mode), the estimated return and the data 
+    of the associated valuation metric, as well as a flag 'valid_plot', which 
+    is 0 (with nothing else in the payload) if not enough data was available 
+    to calculate the average historical price multiple.
+    """
+
+    # get the historical average price multiple with respect to the chosen 
+    # metric, and the associated normal prices, as well as the subset of 
+    # quote history data to be used for plotting
+    valuation = valuation_engine.get(metric_name=valuation_metric, 
+                                     num_of_years=num_of_years, 
+                                     estimator=estimator)
+    average_price_multiple = valuation.average_price_multiple
+    normal_price_data = valuation.normal_price_data
+    valuation_metric_data = valuation.valuation_metric_data
+    quote_history_valplotting = valuation.quote_history_data
+
+    # return an otherwise empty payload, except for a flag indicating no 
+    # valid plot in the paylod, if not enough data was available 
+    if not average_price_multiple:
+        return {'valid_plot': 0}
+
+    # get the plot payload; in the data mode, only the plot data is returned 
+    # to be swapped into the plot on the page
+    if plot_mode == 'data':
+        plot = stock_valuation_plot_data(
+            quote_history_data=quote_history_valplotting,
+            normal_price_data=normal_price_data,
+            average_price_multiple=average_price_multiple,
+            encoding=encoding, max_num_of_points=max_num_of_points)
+
+    # otherwise the plot is only rendered by Bokeh if not cached for the same 
+    # data versions and plot parameters
+    else:
+        plot = get_cached_plot_payload(
+            key=get_plot_payload_key(
+                kind='valuation', symbols=[stock.symbol], 
+                data_versions=valuation_engine.data_versions, 
+                start_date=valuation.start_date_quote_history, 
+                valuation_metric=valuation_metric, estimator=estimator, 
+                max_num_of_points=max_num_of_points),
+            build=lambda: stock_valuation_plot(
+                quote_history_data=quote_history_valplotting,
+                normal_price_data=normal_price_data,
+                average_price_multiple=average_price_multiple,
+                max_num_of_points=max_num_of_points))
+
+    # add a flag to the paylod indicating a valid plot
+    plot['valid_plot'] = 1
+
+    # add to the paylod the updated estimated return, specific to the updated 
+    # valuation plot 
+    plot['estimated_return'] = \
+        get_estimated_return(quote_history_data=quote_history_valplotting, 
+                             normal_price_data=normal_price_data, 
+                             dividend_yield=stock.dividend_yield)
+
+    # add to the paylod the data of the associated valuation metric
+    plot['valuation_metric_data'] = {
+        timestamp.strftime('%m%y'): valuation_metric_data[timestamp] 
+        for timestamp in valuation_metric_data}
+
+    return plot
+
+
+# endpoints only reading saved or cached data (or polled frequently), which 
+# skip the per-request operations of before_request (and its commit)
+_read_only_endpoints = {'stocks.valuation', 'stocks.valuation_plot_range', 
+                        'stocks.quote_polling'}
 
 
 @bp.before_request
@@ -27,6 +176,9 @@ def before_request():
     registered with the app.
     """
 
+    if request.endpoint in _read_only_endpoints:
+        return
+
     if current_user.is_authenticated:
         current_user.last_seen = datetime.utcnow()
         db.session.commit()
@@ -65,12 +217,13 @@ def stock(symbol):
             db.session.add(stock)
             db.session.commit()
 
-    ####################
-    # Update the quote #
-    ####################
+    #########################################
+    # Update the quote and other stock data #
+    #########################################
 
-    stock.update_quote()
-    db.session.commit()
+    # refresh the quote and all other datasets of the stock needed for the 
+    # page that are due, with upstream calls issued concurrently
+    stock.refresh_data()
 
     ################
     # Handle forms #
@@ -111,6 +264,14 @@ def stock(symbol):
         type=str)
     payload_only = request.args.get('payload_only', 0, type=int)
 
+    # get the estimator of average price multiples, see _get_estimator
+    estimator = _get_estimator()
+
+    # get the plot mode and data encoding for payloads, see _get_plot_mode, 
+    # as well as the maximum number of points to plot
+    plot_mode, encoding = _get_plot_mode()
+    max_num_of_points = _get_max_num_of_points()
+
     ###############
     # Posts logic #
     ###############
@@ -147,53 +308,36 @@ def stock(symbol):
     # Prep for valuation plotting, quote details and fundamental analysis #
     #######################################################################
 
-    # get stock data needed for valuation plotting
-    quote_history = stock.get_quote_history_data(
-        start_date='01-01-1800', end_date='01-01-9999')
-    financials_history = stock.get_financials_history_data()
-    analyst_estimates = stock.get_analyst_estimates_data()
+    # get the valuation engine of the stock, which has average price 
+    # multiples of all metrics and durations precomputed, and quote details
+    valuation_engine = get_valuation_engine(stock)
     quote_details = stock.get_quote_details_data()
 
-    # get dates needed for valuation plotting, the subset of quote history data 
-    # to be used for plotting
-    start_date_quote_history, start_date_financials_history, end_date, _ = \
-        get_valplot_dates(
-            quote_history=quote_history, financials_history=financials_history, 
-            num_of_years=num_of_years)
-    quote_history_valplotting = \
-        stock.get_quote_history_data(start_date=start_date_quote_history, 
-                                     end_date=end_date)
-
     # get fundamental indicators, using the financials history data from the 
     # same time window as that used for valuation plotting
     # TODO - check if a different start date for the financials history data 
     # should be used when getting fundamental indicators
     fundamental_indicators = stock.get_fundamental_indicator_data()
 
-    # get the historical average price multiple with respect to the chosen 
-    # metric, and the associated normal prices
-    average_price_multiple, normal_price_data, valuation_metric_data = \
-        get_normal_price(
-            metric_name=valuation_metric,
-            section_name=section_lookup_by_metric[valuation_metric],
-            start_date=start_date_financials_history,
-            quote_history_data=quote_history_valplotting,
-            financials_history=financials_history,
-            analyst_estimates=analyst_estimates
-        )
+    # get the payload of the valuation plot; the plot is always rendered by 
+    # Bokeh for the full template
+    plot = _get_valuation_payload(
+        stock=stock, valuation_engine=valuation_engine, 
+        valuation_metric=valuation_metric, num_of_years=num_of_years, 
+        estimator=estimator, 
+        plot_mode=plot_mode if payload_only else 'bokeh', 
+        encoding=encoding, max_num_of_points=max_num_of_points)
+
+    #################################################
+    # Return only the plot payload for if requested #
+    #################################################
+    
+    if payload_only:
+        return jsonify(plot)
 
     # return if not enough data was available to calculate the average 
     # historical price multiple
-    if not average_price_multiple:
-
-        if payload_only:
-            # return an otherwise empty payload, except for a flag indicating 
-            # no valid plot in the paylod 
-            plot = {}
-            plot['valid_plot'] = 0
-
-            return jsonify(plot)
-
+    if not plot['valid_plot']:
         return render_template(
             'stocks/stock.html', title="Stock - {}".format(stock.symbol), 
             stock=stock, quote=json.loads(stock.quote_payload), 
@@ -205,39 +349,11 @@ def stock(symbol):
             prev_url=prev_url, post_links=True 
         )
 
-    # get the plot payload 
-    plot = stock_valuation_plot(quote_history_data=quote_history_valplotting,
-                                normal_price_data=normal_price_data,
-                                average_price_multiple=average_price_multiple)
-
-    # add a flag to the paylod indicating a valid plot
-    plot['valid_plot'] = 1
-
-    # add to the paylod the updated estimated return, specific to the updated 
-    # valuation plot 
-    plot['estimated_return'] = \
-        get_estimated_return(quote_history_data=quote_history_valplotting, 
-                             normal_price_data=normal_price_data, 
-                             dividend_yield=stock.dividend_yield)
-
-    # add to the paylod the data of the associated valuation metric
-    plot['valuation_metric_data'] = {
-        timestamp.strftime('%m%y'): valuation_metric_data[timestamp] 
-        for timestamp in valuation_metric_data}
-
-    #################################################
-    # Return only the plot payload for if requested #
-    #################################################
-    
-    if payload_only:
-        return jsonify(plot)
-
     #########################################################
     # Get acceptable durations for stock valuation plotting #
     #########################################################
 
-    durations = get_durations(quote_history=quote_history, 
-                              financials_history=financials_history)
+    durations = valuation_engine.durations
 
     ############################
     # Return the full template #
@@ -257,6 +373,109 @@ def stock(symbol):
     )
 
 
+@bp.route('/stock/<symbol>/valuation')
+@login_required
+def valuation(symbol):
+    """
+    This view function returns the payload of the stock valuation plot, 
+    including the estimated return and the data of the valuation metric (see 
+    _get_valuation_payload), as JSON, for the same request arguments as the 
+    stock view for valuation plotting.
+
+    The endpoint is read-only: only saved data of the stock is used, with no 
+    forms, posts or commits handled (see _read_only_endpoints), while the 
+    stock view keeps the data refreshed. The response has an ETag derived from 
+    the versions of data used and the request arguments, so that conditional 
+    requests are answered with 304 before any valuation is done.
+    """
+
+    # only saved data is used, with nothing fetched or committed
+    stock = Stock.query.filter_by(symbol=symbol.upper()).first_or_404()
+    if not stock.use_saved_data():
+        return jsonify({'valid_plot': 0}), 404
+
+    # get input parameters from the request
+    num_of_years = request.args.get('num_of_years', 20, type=int)
+    valuation_metric = request.args.get(
+        'valuation_metric', 
+        current_app.config['STOCK_VALUATION_METRIC_DEFAULT'], 
+        type=str)
+    estimator = _get_estimator()
+    plot_mode, encoding = _get_plot_mode()
+    max_num_of_points = _get_max_num_of_points()
+
+    # get the ETag from data versions (including the dividend yield used for 
+    # estimated returns) and the parameters of the payload
+    etag = md5(json.dumps(
+        [stock.symbol, stock.last_quote_details_update, 
+         get_valuation_data_versions(stock), num_of_years, valuation_metric, 
+         estimator, plot_mode, encoding, max_num_of_points], 
+        default=str).encode()).hexdigest()
+
+    # return no payload if the client has it already
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    valuation_engine = get_valuation_engine(stock)
+    plot = _get_valuation_payload(
+        stock=stock, valuation_engine=valuation_engine, 
+        valuation_metric=valuation_metric, num_of_years=num_of_years, 
+        estimator=estimator, plot_mode=plot_mode, encoding=encoding, 
+        max_num_of_points=max_num_of_points)
+
+    # let clients cache the payload, but revalidate it on each use
+    response = jsonify(plot)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    return response
+
+
+@bp.route('/stock/<symbol>/valuation_plot_range')
+@login_required
+def valuation_plot_range(symbol):
+    """
+    This view function returns the price data of the stock valuation plot for 
+    a range of time only, in the data mode (see valuation_price_range_data), 
+    so that exact prices are shown after zooming in on the plot.
+
+    Besides the arguments of the stock view for valuation plotting, the range 
+    is given by the request arguments 'start' and 'end', both in epoch 
+    milliseconds; the range is unbounded on a side if not given.
+    """
+
+    # only saved data is used, with nothing fetched or committed
+    stock = Stock.query.filter_by(symbol=symbol.upper()).first_or_404()
+    if not stock.use_saved_data():
+        return jsonify({'valid_plot': 0}), 404
+
+    # get input parameters from the request
+    num_of_years = request.args.get('num_of_years', 20, type=int)
+    valuation_metric = request.args.get(
+        'valuation_metric', 
+        current_app.config['STOCK_VALUATION_METRIC_DEFAULT'], 
+        type=str)
+    _, encoding = _get_plot_mode()
+
+    # get the quote history of the valuation plot
+    valuation = get_valuation_engine(stock).get(
+        metric_name=valuation_metric, num_of_years=num_of_years, 
+        estimator=_get_estimator())
+    if not valuation.average_price_multiple:
+        return jsonify({'valid_plot': 0})
+
+    plot = valuation_price_range_data(
+        quote_history_data=valuation.quote_history_data,
+        start_date=_get_epoch_date('start'), end_date=_get_epoch_date('end'),
+        max_num_of_points=_get_max_num_of_points(), encoding=encoding)
+    plot['valid_plot'] = 1
+
+    return jsonify(plot)
+
+
 @bp.route('/watch/<symbol>', methods=['POST'])
 @login_required
 def watch(symbol):
@@ -334,13 +553,11 @@ def watchlist():
     stocks = current_user.watched.order_by(Stock.symbol.asc()).all()
 
     # only update quotes if the last quote was updated more than 
-    # 300 seconds ago
-    stock_quotes = []
-    for stock in stocks:
-        stock.update_quote(delay=300)
-        db.session.commit()
-        stock_quotes.append({'stock': stock, 
-                             'quote': json.loads(stock.quote_payload)})
+    # 300 seconds ago; quotes of all stocks are fetched concurrently and 
+    # committed once, while stocks without any quote yet are left out 
+    Stock.update_quotes(stocks, delay=300)
+    stock_quotes = [{'stock': stock, 'quote': json.loads(stock.quote_payload)} 
+                    for stock in stocks if stock.quote_payload]
 
     # kick off a background task for quote polling if the task doesn't exist, 
     # and the watchlist is not empty
@@ -411,20 +628,39 @@ def quote_polling():
     symbol = request.args.get('symbol', '', type=str)
     delay = request.args.get('delay', 60, type=int)
 
-    # use the symbol to locate the stock from the database
+    # keep the symbol streamed while it is polled (see app/streaming.py)
+    add_stream_viewer(symbol)
+
+    # answer with the cached quote if it is within the delay (in seconds), 
+    # which is never shorter than the minimum enforced by the server 
+    cached = get_cached_quote(symbol, max_age=delay)
+    if cached:
+        return jsonify({
+            'quote': {'symbol': symbol, 'quote_payload': cached[0]}
+            })
+
+    # otherwise use the symbol to locate the stock from the database
     stock = Stock.query.filter_by(symbol=symbol).first()
     if not stock:
         raise ValueError(
             'Unable to locate {} in the stock database.'.format(symbol))
 
-    # update the quote for the located stock with a pre-specified delay 
-    # (in seconds)
-    stock.update_quote(delay=delay)
-    db.session.commit()
+    # fetch the quote if the saved one is older than the delay, and cache it; 
+    # new quotes are saved to the database in batches, or right away if they 
+    # cannot be queued for saving
+    delay = max(delay, current_app.config['QUOTE_MIN_DELAY_SECONDS'])
+    if stock._is_quote_due(delay=delay):
+        quote = get_quote(symbol)
+        if not set_cached_quote(symbol, quote):
+            stock._save_quote(quote)
+            db.session.commit()
+    else:
+        quote = json.loads(stock.quote_payload)
+        set_cached_quote(symbol, quote, timestamp=stock.last_quote_update, 
+                         unsaved=False)
     
     return jsonify({
-        'quote': {'symbol': symbol,
-                  'quote_payload': json.loads(stock.quote_payload)}
+        'quote': {'symbol': symbol, 'quote_payload': quote}
         })
 
 
@@ -505,49 +741,43 @@ def metric_profile(main_symbol, indicator_name):
     symbols = symbols_to_compare + [main_symbol] if symbols_to_compare \
                                                  else [main_symbol]
 
+    # retrieve all stocks at once, with new stocks added to the app database; 
+    # symbols whose profiles or datasets are not fetched in time are pending, 
+    # to be requested again by the page (see metric.html) 
+    stocks, symbols_invalid, symbols_pending = Stock.get_stocks(symbols)
+
+    # fetch the datasets needed for metrics of all stocks concurrently; the 
+    # stock of the main symbol is never pending, and its missing datasets are 
+    # fetched again when needed
+    symbols_pending += sorted(Stock.refresh_stocks_data(
+        stocks.values(), names=['financials_history', 'quote_history']) - 
+        {main_symbol})
+
     # initialize lists to separately hold valid stock symbols and associated 
     # data (in the form of dictionaries) for plotting
     symbols_valid = []
-    symbols_invalid = []
     plot_dicts_valid = []
+    data_versions = []
 
     # loop through all input symbols
     for symbol in symbols:
 
-        # retrieve the stock database object
-        stock = Stock.query.filter_by(symbol=symbol).first()
-
-        # fetch the stock info and add it to the app database if it has not been 
-        # added
-        if not stock:
-            profile_data = get_company_profile(symbol)
-            if not profile_data:
-                # skip to the next symbol on the list if stock not found
-                symbols_invalid.append(symbol)
-                continue
-            else:
-                stock = Stock(symbol=symbol, name=profile_data['name'])
-                db.session.add(stock)
-                db.session.commit()
+        # skip to the next symbol on the list if stock not found or pending
+        if symbol not in stocks or symbol in symbols_pending:
+            continue
+        stock = stocks[symbol]
 
         # if a corresponding stock can be found, the symbol is appended to the 
         # list of valid symbols; 
         # this list will later be rendered as legends in the metric plot
         symbols_valid.append(symbol)        
 
-        # get all fundamental indicators filtered by dates
-        indicators_data = stock.get_fundamental_indicator_data(
+        # get the payload of the pre-specified indicator, filtered by dates;
+        # only metrics needed for this indicator are extracted
+        indicator_data = stock.get_fundamental_indicator(
+            indicator_name=indicator_name, 
             start_date=start_date.strftime('%m-%d-%Y'), debug=True)
-    
-        # get the payload of the pre-specified indicator
-        try:
-            indicator_data = [
-                indicators_data[section][name]
-                for section in indicators_data 
-                for name in indicators_data[section] 
-                if name==indicator_name
-            ][0]
-        except IndexError:
+        if indicator_data is None:
             flash('Unable to find metric: {}.'.format(indicator_name))
             return redirect(url_for('stocks.stock', symbol=stock.symbol))
 
@@ -556,6 +786,8 @@ def metric_profile(main_symbol, indicator_name):
 
         # prepare for plotting
         plot_dicts_valid.append(dict(zip(metric.timestamps, metric.values)))
+        data_versions += [stock.last_financials_history_update, 
+                          stock.last_quote_history_update]
 
         # some additional derivations; only needed for the stock corresponding 
         # to the main symbol passed as an argument in the url
@@ -570,20 +802,45 @@ def metric_profile(main_symbol, indicator_name):
                 rated_metric.median_10y, rated_metric.pctrank_of_latest_10y = \
                 rated_metric.get_range_info()
 
-    # plot the metric time series, for a valid list of stocks
-    plot, table_data = timeseries_plot(
-        name=metric.name, 
-        data_list=plot_dicts_valid, 
-        symbols=symbols_valid, 
-        start_date=start_date
-    )
+    # get the plot and data mode, and plot the metric time series, for a 
+    # valid list of stocks; in the data mode, only the plot data is returned 
+    # to be swapped into the plot on the page
+    plot_mode, encoding = _get_plot_mode()
+    max_num_of_points = _get_max_num_of_points()
+    if payload_only and plot_mode == 'data':
+        plot = timeseries_plot_data(
+            data_list=plot_dicts_valid, symbols=symbols_valid, 
+            start_date=start_date, encoding=encoding, 
+            max_num_of_points=max_num_of_points)
+
+    # otherwise the plot is only rendered by Bokeh if not cached for the same 
+    # data versions
+    else:
+        plot = get_cached_plot_payload(
+            key=get_plot_payload_key(
+                kind='metric', symbols=symbols_valid, 
+                data_versions=data_versions, indicator_name=indicator_name, 
+                start_date=start_date.isoformat(), 
+                max_num_of_points=max_num_of_points),
+            build=lambda: timeseries_plot(
+                name=metric.name, 
+                data_list=plot_dicts_valid, 
+                symbols=symbols_valid, 
+                start_date=start_date,
+                max_num_of_points=max_num_of_points
+            )[0])
+
+    # the table data is the plotted data of the first valid stock
+    table_data = {timestamp: value for (timestamp, value) in 
+                  plot_dicts_valid[0].items() if timestamp >= start_date}
 
     if payload_only:
         # TODO - add the table data to this payload, after converting the 
         # format of timestamps to strings
         payload = {
             'plot': plot,
-            'symbols_invalid': json.dumps(symbols_invalid)
+            'symbols_invalid': json.dumps(symbols_invalid),
+            'symbols_pending': json.dumps(symbols_pending)
             }
         return jsonify(payload)
     else:
@@ -1,7 +1,10 @@
-import requests
-from datetime import datetime, timedelta
-from flask import current_app
-from yahoo_fin import stock_info
+from app.symbol_filter import is_nonexistent_symbol, reject_symbol
+from app.providers import fetch_dataset
+
+
+# All functions below get market data from the providers configured for each 
+# dataset in DATASET_PROVIDERS (see fetch_dataset in providers.py), so that 
+# vendors can be swapped without changing callers.
 
 
 def search_stocks_by_symbol(query, page, stocks_per_page):
@@ -11,30 +14,20 @@ def search_stocks_by_symbol(query, page, stocks_per_page):
     It returns a list of results given the specified page # and number per 
     page.
 
-    It currently uses the symbol_lookup API from Finnhub.
-
     TODO - think of ways to cache the search results for pagination, to 
     minimize the # of API requests when users paging through search results.
     """
 
-    # check if the api client has been configured
-    if not current_app.finnhub_client:
-        return [], 0
+    return fetch_dataset('symbol_search', query, page, stocks_per_page)
+
+
+def get_stock_symbols(exchange='US'):
+    """
+    This function gets the symbols of all stocks listed on the given 
+    exchange, in a list.
+    """
 
-    # perform the search via an API
-    response = current_app.finnhub_client.symbol_lookup(query)
-    
-    # prepare the search results
-    total = response['count']
-    if not isinstance(page, int) or page < 1:
-        raise ValueError("Invalidate page value.")
-    elif (page - 1) * stocks_per_page < total:
-        matched_symbols = response['result'][
-            ((page - 1) * stocks_per_page):min(page * stocks_per_page, total)]
-    else:
-        matched_symbols = []
-        
-    return matched_symbols, total
+    return fetch_dataset('stock_symbols', exchange)
 
 
 def get_company_profile(symbol):
@@ -42,21 +35,17 @@ def get_company_profile(symbol):
     This function get company info for a given symbol.
     It returns None if the symbol does not exist.
 
-    It currently uses the company_profile2 API from Finnhub.
+    Symbols known not to exist (see is_nonexistent_symbol) are rejected 
+    without any API request, and symbols found not to exist are remembered 
+    for a while.
     """
 
-    # check if the api client has been configured
-    if not current_app.finnhub_client:
+    if is_nonexistent_symbol(symbol):
         return None
 
-    # fetch company profile from Finnhub
-    response = current_app.finnhub_client.company_profile2(symbol=symbol)
-    if len(response) == 0:
-        return None
-
-    # prepare the company profile payload
-    profile_payload = {}
-    profile_payload['name'] = response['name']
+    profile_payload = fetch_dataset('company_profile', symbol)
+    if profile_payload is None:
+        reject_symbol(symbol)
 
     return profile_payload
 
@@ -65,52 +54,12 @@ def get_quote(symbol):
     """
     This function gets quote for a given symbol.
     It returns None if the symbol does not exist.
-    
-    It currently uses the quote API from Finnhub.
-    """
-
-    # check if the api client has been configured
-    if not current_app.finnhub_client:
-        return None
-
-    payload = current_app.finnhub_client.quote(symbol)
 
-    # set the currency to USD for all, since the Finnhub API 
-    # always defaults it to USD in its response
-    payload['currency'] = 'USD'
-
-    # also convert the epoch number of the time field to a python datetime 
-    # string, since the Finnhub API always defaults the market time to an 
-    # epoch value in its response
-    payload['t'] = str(datetime.fromtimestamp(int(payload['t'])))
-
-    return payload
-
-
-def get_guru_data(symbol, data_type):
-    """
-    This helper function pulls data via the GuruFocus API, for the given symbol
-    and data type.
-
-    Input:
-        symbol: stock ticker symbol
-        data_type: possible values include:
-            'financials'
-            'analyst_estimate'
-            ...
-            (for more choices, checkout the API documentation here:
-            https://www.gurufocus.com/api.php)
+    Quotes are latency-critical, so they may be requested with hedged 
+    requests (see HEDGED_DATASETS).
     """
 
-    api_token = current_app.config['GURU_API_KEY']
-    base_url = 'https://api.gurufocus.com/public/user/' + api_token + '/stock/'
-    constructed_url = base_url + symbol + '/' + data_type
-    
-    r = requests.get(constructed_url)
-    if r.status_code != 200:
-        return "Error: the GuruFocus API service failed."
-    else:
-        return r.json()
+    return fetch_dataset('quote', symbol)
 
 
 # a lookup to find section names specifically in the Guru financials payload by 
@@ -127,29 +76,21 @@ def get_financials_history(symbol):
     """
     This function gets historical data for stock financials, and returns the 
     data in a json payload.
-
-    Note:
-        It currently uses the GuruFocus API for data.
     """
 
-    return get_guru_data(symbol, data_type='financials')
+    return fetch_dataset('financials_history', symbol)
 
 
 def get_analyst_estimates(symbol):
     """
     This function gets analyst estimates data, and returns the data in a json 
     payload.
-
-    Note:
-        It currently use the GuruFocus API for data.
     """
 
-    return get_guru_data(symbol, data_type='analyst_estimate')
+    return fetch_dataset('analyst_estimates', symbol)
 
 
-def get_quote_history(symbol, start_date=None, 
-                      end_date=(datetime.utcnow()-timedelta(days=1)), 
-                      interval='1mo', 
+def get_quote_history(symbol, start_date=None, end_date=None, interval='1mo', 
                       header='close'):
     """
     This function pulls historical quote data, and returns the cleaned up data 
@@ -161,29 +102,12 @@ def get_quote_history(symbol, start_date=None,
     Inputs:
         'start_date': '%m/%d/%Y'
         'end_date': '%m/%d/%Y;
-                    Defaulted to be 1 day before utcnow to hack around a 
-                    duplication bug in the yahoo_fin library.
-
-    Note:
-        It currently uses the "yahoo_fin" library for scraping historical data 
-        from Yahoo Finance.
-        For more details, check out the author's documentation here:
-        https://theautomatic.net/yahoo_fin-documentation/ 
+                    Defaulted to be None, for the latest date available from 
+                    the provider.
     """
 
-    # get the quote history in Pandas dataframe via a web scraper
-    df_quote_history = stock_info.get_data(symbol, 
-                                           start_date=start_date, 
-                                           end_date=end_date, 
-                                           interval=interval)
-
-    # construct the output dictionary of "<timestamp>: <price>"
-    data = {}
-    df_selected_price = df_quote_history[header]
-    for timestamp in dict(df_selected_price):
-        data[timestamp.to_pydatetime()] = df_selected_price[timestamp]
-
-    return data
+    return fetch_dataset('quote_history', symbol, start_date=start_date, 
+                         end_date=end_date, interval=interval, header=header)
 
 
 def get_quote_details(symbol):
@@ -194,51 +118,6 @@ def get_quote_details(symbol):
     Inputs:
         'symbol': the ticker symbol of stocks, e.g., 'AAPL', 'AMZN', etc. It is 
                   not case sensitive.
+    """
 
-    Notes:
-        This function currently uses the "yahoo_fin" library for scraping 
-        historical data from Yahoo Finance.
-
-        For more details, check out the author's documentation here: 
-        https://theautomatic.net/yahoo_fin-documentation/#get_quote_table 
-    """
-
-    try:
-        # download data
-        data_downloaded = stock_info.get_quote_table(symbol)
-
-        # return the downloaded data if it's a dictionary, otherwise raise an
-        # exception
-        if isinstance(data_downloaded, dict):
-            # standardize the downloaded data - this is API specific
-            data = {}
-            data['Market Cap'] = '$' + data_downloaded['Market Cap']
-            data['Beta (5Y Monthly)'] = data_downloaded['Beta (5Y Monthly)']
-            # add dollar sign
-            _low, _high = \
-                [s.strip() for s in data_downloaded['52 Week Range'].split('-')]
-            data['52 Week Range'] = '$' + _low + ' - ' + '$' + _high
-            data['Earnings Date'] = data_downloaded['Earnings Date'] 
-            # when the date is nan save the value as 'N/A'
-            data['Ex-Dividend Date'] = data_downloaded['Ex-Dividend Date'] \
-                if data_downloaded['Ex-Dividend Date'] == \
-                    data_downloaded['Ex-Dividend Date'] else 'N/A'
-            data['Forward Dividend & Yield'] = \
-                data_downloaded['Forward Dividend & Yield']
-
-            # get the numeric value of the dividend yield
-            s = data_downloaded['Forward Dividend & Yield']
-            dividend_yield_str = s[(s.find('(') + 1):s.find('%')]
-            try:
-                dividend_yield = float(dividend_yield_str) / 100
-            except:
-                dividend_yield = 0
-
-            return data, dividend_yield
-        else:
-            raise TypeError("Invalid data type for quote details - only dict "
-                            "is accepted.")
-
-    except:
-        # raise a more informational exception
-        raise ConnectionAbortedError('Unable to download quote details data.')
+    return fetch_dataset('quote_details', symbol)
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import redis
+import websockets
+from datetime import datetime
+from time import time
+from flask import current_app
+from app.quote_cache import set_cached_quote
+from app.stocksdata import get_quote
+
+
+# the Redis sorted set of symbols with viewers, scored by when their viewers
+# expire
+_viewers_key = 'stream:viewers'
+
+
+def get_quote_channel(symbol):
+    """
+    This function returns the Redis channel that streamed quotes of the given
+    symbol are published to, as JSON quotes in the format of Finnhub quotes.
+    """
+
+    return 'quotes:{}'.format(symbol)
+
+
+def add_stream_viewer(symbol):
+    """
+    This function records a viewer of quotes of the given symbol, so that the
+    symbol is streamed for STREAM_VIEWER_SECONDS (see QuoteStreamIngester).
+    """
+
+    try:
+        current_app.redis.zadd(_viewers_key, {
+            symbol: time() + current_app.config['STREAM_VIEWER_SECONDS']})
+    except redis.exceptions.RedisError:
+        pass
+
+
+def get_streamed_symbols():
+    """
+    This function returns the set of symbols that currently have viewers.
+    """
+
+    try:
+        pipe = current_app.redis.pipeline()
+        pipe.zremrangebyscore(_viewers_key, '-inf', time())
+        pipe.zrange(_viewers_key, 0, -1)
+        _, symbols = pipe.execute()
+    except redis.exceptions.RedisError:
+        return set()
+
+    return {symbol.decode() for symbol in symbols}
+
+
+class QuoteAggregator(object):
+    """
+    This class implements the aggregation of trades into quotes, in the
+    format of Finnhub quotes, starting from a quote of each symbol (for the
+    previous close, and the high and low of the day).
+    """
+
+    def __init__(self):
+        """This method initializes the aggregator without any quote."""
+
+        self.quotes = {}
+
+    def set_quote(self, symbol, quote):
+        """
+        This method sets the quote of the given symbol that trades update.
+        """
+
+        self.quotes[symbol] = dict(quote)
+
+    def add_trades(self, trades):
+        """
+        This method updates quotes with the input trades, and returns the set
+        of symbols of updated quotes; trades of symbols without a quote are
+        skipped.
+
+        Inputs:
+            'trades': a list of trades of the Finnhub trade stream, as
+                      dictionaries of 's' (symbol), 'p' (price), 't' (time in
+                      epoch milliseconds) and 'v' (volume).
+        """
+
+        updated = set()
+        for trade in trades:
+            quote = self.quotes.get(trade['s'])
+            if quote is None:
+                continue
+
+            price = trade['p']
+            quote['c'] = price
+            quote['h'] = max(quote.get('h') or price, price)
+            quote['l'] = min(quote.get('l') or price, price)
+            if quote.get('pc'):
+                quote['d'] = price - quote['pc']
+                quote['dp'] = quote['d'] / quote['pc'] * 100
+            quote['t'] = str(datetime.fromtimestamp(trade['t'] / 1000))
+            updated.add(trade['s'])
+
+        return updated
+
+
+class QuoteStreamIngester(object):
+    """
+    This class implements a standalone ingester of the trade stream of a
+    provider (the Finnhub WebSocket API), subscribed to symbols that currently
+    have viewers. Trades are aggregated into quotes, which are published to
+    the Redis channel of each symbol (see get_quote_channel) and saved to the
+    shared quote cache, so that quote polling answers with streamed quotes.
+    """
+
+    def __init__(self, url, get_symbols=get_streamed_symbols,
+                 subscription_seconds=5):
+        """
+        This method initializes the ingester.
+
+        Inputs:
+            'url': the URL of the WebSocket trade stream.
+            'get_symbols': a function returning the set of symbols to stream.
+                           Defaulted to get_streamed_symbols.
+            'subscription_seconds': number of seconds between updates of
+                                    subscriptions. Defaulted to 5.
+        """
+
+        self.url = url
+        self.get_symbols = get_symbols
+        self.subscription_seconds = subscription_seconds
+        self.aggregator = QuoteAggregator()
+        self.subscribed = set()
+
+    def publish(self, symbol):
+        """
+        This method publishes the current quote of the given symbol.
+        """
+
+        quote = self.aggregator.quotes[symbol]
+        set_cached_quote(symbol, quote)
+        try:
+            current_app.redis.publish(get_quote_channel(symbol),
+                                      json.dumps(quote))
+        except redis.exceptions.RedisError:
+            pass
+
+    async def _update_subscriptions(self, websocket):
+        """
+        This method subscribes to symbols with viewers, and unsubscribes from
+        symbols without, at every 'subscription_seconds' seconds. A quote is
+        fetched for each new symbol first, as the start of its aggregation.
+        """
+
+        while True:
+            symbols = self.get_symbols()
+            for symbol in symbols - self.subscribed:
+                quote = get_quote(symbol)
+                if not quote:
+                    continue
+                self.aggregator.set_quote(symbol, quote)
+                await websocket.send(json.dumps(
+                    {'type': 'subscribe', 'symbol': symbol}))
+                self.subscribed.add(symbol)
+            for symbol in self.subscribed - symbols:
+                await websocket.send(json.dumps(
+                    {'type': 'unsubscribe', 'symbol': symbol}))
+                self.subscribed.discard(symbol)
+                self.aggregator.quotes.pop(symbol, None)
+
+            await asyncio.sleep(self.subscription_seconds)
+
+    async def _receive_trades(self, websocket):
+        """
+        This method aggregates trades received, and publishes the updated
+        quotes once per message.
+        """
+
+        async for message in websocket:
+            data = json.loads(message)
+            if data.get('type') != 'trade':
+                continue
+            for symbol in self.aggregator.add_trades(data['data']):
+                self.publish(symbol)
+
+    async def run(self, reconnect_seconds=5):
+        """
+        This method runs the ingester until cancelled, reconnecting to the
+        trade stream after the given number of seconds when disconnected.
+        """
+
+        while True:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    self.subscribed = set()
+                    tasks = [
+                        asyncio.ensure_future(
+                            self._update_subscriptions(websocket)),
+                        asyncio.ensure_future(self._receive_trades(websocket))]
+                    try:
+                        done, _ = await asyncio.wait(
+                            tasks, return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        for task in tasks:
+                            task.cancel()
+                    for task in done:
+                        task.result()
+            except (websockets.exceptions.WebSocketException, OSError) as e:
+                current_app.logger.warning(
+                    'The trade stream is disconnected: {!r}'.format(e))
+
+            await asyncio.sleep(reconnect_seconds)
+
+
+class StubTradeStream(object):
+    """
+    This class implements a local stand-in of the Finnhub WebSocket trade
+    stream for tests: trades of subscribed symbols are sent at every given
+    number of seconds, with prices increasing by 0.01 from the given price.
+    """
+
+    def __init__(self, price=100., interval_seconds=0.05):
+        self.price = price
+        self.interval_seconds = interval_seconds
+        self.subscriptions = []
+
+    async def _handle(self, websocket, path=None):
+        symbols = set()
+
+        async def send_trades():
+            i = 0
+            while True:
+                await asyncio.sleep(self.interval_seconds)
+                i += 1
+                await websocket.send(json.dumps({'type': 'trade', 'data': [
+                    {'s': symbol, 'p': round(self.price + 0.01 * i, 2),
+                     't': int(time() * 1000), 'v': 100}
+                    for symbol in sorted(symbols)]}))
+
+        sending = asyncio.ensure_future(send_trades())
+        try:
+            async for message in websocket:
+                data = json.loads(message)
+                self.subscriptions.append((data['type'], data['symbol']))
+                if data['type'] == 'subscribe':
+                    symbols.add(data['symbol'])
+                else:
+                    symbols.discard(data['symbol'])
+        finally:
+            sending.cancel()
+
+    async def serve(self, host='localhost', port=0):
+        """
+        This method starts serving the stream, and returns the server; its
+        URL is given by get_url.
+        """
+
+        self.server = await websockets.serve(self._handle, host, port)
+        return self.server
+
+    def get_url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return 'ws://{}:{}'.format(host, port)
+
+
+if __name__ == '__main__':
+    # run the ingester as a standalone process, with an app of its own
+    from app import create_app
+
+    app = create_app()
+    app.app_context().push()
+    asyncio.get_event_loop().run_until_complete(QuoteStreamIngester(
+        url=app.config['QUOTE_STREAM_URL'].format(
+            app.config['FINNHUB_API_KEY']),
+        subscription_seconds=app.config['STREAM_SUBSCRIPTION_SECONDS']).run())
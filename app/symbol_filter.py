@@ -0,0 +1,188 @@
+import math
+import redis
+from hashlib import blake2b
+from time import time
+from flask import current_app
+
+
+class BloomFilter(object):
+    """
+    This class implements a Bloom filter of strings, which tells for sure
+    that a string has not been added, while a string reported as added may
+    not have been, at a small false positive rate.
+    """
+
+    def __init__(self, num_of_bits, num_of_hashes, bits=None):
+        """
+        This method initializes the filter.
+
+        Inputs:
+            'num_of_bits': the number of bits of the filter.
+            'num_of_hashes': the number of bits set for each string.
+            'bits': a bytes object of bits of the filter, defaulted to None
+                    for an empty filter.
+        """
+
+        self.num_of_bits = num_of_bits
+        self.num_of_hashes = num_of_hashes
+        self.bits = bytearray(bits) if bits is not None else \
+            bytearray((num_of_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.001):
+        """
+        This class method returns an empty filter sized for the given number
+        of strings, at the given false positive rate.
+        """
+
+        num_of_bits = max(int(-capacity * math.log(error_rate) /
+                              math.log(2) ** 2), 8)
+        num_of_hashes = max(round(num_of_bits / max(capacity, 1) *
+                                  math.log(2)), 1)
+
+        return cls(num_of_bits, num_of_hashes)
+
+    def _get_positions(self, key):
+        """
+        This method returns the positions of bits of the given string, by
+        double hashing.
+        """
+
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(h1 + i * h2) % self.num_of_bits
+                for i in range(self.num_of_hashes)]
+
+    def add(self, key):
+        """This method adds the given string to the filter."""
+
+        for position in self._get_positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._get_positions(key))
+
+
+# the symbol filter loaded in process, and when it was loaded
+_symbol_filter = None
+_symbol_filter_loaded = 0
+
+# the Redis keys of the symbol filter, of the key set while the filter is
+# being built, and of the sorted set of rejected symbols, scored by when
+# they expire
+_symbol_filter_key = 'symbols:filter'
+_building_key = 'symbols:filter_building'
+_rejected_symbols_key = 'symbols:rejected'
+
+
+def build_symbol_filter(symbols):
+    """
+    This function builds the Bloom filter of the input universe of symbols,
+    and saves it both in process and in Redis (for SYMBOL_FILTER_SECONDS), so
+    that it is shared by all processes of the app. It returns the filter.
+    """
+
+    symbols = set(symbols)
+    symbol_filter = BloomFilter.for_capacity(
+        len(symbols), current_app.config['SYMBOL_FILTER_ERROR_RATE'])
+    for symbol in symbols:
+        symbol_filter.add(symbol)
+    _set_local_symbol_filter(symbol_filter)
+
+    try:
+        pipe = current_app.redis.pipeline()
+        pipe.hset(_symbol_filter_key, mapping={
+            'num_of_bits': symbol_filter.num_of_bits,
+            'num_of_hashes': symbol_filter.num_of_hashes,
+            'bits': bytes(symbol_filter.bits)})
+        pipe.expire(_symbol_filter_key,
+                    current_app.config['SYMBOL_FILTER_SECONDS'])
+        pipe.delete(_building_key)
+        pipe.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+    return symbol_filter
+
+
+def _set_local_symbol_filter(symbol_filter):
+    """
+    This helper function keeps the input symbol filter in process.
+    """
+
+    global _symbol_filter, _symbol_filter_loaded
+    _symbol_filter = symbol_filter
+    _symbol_filter_loaded = time()
+
+
+def get_symbol_filter():
+    """
+    This function returns the Bloom filter of the symbol universe, kept in
+    process and reloaded from Redis every SYMBOL_FILTER_RELOAD_SECONDS, or
+    None if the filter has not been built.
+
+    When the filter is not found in Redis, a background job is scheduled to
+    build it (see refresh_symbol_filter in tasks.py), unless one is
+    scheduled.
+    """
+
+    if _symbol_filter is not None and time() - _symbol_filter_loaded <= \
+        current_app.config['SYMBOL_FILTER_RELOAD_SECONDS']:
+        return _symbol_filter
+
+    try:
+        data = current_app.redis.hgetall(_symbol_filter_key)
+        if not data:
+            if current_app.redis.set(_building_key, 1, nx=True, ex=600):
+                current_app.task_queue.enqueue(
+                    'app.tasks.refresh_symbol_filter')
+            return _symbol_filter
+    except redis.exceptions.RedisError:
+        return _symbol_filter
+
+    _set_local_symbol_filter(BloomFilter(
+        num_of_bits=int(data[b'num_of_bits']),
+        num_of_hashes=int(data[b'num_of_hashes']), bits=data[b'bits']))
+
+    return _symbol_filter
+
+
+def reject_symbol(symbol):
+    """
+    This function adds the input symbol to the set of rejected symbols for
+    SYMBOL_REJECTION_SECONDS, after it has been found not to exist.
+    """
+
+    now = time()
+    try:
+        pipe = current_app.redis.pipeline()
+        pipe.zadd(_rejected_symbols_key, {
+            symbol: now + current_app.config['SYMBOL_REJECTION_SECONDS']})
+        pipe.zremrangebyscore(_rejected_symbols_key, '-inf', now)
+        pipe.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+
+def is_nonexistent_symbol(symbol):
+    """
+    This function returns True if the input symbol is known not to exist,
+    without any network call to data providers: when it is not in the symbol
+    filter, or has been rejected recently (see reject_symbol).
+
+    Symbols not known to be nonexistent may still not exist.
+    """
+
+    symbol_filter = get_symbol_filter()
+    if symbol_filter is not None and symbol not in symbol_filter:
+        return True
+
+    try:
+        expiration = current_app.redis.zscore(_rejected_symbols_key, symbol)
+    except redis.exceptions.RedisError:
+        return False
+
+    return expiration is not None and expiration > time()
@@ -4,7 +4,10 @@ from flask import render_template
 from time import sleep, time
 from rq import get_current_job
 from app import db, create_app
-from app.models import User, Post, Task
+from app.models import User, Post, Task, Stock
+from app.quote_cache import pop_unsaved_quotes
+from app.stocksdata import get_stock_symbols
+from app.symbol_filter import build_symbol_filter
 from app.emails import send_email
 
 
@@ -150,3 +153,35 @@ def refresh_quotes(user_id, stocks, seconds):
         app.logger.error('Unhandled exceptions', exc_info=sys.exc_info())
     finally:
         _set_quote_data(None, None)
+
+
+def save_unsaved_quotes(seconds):
+    """
+    This task function saves quotes cached for quote polling to the app 
+    database in a batch, after waiting for the given number of seconds so 
+    that quotes cached meanwhile are included (see set_cached_quote).
+    """
+
+    try:
+        sleep(seconds)
+        Stock.save_quotes(pop_unsaved_quotes())
+    except:
+        app.logger.error('Unhandled exceptions', exc_info=sys.exc_info())
+
+
+def refresh_symbol_filter():
+    """
+    This task function builds the filter of symbols of stocks listed on the 
+    exchanges of SYMBOL_FILTER_EXCHANGES, and of stocks in the app database 
+    (see build_symbol_filter). No filter is built if no listed symbols can be 
+    fetched, since all symbols would be rejected otherwise.
+    """
+
+    try:
+        symbols = [symbol for exchange in app.config['SYMBOL_FILTER_EXCHANGES'] 
+                   for symbol in get_stock_symbols(exchange)]
+        if symbols:
+            build_symbol_filter(symbols + [stock.symbol for stock in 
+                                           Stock.query.all()])
+    except:
+        app.logger.error('Unhandled exceptions', exc_info=sys.exc_info())
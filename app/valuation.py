@@ -0,0 +1,350 @@
+import heapq
+from collections import namedtuple
+import numpy as np
+
+
+# valuation ratios of a per share metric over a month grid; 'timestamps' is a
+# list of the kept timestamps, and the other fields are float numpy arrays of
+# the same length
+ValuationRatios = namedtuple('ValuationRatios',
+                             ['timestamps', 'quotes', 'metrics', 'ratios'])
+
+
+class QuoteGrid(object):
+    """
+    This class implements a grid of (usually monthly) quotes, with timestamps,
+    calendar years, calendar months and prices kept in numpy arrays.
+
+    The grid is built once from a quote history dictionary of
+    "<timestamp>: <price>", and shared by all valuation ratios / price
+    multiples calculated for the same quote history.
+    """
+
+    def __init__(self, quote_history_data):
+        """
+        Constructor.
+
+        Inputs:
+            'quote_history_data': a dictionary of "<timestamp>: <price>",
+                                  where timestamps are Python datetime objects.
+        """
+
+        self.timestamps = list(quote_history_data.keys())
+        self.prices = np.array(list(quote_history_data.values()), dtype=float)
+        self.datetimes = np.array(self.timestamps, dtype='datetime64[us]')
+
+        # split timestamps into calendar years and months
+        months = self.datetimes.astype('datetime64[M]').astype(np.int64)
+        self.years = months // 12 + 1970
+        self.months = months % 12 + 1
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_data(cls, quote_history_data):
+        """
+        This method returns a quote grid for the input quote history, which
+        can either be a dictionary of "<timestamp>: <price>" or a QuoteGrid
+        object (returned as is).
+        """
+
+        if isinstance(quote_history_data, cls):
+            return quote_history_data
+
+        return cls(quote_history_data)
+
+
+def _lookup_years(years, values, target_years):
+    """
+    This helper function looks up values by year for each of the target years,
+    and returns a tuple of (<mask of years found>, <values found>), where
+    values not found are NaNs.
+
+    Inputs:
+        'years': a sorted numpy array of unique years.
+        'values': a numpy array of values, one for each year.
+        'target_years': a numpy array of years to look up.
+    """
+
+    if len(years) == 0:
+        return np.zeros(len(target_years), dtype=bool), \
+            np.full(len(target_years), np.nan)
+
+    positions = np.minimum(np.searchsorted(years, target_years),
+                           len(years) - 1)
+    found = years[positions] == target_years
+
+    return found, np.where(found, values[positions], np.nan)
+
+
+def interpolate_per_share_metric(quote_grid, metric_per_share_data,
+                                 get_latest_ratios=False):
+    """
+    This function interpolates the monthly TTM values of an annual per share
+    metric over a quote grid, and returns a tuple of (<mask of months with a
+    derived value>, <derived values>), both as numpy arrays aligned to the
+    grid.
+
+    For months no later than the last month of the fiscal year, values of the
+    current and the previous fiscal year are blended linearly; for later
+    months, values of the current and the next fiscal year are blended.
+
+    Inputs:
+        'quote_grid': a QuoteGrid object.
+        'metric_per_share_data': a dictionary of "<timestamp>: <per share
+                                 metric value>", with only one record per year.
+        'get_latest_ratios': a boolean value, defaulted to be False. When True,
+                             months after the most recent month included in
+                             the metric data take the value of the current (or
+                             else the previous) fiscal year.
+    """
+
+    # get the ending month of fiscal years, usually either Sep or Dec
+    # this assumes the ending month is always the same across all fiscal years
+    metric_data_last_timestamp = list(metric_per_share_data.keys())[-1]
+    last_month_fiscal_years = metric_data_last_timestamp.month
+
+    # create sorted arrays of fiscal years and per share metric values, for
+    # looking up values by year; missing values are dropped
+    dict_year_metric = {timestamp.year: value for (timestamp, value) in
+                        metric_per_share_data.items()}
+    year_metric_pairs = sorted((year, value) for (year, value) in
+                               dict_year_metric.items() if value is not None)
+    years = np.array([pair[0] for pair in year_metric_pairs], dtype=np.int64)
+    values = np.array([pair[1] for pair in year_metric_pairs], dtype=float)
+
+    # look up the annual values for the current year, the prev year and the
+    # next year of each month on the grid
+    found, metric_value = _lookup_years(years, values, quote_grid.years)
+    found_prev, metric_value_prev_year = \
+        _lookup_years(years, values, quote_grid.years - 1)
+    found_next, metric_value_next_year = \
+        _lookup_years(years, values, quote_grid.years + 1)
+
+    # zero values can't be interpolated from
+    usable = found & (metric_value != 0)
+    usable_prev = found_prev & (metric_value_prev_year != 0)
+    usable_next = found_next & (metric_value_next_year != 0)
+
+    months = quote_grid.months
+    with np.errstate(invalid='ignore', over='ignore'):
+
+        # when the current month is ealier than or the same as the last month
+        # of the fiscal year, use metric values of the current year and the
+        # previous year for interpolation
+        mask_prev = usable & usable_prev & (months <= last_month_fiscal_years)
+        derived_prev = \
+            metric_value_prev_year + \
+            (metric_value - metric_value_prev_year) * \
+            (months + 12 - last_month_fiscal_years) / 12
+
+        # when the current month is greater than the last month of the fiscal
+        # year, use metric values of the current year and the next year for
+        # interpolation
+        mask_next = usable & usable_next & (months > last_month_fiscal_years)
+        derived_next = \
+            metric_value + \
+            (metric_value_next_year - metric_value) * \
+            (months - last_month_fiscal_years) / 12
+
+    # when the current month is greater than the most recent month included
+    # in the input financial history data, use just the metric value of the
+    # current year
+    mask_latest = np.zeros(len(quote_grid), dtype=bool)
+    if get_latest_ratios:
+        mask_latest = ~mask_prev & ~mask_next & (found | found_prev) & \
+            (quote_grid.datetimes >
+             np.datetime64(metric_data_last_timestamp, 'us'))
+    derived_latest = np.where(found, metric_value, metric_value_prev_year)
+
+    derived = np.select([mask_prev, mask_next, mask_latest],
+                        [derived_prev, derived_next, derived_latest],
+                        default=np.nan)
+
+    return mask_prev | mask_next | mask_latest, derived
+
+
+def get_valuation_ratio_arrays(quote_history_data, metric_per_share_data,
+                               get_latest_ratios=False, only_positives=True):
+    """
+    This function calculates valuation ratios / price multiples for all
+    timestamps where possible, based on the input quote history and the input
+    metric (per share) data, and returns them in a ValuationRatios object.
+
+    Inputs:
+        'quote_history_data': a dictionary of "<timestamp>: <price>", or a
+                              QuoteGrid object.
+        'metric_per_share_data': a dictionary of "<timestamp>: <per share
+                                 metric value>", with only one record per year.
+        'get_latest_ratios': a boolean value, defaulted to be False. See
+                             interpolate_per_share_metric.
+        'only_positives': a boolean value, defaulted to be True. If True, only
+                          positive ratios will be kept.
+    """
+
+    quote_grid = QuoteGrid.from_data(quote_history_data)
+    mask, metrics = interpolate_per_share_metric(
+        quote_grid=quote_grid, metric_per_share_data=metric_per_share_data,
+        get_latest_ratios=get_latest_ratios)
+
+    # only keep records with positive interpolated/extrapolated metric
+    # values at zero - investors don't really consider P/X ratios when they
+    # are negative
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if only_positives:
+            mask = mask & (metrics > 0)
+            ratios = quote_grid.prices / metrics
+        else:
+            ratios = np.where(metrics != 0, quote_grid.prices / metrics, 0.)
+
+    positions = np.flatnonzero(mask)
+
+    return ValuationRatios(
+        timestamps=[quote_grid.timestamps[i] for i in positions],
+        quotes=quote_grid.prices[positions],
+        metrics=metrics[positions],
+        ratios=ratios[positions])
+
+
+def get_suffix_extreme_sums(values, num_of_values):
+    """
+    This function returns a tuple of two numpy arrays, (<lowest sums>,
+    <highest sums>), where the k-th element of each array is the sum of the
+    'num_of_values' lowest (or highest) values in values[k:].
+
+    Both arrays have one more element than the input values, and elements for
+    suffixes with fewer than 'num_of_values' values are NaNs.
+
+    The suffixes are swept from the end in one pass, keeping the lowest and
+    the highest values seen so far in two bounded heaps.
+
+    Inputs:
+        'values': a sequence of numbers.
+        'num_of_values': an integer, the number of values to sum up.
+    """
+
+    lowest_sums = np.full(len(values) + 1, np.nan)
+    highest_sums = np.full(len(values) + 1, np.nan)
+    if num_of_values == 0:
+        lowest_sums[:] = 0.
+        highest_sums[:] = 0.
+        return lowest_sums, highest_sums
+
+    # a max-heap (of negated values) of the lowest values, and a min-heap of
+    # the highest values
+    lowest_heap = []
+    highest_heap = []
+    for k in range(len(values) - 1, -1, -1):
+        value = values[k]
+        if len(lowest_heap) < num_of_values:
+            heapq.heappush(lowest_heap, -value)
+            heapq.heappush(highest_heap, value)
+        else:
+            heapq.heappushpop(lowest_heap, -value)
+            heapq.heappushpop(highest_heap, value)
+
+        if len(lowest_heap) == num_of_values:
+            lowest_sums[k] = -sum(lowest_heap)
+            highest_sums[k] = sum(highest_heap)
+
+    return lowest_sums, highest_sums
+
+
+# spans of the financials history and the quote history of a stock, and the
+# number of whole years they overlap, which are all that's needed to derive
+# dates and durations for stock valuation plotting
+DataSpans = namedtuple('DataSpans', [
+    'first_fiscal_period', 'last_fiscal_period', 'first_quote_date',
+    'last_quote_date', 'max_years_overlap'])
+
+
+def get_fiscal_period_span(metric_graph):
+    """
+    This function returns a tuple of the first and the last fiscal periods of
+    annual financials, as Python datetime objects.
+
+    In order to properly preprocess the payload data returned by the
+    financials API, the periods are taken from the timestamps of the number of
+    shares metric.
+
+    Inputs:
+        'metric_graph': a MetricGraph object, built from the payload data of
+                        historical financials.
+    """
+
+    num_of_shares = metric_graph.get(
+        name='Shares Outstanding (Diluted Average)')
+
+    return min(num_of_shares.timestamps), max(num_of_shares.timestamps)
+
+
+def get_max_years_overlap(first_fiscal_period, last_fiscal_period,
+                          first_quote_date, last_quote_date):
+    """
+    This function returns the maximum number of years of overlap between the
+    financials history and the quote history, which is an integer and the
+    floor of the years delta.
+    """
+
+    earliest_date_overlap = max(first_fiscal_period, first_quote_date)
+    latest_date_overlap = min(last_fiscal_period, last_quote_date)
+
+    return int((latest_date_overlap - earliest_date_overlap).days / 365.2425)
+
+
+def get_data_spans(quote_history, metric_graph):
+    """
+    This function returns the DataSpans object of the input quote history and
+    financials history.
+
+    Inputs:
+        'quote_history': a dictionary object, and each item in it looks like
+                         "<timestamp>: <price>".
+        'metric_graph': a MetricGraph object, built from the payload data of
+                        historical financials.
+    """
+
+    first_fiscal_period, last_fiscal_period = \
+        get_fiscal_period_span(metric_graph)
+    first_quote_date = min(quote_history.keys())
+    last_quote_date = max(quote_history.keys())
+
+    return DataSpans(
+        first_fiscal_period=first_fiscal_period,
+        last_fiscal_period=last_fiscal_period,
+        first_quote_date=first_quote_date,
+        last_quote_date=last_quote_date,
+        max_years_overlap=get_max_years_overlap(
+            first_fiscal_period, last_fiscal_period, first_quote_date,
+            last_quote_date))
+
+
+def get_allowed_durations(max_years_overlap, min_years=3, max_years=20):
+    """
+    This function returns a list of acceptable durations (in years) for stock
+    valuation plotting, given the maximum number of years of overlap between
+    the financials history and the quote history, or None if there are none.
+
+    Inputs:
+        'max_years_overlap': an integer, see get_max_years_overlap.
+        'min_years': an integer defaulted to be 3, the minimum number of years
+                     allowed for the average price multiple calculation.
+        'max_years': an integer defaulted to be 20, the maximum number of years
+                     allowed for the average price multiple calculation.
+    """
+
+    # get the maximum number of years allowed for average price multiple
+    # calculation, which is the lesser of the two below:
+    #   (1) the max # years overlap between the quote and the financials history
+    #   (2) the max # years allowed passed as an input
+    max_duration = min(max_years_overlap, max_years)
+
+    # return None if the maximum number of years allowed derived above is less
+    # than the minimum number of years allowed passed as an input
+    if max_duration < min_years:
+        return None
+
+    # return all allowed durations (in years) in a list
+    return [(value + 1) for value in
+            range(max_duration) if (value + 1) >= min_years]
@@ -27,6 +27,51 @@ class Config:
     FINNHUB_API_KEY = os.environ.get('FINNHUB_API_KEY')
     GURU_API_KEY = os.environ.get('GURU_API_KEY')
     STOCK_VALUATION_METRIC_DEFAULT = 'Revenue'
+    STOCK_VALUATION_ESTIMATOR_DEFAULT = 'trimmed_mean'
+    PLOT_WIDTH_DEFAULT = 650
+    PLOT_WIDTH_MAX = 3840
+    MARKET_CALENDAR_DEFAULT = 'XNYS'
+    MARKET_CALENDARS = {
+        'XNYS': {'timezone': 'America/New_York', 'open': '09:30', 
+                 'close': '16:00', 'early_close': '13:00', 
+                 'holiday_rules': 'nyse', 
+                 'closures': ['2018-12-05', '2025-01-09']}
+    }
+    QUOTE_MIN_DELAY_SECONDS = 15
+    QUOTE_CACHE_SECONDS = 300
+    QUOTE_LOCAL_CACHE_SECONDS = 5
+    QUOTE_SAVING_SECONDS = 10
+    QUOTE_STREAM_URL = os.environ.get('QUOTE_STREAM_URL') or \
+        'wss://ws.finnhub.io?token={}'
+    STREAM_VIEWER_SECONDS = 60
+    STREAM_SUBSCRIPTION_SECONDS = 5
+    SYMBOL_FILTER_EXCHANGES = ['US']
+    SYMBOL_FILTER_ERROR_RATE = 0.001
+    SYMBOL_FILTER_SECONDS = 86400
+    SYMBOL_FILTER_RELOAD_SECONDS = 3600
+    SYMBOL_REJECTION_SECONDS = 86400
+    REQUEST_DEADLINE_SECONDS = 25
+    PROVIDER_MAX_WORKERS = 16
+    PROVIDER_TIMEOUT_SECONDS = {'gurufocus': 15, 'yahoo': 15}
+    CIRCUIT_BREAKER_FAILURES = 5
+    CIRCUIT_BREAKER_WINDOW_SECONDS = 60
+    CIRCUIT_BREAKER_COOLDOWN_SECONDS = 30
+    DATASET_PROVIDERS = {
+        'quote': ['finnhub', 'yahoo'], 
+        'company_profile': ['finnhub'], 
+        'stock_symbols': ['finnhub'], 
+        'symbol_search': ['finnhub'], 
+        'financials_history': ['gurufocus'], 
+        'analyst_estimates': ['gurufocus'], 
+        'quote_history': ['yahoo'], 
+        'quote_details': ['yahoo']
+    }
+    HEDGED_DATASETS = ['quote']
+    HEDGE_DELAY_DEFAULT_SECONDS = 0.5
+    FETCH_MAX_WORKERS = 8
+    FETCH_DEADLINE_SECONDS_DEFAULT = 20
+    FETCH_DEADLINE_SECONDS = {'quote': 5, 'quote_details': 15, 
+                              'company_profile': 5}
     EMAIL_LOGGING = os.environ.get('EMAIL_LOGGING') or False
     UPLOAD_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
     MAX_UPLOAD_SIZE = 1024 * 1024
@@ -1,11 +1,41 @@
+import json
+import asyncio
+import base64
 import unittest
+from functools import partial
+from time import sleep, monotonic, time
 from itsdangerous import timed
 import numpy as np
 from datetime import datetime, timedelta
 from config import Config
 from app import create_app, db
 from app.models import User, Post, Message, Stock, StockNote
-from app.metrics import Metric, TotalMetric
+from app.metrics import Metric, TotalMetric, parse_fiscal_periods
+from app.fundamental_analysis import MetricGraph, get_fundamental_indicator
+from app.fundamentals_frame import FundamentalsFrame
+from app.valuation import QuoteGrid, get_valuation_ratio_arrays, \
+    get_suffix_extreme_sums, get_data_spans
+from app.robust_stats import trimmed_mean, winsorized_mean, median, \
+    get_estimator
+from app.stocks.plot import ValuationEngine, get_valplot_dates, \
+    get_durations, get_normal_price, encode_series, stock_valuation_plot, \
+    stock_valuation_plot_data, timeseries_plot_data, \
+    valuation_price_range_data
+from app.downsampling import lttb, downsample_series
+from app.fetching import fetch_concurrently, FetchTimeoutError
+from app.quote_cache import get_cached_quote
+from app.market_calendar import get_nyse_holidays, get_market_calendar
+from app import symbol_filter
+from app.symbol_filter import BloomFilter, build_symbol_filter
+from app.stocksdata import get_company_profile, get_quote
+from app.providers import providers, register_provider, StubProvider, \
+    get_hedge_delay
+from app.circuit_breakers import call_provider, set_request_deadline, \
+    CircuitOpenError, DeadlineExceededError
+from app.stocks.plot_cache import get_plot_payload_key, \
+    get_cached_plot_payload
+from app.streaming import QuoteAggregator, QuoteStreamIngester, \
+    StubTradeStream
 
 
 class TestingConfig(Config):
@@ -285,6 +315,873 @@ class UserTestCase(unittest.TestCase):
                           datetime(2022, 12, 1): 2,
                           datetime(2023, 12, 1): 3})
 
+    def test_fiscal_period_parsing(self):
+        """
+        This method tests the cached parsing of fiscal period strings.
+        """
+
+        # set up a test case
+        timestamps = ['2019-09', '2020-09', '2021-09', 'TTM']
+        fiscal_periods = parse_fiscal_periods(timestamps)
+        self.assertEqual(fiscal_periods.timestamps, (datetime(2019, 9, 1),
+                                                     datetime(2020, 9, 1),
+                                                     datetime(2021, 9, 1)))
+        self.assertListEqual(list(fiscal_periods.positions), [0, 1, 2])
+        self.assertEqual(fiscal_periods.ttm_position, 3)
+        self.assertEqual(fiscal_periods.months[0],
+                         np.datetime64('2019-09', 'M'))
+
+        # the same sequence of timestamps should share the same parsed index
+        self.assertIs(parse_fiscal_periods(list(timestamps)), fiscal_periods)
+        revenue = Metric('revenue', timestamps, [1, 2, 3, 4],
+                         datetime(2020, 1, 1))
+        net_income = Metric('net income', timestamps, [1, 1, 1, 1],
+                            datetime(1900, 1, 1))
+        self.assertIs(revenue.fiscal_periods, net_income.fiscal_periods)
+        self.assertEqual(revenue.timestamps, (datetime(2020, 9, 1),
+                                              datetime(2021, 9, 1)))
+        self.assertEqual(revenue.TTM_value, 4)
+
+        # other formats, such as those of analyst estimates
+        fiscal_periods = parse_fiscal_periods(['202112', '202212'], '%Y%m')
+        self.assertEqual(fiscal_periods.timestamps, (datetime(2021, 12, 1),
+                                                     datetime(2022, 12, 1)))
+        self.assertIsNone(fiscal_periods.ttm_position)
+
+    def test_metric_graph(self):
+        """
+        This method tests the lazy evaluation and memoization of metrics in
+        the metric graph.
+        """
+
+        # mock up a financials history payload
+        financials_history = {'financials': {'annuals': {
+            'Fiscal Year': ['2019-12', '2020-12', '2021-12', 'TTM'],
+            'balance_sheet': {
+                'Cash, Cash Equivalents, Marketable Securities':
+                    ['10', '20', '40', '50'],
+                'Short-Term Debt & Capital Lease Obligation':
+                    ['5', '5', '10', '10'],
+                'Long-Term Debt & Capital Lease Obligation':
+                    ['15', '35', '30', '40']
+            },
+            'income_statement': {'EBITDA': ['10', '10', '20', '25']}
+        }}}
+        metric_graph = MetricGraph(financials_history)
+
+        # test derived metrics
+        debt_to_cash = metric_graph.get('Debt-to-Cash')
+        self.assertEqual(debt_to_cash.name, 'Debt-to-Cash')
+        self.assertEqual(debt_to_cash.values, (2.0, 2.0, 1.0))
+        self.assertEqual(debt_to_cash.TTM_value, 1.0)
+        debt_to_ebitda = metric_graph.get('Debt-to-EBITDA',
+                                          start_date=datetime(2020, 1, 1))
+        self.assertEqual(debt_to_ebitda.values, (4.0, 2.0))
+        self.assertEqual(debt_to_ebitda.TTM_value, 2.0)
+
+        # base metrics are extracted once and shared by derived metrics
+        self.assertEqual(len(metric_graph._base_metrics), 4)
+        self.assertIs(metric_graph.get('Total Debt'),
+                      metric_graph.get('Total Debt'))
+
+        # valuation ratios can't be derived without quote history data
+        with self.assertRaises(ValueError):
+            metric_graph.get('PE Ratio')
+
+    def test_single_fundamental_indicator(self):
+        """
+        This method tests that a single fundamental indicator can be
+        evaluated without computing all other indicators.
+        """
+
+        # mock up a financials history payload, and a quote history loader
+        # recording its calls
+        financials_history = {'financials': {'annuals': {
+            'Fiscal Year': ['2018-12', '2019-12', '2020-12', '2021-12', 'TTM'],
+            'common_size_ratios': {'ROE %': ['10', '12', '15', '20', '22']},
+            'income_statement': {'Revenue': ['100', '110', '121', '133.1',
+                                             '140']}
+        }}}
+        loader_calls = []
+        def quote_history_loader():
+            loader_calls.append(1)
+            return {}
+        metric_graph = MetricGraph(financials_history,
+                                   quote_history_loader=quote_history_loader)
+
+        # only the metric needed for the indicator is extracted
+        roe = get_fundamental_indicator('ROE %', metric_graph=metric_graph)
+        self.assertEqual(roe['Current'], 0.22)
+        self.assertEqual(roe['Object'].values, (0.1, 0.12, 0.15, 0.2))
+        self.assertEqual(len(metric_graph._base_metrics), 1)
+
+        # growth indicators are rated on the growth of the underlying metric
+        growth = get_fundamental_indicator('3-Year Revenue Growth',
+                                           metric_graph=metric_graph)
+        self.assertEqual(growth['Object'].name, 'Revenue')
+        self.assertEqual(growth['Current'], 0.1)
+        self.assertEqual(len(metric_graph._base_metrics), 2)
+
+        # quote history is never loaded for non-valuation indicators
+        self.assertEqual(loader_calls, [])
+
+        # unknown indicators
+        self.assertIsNone(get_fundamental_indicator(
+            'Average Rating', metric_graph=metric_graph))
+
+    def test_valuation_ratio_interpolation(self):
+        """
+        This method tests the interpolation of monthly TTM per share values
+        and valuation ratios over a quote grid.
+        """
+
+        # mock up per share data with fiscal years ending in Sep, and a
+        # monthly quote history of constant prices
+        metric_per_share_data = {datetime(2019, 9, 30): 1.0,
+                                 datetime(2020, 9, 30): 2.2,
+                                 datetime(2021, 9, 30): 0.0}
+        quote_history_data = {datetime(2020, month, 1): 12.0
+                              for month in range(1, 13)}
+        quote_history_data[datetime(2022, 3, 1)] = 12.0
+        quote_grid = QuoteGrid(quote_history_data)
+        self.assertEqual(quote_grid.years.tolist(), [2020] * 12 + [2022])
+        self.assertEqual(quote_grid.months.tolist(), list(range(1, 13)) + [3])
+
+        # months up to Sep blend the prev and the current fiscal years; months
+        # after Sep can't be blended with the zero value of the next year
+        valuation_ratios = get_valuation_ratio_arrays(
+            quote_history_data=quote_grid,
+            metric_per_share_data=metric_per_share_data)
+        self.assertEqual(valuation_ratios.timestamps,
+                         [datetime(2020, month, 1) for month in range(1, 10)])
+        self.assertAlmostEqual(valuation_ratios.metrics[0], 1.4)
+        self.assertAlmostEqual(valuation_ratios.metrics[8], 2.2)
+        self.assertAlmostEqual(valuation_ratios.ratios[8], 12 / 2.2)
+
+        # the latest months take the latest annual value, and zero values
+        # give zero ratios when negatives are kept
+        valuation_ratios = get_valuation_ratio_arrays(
+            quote_history_data=quote_grid,
+            metric_per_share_data=metric_per_share_data,
+            get_latest_ratios=True, only_positives=False)
+        self.assertEqual(valuation_ratios.timestamps[-1], datetime(2022, 3, 1))
+        self.assertEqual(valuation_ratios.ratios[-1], 0.0)
+        self.assertEqual(len(valuation_ratios.timestamps), 10)
+
+    def test_valuation_engine(self):
+        """
+        This method tests that the valuation engine gives the same average
+        price multiples and normal prices as calculating them for each
+        duration separately.
+        """
+
+        # the 2 lowest and the 2 highest values are summed for each suffix
+        lowest_sums, highest_sums = get_suffix_extreme_sums([3, 1, 4, 1, 5], 2)
+        self.assertEqual(lowest_sums.tolist()[:4], [2, 2, 5, 6])
+        self.assertEqual(highest_sums.tolist()[:4], [9, 9, 9, 6])
+        self.assertTrue(np.isnan(lowest_sums[4]))
+
+        # mock up 12 years of financials, monthly quotes, and estimates
+        financials_history = {'financials': {'annuals': {
+            'Fiscal Year': ['{}-09'.format(year) for year in range(2009, 2021)]
+                + ['TTM'],
+            'income_statement': {
+                'Revenue': [str(100 + 10 * i + (i % 3) * 7) for i in range(13)],
+                'Shares Outstanding (Diluted Average)':
+                    [str(10 - 0.1 * i) for i in range(13)]
+            }
+        }}}
+        quote_history = {datetime(year, month, 1): 100 + year - 2009 +
+                         ((year * 12 + month) % 7)
+                         for year in range(2009, 2021) for month in range(1, 13)}
+        analyst_estimates = {'annual': {'date': ['202109', '202209'],
+                                        'revenue_estimate': [230, 250]}}
+        metric_graph = MetricGraph(financials_history,
+                                   quote_history_data=quote_history)
+        valuation_engine = ValuationEngine(quote_history, metric_graph,
+                                           analyst_estimates)
+        self.assertEqual(valuation_engine.durations, list(range(3, 12)))
+
+        for num_of_years in [3, 6, 10, 20]:
+            start_date_quote_history, start_date_financials_history, end_date, \
+                _ = get_valplot_dates(quote_history, metric_graph,
+                                      num_of_years=num_of_years)
+            quote_history_data = {
+                timestamp: price for (timestamp, price) in quote_history.items()
+                if datetime.strptime(start_date_quote_history, '%m-%d-%Y') <=
+                timestamp}
+            average_price_multiple, normal_price_data, _ = get_normal_price(
+                'Revenue', start_date_financials_history, quote_history_data,
+                metric_graph, analyst_estimates)
+            valuation = valuation_engine.get('Revenue', num_of_years)
+            self.assertAlmostEqual(valuation.average_price_multiple,
+                                   average_price_multiple, places=10)
+            self.assertEqual(list(valuation.normal_price_data),
+                             list(normal_price_data))
+            self.assertEqual(valuation.quote_history_data, quote_history_data)
+
+    def test_robust_stats(self):
+        """
+        This method tests estimators of average price multiples.
+        """
+
+        # the trimmed mean removes the same values as removing the min and
+        # the max values one at a time
+        values = [float((i * 37) % 101) for i in range(60)] + [1000., -1000.]
+        list_values = list(values)
+        for _ in range(12):
+            list_values.remove(min(list_values))
+            list_values.remove(max(list_values))
+        self.assertAlmostEqual(trimmed_mean(values),
+                               sum(list_values) / len(list_values))
+        self.assertAlmostEqual(trimmed_mean([1, 2, 3, 100], num_to_trim=1), 2.5)
+        self.assertAlmostEqual(
+            trimmed_mean(list(range(10)), trim_fraction=0.2), 4.5)
+
+        # winsorized means and medians
+        self.assertAlmostEqual(
+            winsorized_mean([1, 2, 3, 4, 100], num_to_clip=1), 3.0)
+        self.assertAlmostEqual(median([5, 1, 3]), 3.0)
+
+        # estimators by name, and errors
+        self.assertIs(get_estimator('median'), median)
+        self.assertIs(get_estimator(max), max)
+        with self.assertRaises(ValueError):
+            get_estimator('mode')
+        with self.assertRaises(ValueError):
+            trimmed_mean([1, 2, 3], num_to_trim=2)
+
+    def test_plot_cache(self):
+        """
+        This method tests caching of rendered plot payloads.
+        """
+
+        # keys depend on the data versions and plot parameters
+        key = get_plot_payload_key(
+            kind='valuation', symbols=['AAPL'],
+            data_versions=[datetime(2021, 1, 1)], valuation_metric='Revenue',
+            start_date='01-01-2010')
+        self.assertNotEqual(key, get_plot_payload_key(
+            kind='valuation', symbols=['AAPL'],
+            data_versions=[datetime(2021, 1, 2)], valuation_metric='Revenue',
+            start_date='01-01-2010'))
+
+        # payloads are only built once, and copies are returned
+        builds = []
+        def build():
+            builds.append(1)
+            return {'script': '<script></script>', 'div': '<div></div>'}
+        plot = get_cached_plot_payload(key, build)
+        plot['valid_plot'] = 1
+        plot = get_cached_plot_payload(key, build)
+        self.assertEqual(len(builds), 1)
+        self.assertNotIn('valid_plot', plot)
+
+    def test_plot_data_payloads(self):
+        """
+        This method tests plot payloads in the data mode, which only include
+        data to be swapped into plots rendered by Bokeh.
+        """
+
+        quote_history_data = {datetime(2020, month, 1): 10.0 + month
+                              for month in range(1, 13)}
+        normal_price_data = {datetime(2020, 9, 1): 12.0,
+                             datetime(2021, 9, 1): float('nan')}
+
+        # series are encoded as epoch milliseconds and values
+        series = encode_series(normal_price_data)
+        self.assertEqual(series['x'], [1598918400000, 1630454400000])
+        self.assertEqual(series['y'], [12.0, None])
+        series = encode_series(quote_history_data, encoding='base64')
+        self.assertEqual(np.frombuffer(base64.b64decode(series['y']),
+                                       dtype='<f4').tolist(),
+                         list(quote_history_data.values()))
+        with self.assertRaises(ValueError):
+            encode_series(quote_history_data, encoding='csv')
+
+        # data sources are named the same as those in the Bokeh plot, and the
+        # payload is much smaller
+        plot = stock_valuation_plot(quote_history_data, normal_price_data, 3.2)
+        plot_data = stock_valuation_plot_data(quote_history_data,
+                                              normal_price_data, 3.2)
+        for name in list(plot_data['sources']) + list(plot_data['labels']):
+            self.assertIn(name, plot['script'])
+        self.assertLess(len(json.dumps(plot_data)) * 5,
+                        len(json.dumps(plot)))
+        plot_data = timeseries_plot_data([quote_history_data], ['AAPL'],
+                                         start_date=datetime(2020, 7, 1))
+        self.assertEqual(plot_data['sources']['timeseries_average_0']['y'],
+                         [19.5] * 6)
+
+    def test_plot_downsampling(self):
+        """
+        This method tests downsampling of time series for plotting.
+        """
+
+        # a flat series with a few spikes, which must all be kept
+        y = np.zeros(1000)
+        y[[100, 450, 800]] = [5., -3., 8.]
+        indices = lttb(np.arange(1000), y, 50)
+        self.assertEqual(len(indices), 50)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 999)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertTrue({100, 450, 800} <= set(indices.tolist()))
+        self.assertEqual(lttb(np.arange(10), np.arange(10), 20).tolist(),
+                         list(range(10)))
+        with self.assertRaises(ValueError):
+            lttb(np.arange(10), np.arange(10), 2)
+
+        # daily prices over 20 years
+        quote_history_data = {datetime(2000, 1, 1) + timedelta(days=i):
+                              100. + np.sin(i / 30.) for i in range(7300)}
+        data = downsample_series(quote_history_data, num_of_points=650)
+        self.assertEqual(len(data), 650)
+        self.assertTrue(all(quote_history_data[timestamp] == value
+                            for (timestamp, value) in data.items()))
+
+        # all prices of a short range are kept, with one more price on each
+        # side of the range
+        data = downsample_series(quote_history_data, num_of_points=650,
+                                 start_date=datetime(2010, 1, 1),
+                                 end_date=datetime(2010, 3, 1, 12))
+        self.assertEqual(list(data)[0], datetime(2009, 12, 31))
+        self.assertEqual(list(data)[-1], datetime(2010, 3, 2))
+        self.assertEqual(len(data), 62)
+
+        # plot payloads are bounded by the number of points
+        plot_data = stock_valuation_plot_data(
+            quote_history_data, {datetime(2019, 12, 1): 100.}, 1.2,
+            max_num_of_points=400)
+        self.assertEqual(
+            len(plot_data['sources']['valuation_price']['x']), 400)
+        plot_data = valuation_price_range_data(
+            quote_history_data, datetime(2010, 1, 1), datetime(2010, 3, 1, 12))
+        self.assertEqual(
+            len(plot_data['sources']['valuation_price']['x']), 62)
+
+    def test_stock_data_spans(self):
+        """
+        This method tests spans of financials history and quote history data
+        saved with stocks.
+        """
+
+        financials_history = {'financials': {
+            'annuals': {
+                'Fiscal Year': ['{}-09'.format(year)
+                                for year in range(2009, 2021)] + ['TTM'],
+                'income_statement': {
+                    'Shares Outstanding (Diluted Average)':
+                        [str(10 - 0.1 * i) for i in range(13)]}},
+            'quarterly': {
+                'Fiscal Year': ['2020-06', '2020-09', '2020-12', 'TTM']}}}
+        quote_history = {datetime(year, month, 1): 100.
+                         for year in range(2012, 2022) for month in range(1, 13)}
+
+        # spans of payloads saved before spans were kept are saved when first
+        # needed
+        now = datetime.utcnow()
+        stock = Stock(
+            symbol='AAPL', last_financials_history_update=now,
+            last_quote_history_update=now,
+            financials_history_payload=json.dumps(financials_history),
+            quote_history_payload=json.dumps({
+                timestamp.strftime('%m-%d-%Y %H:%M'): price
+                for (timestamp, price) in quote_history.items()}))
+        db.session.add(stock)
+        db.session.commit()
+        self.assertIsNone(stock.max_years_overlap)
+        spans = stock.get_data_spans()
+        self.assertEqual(spans, get_data_spans(
+            quote_history, MetricGraph(financials_history)))
+        self.assertEqual(spans.first_fiscal_period, datetime(2009, 9, 1))
+        self.assertEqual(spans.last_quote_date, datetime(2021, 12, 1))
+        self.assertEqual(spans.max_years_overlap, 8)
+        self.assertEqual(stock.get_last_financials_report_date(),
+                         datetime(2020, 9, 1))
+        self.assertEqual(stock.get_last_financials_report_date('quarterly'),
+                         datetime(2020, 12, 1))
+
+        # dates and durations derived from spans are the same as from data
+        self.assertEqual(
+            get_valplot_dates(None, None, num_of_years=5, spans=spans),
+            get_valplot_dates(quote_history, MetricGraph(financials_history),
+                              num_of_years=5))
+        self.assertEqual(get_durations(None, None, spans=spans),
+                         list(range(3, 9)))
+
+        # spans are updated along with saved data
+        stock.set_quote_history_spans({datetime(2019, 1, 1): 100.,
+                                       datetime(2021, 1, 1): 110.})
+        self.assertEqual(stock.max_years_overlap, 1)
+
+    def test_concurrent_fetching(self):
+        """
+        This method tests fetching data of stocks concurrently.
+        """
+
+        def fetch(value, seconds=0.2):
+            sleep(seconds)
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        # fetches take as long as the slowest one, and errors and missed
+        # deadlines are returned separately
+        start = monotonic()
+        results, errors = fetch_concurrently(
+            {'a': partial(fetch, 1), 'b': partial(fetch, 2),
+             'c': partial(fetch, ValueError('c')),
+             'd': partial(fetch, 4, seconds=2.)},
+            deadline_seconds={'d': 0.5})
+        self.assertLess(monotonic() - start, 1.)
+        self.assertEqual(results, {'a': 1, 'b': 2})
+        self.assertIsInstance(errors['c'], ValueError)
+        self.assertIsInstance(errors['d'], FetchTimeoutError)
+
+        # fetched data is saved, and failed refreshes are deferred if older
+        # data is saved
+        stock = Stock(symbol='AAPL', quote_details_paylod='{"Beta": 1.0}',
+                      last_quote_details_update=datetime(2020, 1, 1))
+        db.session.add(stock)
+        db.session.commit()
+        stock.get_due_fetches = lambda: {
+            'quote': partial(fetch, {'c': 150.}),
+            'quote_details': partial(fetch, ConnectionAbortedError())}
+        stock.refresh_data()
+        self.assertEqual(json.loads(stock.quote_payload), {'c': 150.})
+        self.assertFalse(stock._is_quote_due())
+        self.assertFalse(stock._is_quote_details_due())
+        self.assertEqual(stock.get_quote_details_data(), {'Beta': 1.0})
+
+    def test_valuation_endpoint(self):
+        """
+        This method tests the read-only JSON endpoint of stock valuation 
+        payloads, and its conditional requests.
+        """
+
+        self.app.config['LOGIN_DISABLED'] = True
+        client = self.app.test_client()
+
+        # stocks without saved data have no payloads
+        db.session.add(Stock(symbol='MSFT'))
+        db.session.commit()
+        response = client.get('/stock/msft/valuation')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json(), {'valid_plot': 0})
+
+        # mock up the saved data of a stock, with data refreshes deferred
+        now = datetime.utcnow()
+        financials_history = {'financials': {'annuals': {
+            'Fiscal Year': ['{}-09'.format(year) for year in range(2013, 2025)]
+                + ['TTM'],
+            'income_statement': {
+                'Revenue': [str(100 + 10 * i) for i in range(13)],
+                'Shares Outstanding (Diluted Average)':
+                    [str(10 - 0.1 * i) for i in range(13)]
+            }
+        }}}
+        quote_history = {
+            datetime(year, month, 1).strftime('%m-%d-%Y %H:%M'): 100. + month
+            for year in range(2013, now.year + 1) for month in range(1, 13)
+            if datetime(year, month, 1) <= now}
+        stock = Stock(
+            symbol='AAPL', last_financials_history_update=now,
+            last_quote_history_update=now, last_analyst_estimates_update=now,
+            financials_history_payload=json.dumps(financials_history),
+            quote_history_payload=json.dumps(quote_history),
+            analyst_estimates_payload=json.dumps(
+                {'annual': {'date': [], 'revenue_estimate': []}}))
+        db.session.add(stock)
+        db.session.commit()
+
+        url = '/stock/aapl/valuation?valuation_metric=Revenue&plot_mode=data'
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(payload['valid_plot'], 1)
+        self.assertIn('estimated_return', payload)
+        self.assertIn('valuation_metric_data', payload)
+        etag = response.headers['ETag']
+        self.assertTrue(response.cache_control.no_cache)
+
+        # payloads already with the client are not sent again, until request 
+        # arguments or data versions change
+        response = client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = client.get(url + '&num_of_years=10', 
+                              headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        stock.last_quote_history_update = now + timedelta(hours=1)
+        db.session.commit()
+        response = client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_stock_comparison(self):
+        """
+        This method tests retrieving and refreshing stocks in bulk for 
+        comparing metrics of stocks.
+        """
+
+        def fetch(value, seconds=0.2):
+            sleep(seconds)
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        # stocks are looked up at once, and symbols without profiles are 
+        # invalid (no profile is fetched without an API client)
+        self.app.finnhub_client = None
+        msft = Stock(symbol='MSFT', financials_history_payload='{}')
+        aapl = Stock(symbol='AAPL')
+        db.session.add_all([msft, aapl])
+        db.session.commit()
+        stocks, symbols_invalid, symbols_pending = Stock.get_stocks(
+            ['AAPL', 'XYZW', 'MSFT', 'AAPL'])
+        self.assertEqual(stocks, {'AAPL': aapl, 'MSFT': msft})
+        self.assertEqual(symbols_invalid, ['XYZW'])
+        self.assertEqual(symbols_pending, [])
+
+        # datasets of all stocks are fetched concurrently, and stocks with 
+        # datasets still missing after failures are returned
+        msft.get_due_fetches = lambda: {
+            'financials_history': partial(fetch, ValueError()),
+            'quote': partial(fetch, {'c': 250.})}
+        aapl.get_due_fetches = lambda: {
+            'financials_history': partial(fetch, ValueError()),
+            'quote_history': partial(fetch, {datetime(2020, 1, 1): 100.})}
+        start = monotonic()
+        symbols_missing_data = Stock.refresh_stocks_data(
+            [msft, aapl], names=['financials_history', 'quote_history'])
+        self.assertLess(monotonic() - start, 0.6)
+        self.assertEqual(symbols_missing_data, {'AAPL'})
+        self.assertIsNone(msft.quote_payload)
+        self.assertIsNotNone(aapl.quote_history_payload)
+        self.assertEqual(msft._get_deferred_refreshes(), 
+                         {'financials_history'})
+
+    def test_bulk_quote_updates(self):
+        """
+        This method tests updating quotes of stocks in bulk.
+        """
+
+        class QuoteClient(object):
+            def quote(self, symbol):
+                sleep(0.2)
+                if symbol == 'FAIL':
+                    raise ConnectionError(symbol)
+                return {'c': 100., 't': 1600000000}
+
+        # only quotes due are fetched, concurrently, and failed quotes are 
+        # left as they are
+        self.app.finnhub_client = QuoteClient()
+        stocks = [Stock(symbol='S{}'.format(i)) for i in range(8)] + \
+            [Stock(symbol='NEW', quote_payload='{"c": 1.0}', 
+                   last_quote_update=time()), 
+             Stock(symbol='FAIL', quote_payload='{"c": 2.0}')]
+        db.session.add_all(stocks)
+        db.session.commit()
+        start = monotonic()
+        Stock.update_quotes(stocks, delay=300)
+        self.assertLess(monotonic() - start, 1.)
+        self.assertEqual(json.loads(stocks[0].quote_payload)['c'], 100.)
+        self.assertEqual(json.loads(stocks[0].quote_payload)['currency'], 
+                         'USD')
+        self.assertEqual(stocks[-2].quote_payload, '{"c": 1.0}')
+        self.assertEqual(stocks[-1].quote_payload, '{"c": 2.0}')
+        self.assertIsNone(stocks[-1].last_quote_update)
+
+    def test_quote_cache(self):
+        """
+        This method tests the quote cache for quote polling, and saving 
+        quotes in bulk.
+        """
+
+        class QuoteClient(object):
+            num_of_calls = 0
+            def quote(self, symbol):
+                QuoteClient.num_of_calls += 1
+                return {'c': 100. + QuoteClient.num_of_calls, 't': 1600000000}
+
+        self.app.config['LOGIN_DISABLED'] = True
+        self.app.finnhub_client = QuoteClient()
+        client = self.app.test_client()
+        stock = Stock(symbol='AAPL')
+        db.session.add(stock)
+        db.session.commit()
+
+        # quotes are fetched once within the minimum delay, however short the 
+        # delay asked for, and saved right away while they cannot be queued 
+        # for saving (without Redis)
+        for _ in range(3):
+            response = client.get('/quote_polling?symbol=AAPL&delay=0')
+            self.assertEqual(
+                response.get_json()['quote']['quote_payload']['c'], 101.)
+        self.assertEqual(QuoteClient.num_of_calls, 1)
+        self.assertEqual(get_cached_quote('AAPL')[0]['c'], 101.)
+        self.assertEqual(json.loads(stock.quote_payload)['c'], 101.)
+
+        # quotes saved in bulk never replace newer quotes
+        Stock.save_quotes({'AAPL': ({'c': 99.}, stock.last_quote_update - 1)})
+        self.assertEqual(json.loads(stock.quote_payload)['c'], 101.)
+        Stock.save_quotes({'AAPL': ({'c': 102.}, stock.last_quote_update + 1)})
+        self.assertEqual(json.loads(stock.quote_payload)['c'], 102.)
+
+    def test_market_calendar(self):
+        """
+        This method tests the trading calendar used to schedule data 
+        refreshes.
+        """
+
+        # holidays and early closes follow the NYSE rules
+        holidays, early_closes = get_nyse_holidays(2024)
+        self.assertEqual(sorted(day.strftime('%m-%d') for day in holidays), 
+                         ['01-01', '01-15', '02-19', '03-29', '05-27', 
+                          '06-19', '07-04', '09-02', '11-28', '12-25'])
+        self.assertEqual(sorted(day.strftime('%m-%d') for day in early_closes), 
+                         ['07-03', '11-29', '12-24'])
+        holidays, early_closes = get_nyse_holidays(2022)
+        self.assertNotIn(datetime(2021, 12, 31).date(), holidays)
+        self.assertIn(datetime(2022, 6, 20).date(), holidays)
+        self.assertIn(datetime(2022, 12, 26).date(), holidays)
+        _, early_closes = get_nyse_holidays(2021)
+        self.assertEqual(early_closes, {datetime(2021, 11, 26).date()})
+
+        # sessions are in local time, with the settling time after closing
+        calendar = get_market_calendar()
+        self.assertEqual(calendar.get_session(datetime(2024, 11, 29).date()), 
+                         (datetime(2024, 11, 29, 14, 30), 
+                          datetime(2024, 11, 29, 18, 15)))
+        self.assertIsNone(calendar.get_session(datetime(2025, 1, 9).date()))
+        self.assertTrue(calendar.is_open(datetime(2024, 7, 1, 19, 59)))
+        self.assertFalse(calendar.is_open(datetime(2024, 7, 1, 20, 30)))
+
+        # data is refreshed during sessions, and once after closing, and then 
+        # not until the next opening (after a weekend and the start of DST)
+        minute = timedelta(minutes=1)
+        self.assertEqual(calendar.get_next_refresh_time(
+            datetime(2024, 3, 8, 15), minute), datetime(2024, 3, 8, 15, 1))
+        self.assertEqual(calendar.get_next_refresh_time(
+            datetime(2024, 3, 8, 21, 14, 30), minute), 
+            datetime(2024, 3, 8, 21, 15, 30))
+        self.assertEqual(calendar.get_next_refresh_time(
+            datetime(2024, 3, 8, 21, 16), minute), datetime(2024, 3, 11, 13, 30))
+        self.assertFalse(calendar.is_refresh_due(
+            datetime(2024, 3, 9, 12), timedelta(hours=24), 
+            now=datetime(2024, 3, 10, 22)))
+        self.assertTrue(calendar.is_refresh_due(None, minute))
+
+    def test_symbol_filter(self):
+        """
+        This method tests rejecting nonexistent symbols without fetching 
+        company profiles.
+        """
+
+        # symbols added are always in the filter, and others rarely are
+        symbols = ['S{}'.format(i) for i in range(2000)]
+        bloom_filter = BloomFilter.for_capacity(len(symbols), 0.01)
+        for symbol in symbols:
+            bloom_filter.add(symbol)
+        self.assertTrue(all(symbol in bloom_filter for symbol in symbols))
+        num_of_false_positives = sum('X{}'.format(i) in bloom_filter 
+                                     for i in range(2000))
+        self.assertLess(num_of_false_positives, 60)
+        copied = BloomFilter(bloom_filter.num_of_bits, 
+                             bloom_filter.num_of_hashes, 
+                             bytes(bloom_filter.bits))
+        self.assertTrue(all(symbol in copied for symbol in symbols))
+
+        class ProfileClient(object):
+            symbols = []
+            def company_profile2(self, symbol):
+                ProfileClient.symbols.append(symbol)
+                return {'name': symbol} if symbol == 'AAPL' else {}
+
+        # symbols not in the filter are rejected without API requests
+        self.app.finnhub_client = ProfileClient()
+        try:
+            self.assertIsNone(get_company_profile('ZZZZ'))
+            build_symbol_filter(['AAPL', 'MSFT'])
+            self.assertEqual(get_company_profile('AAPL'), {'name': 'AAPL'})
+            self.assertIsNone(get_company_profile('ZZZZ'))
+            self.assertIsNone(get_company_profile('MSFT'))
+            self.assertEqual(ProfileClient.symbols, ['ZZZZ', 'AAPL', 'MSFT'])
+        finally:
+            symbol_filter._symbol_filter = None
+
+    def test_circuit_breakers(self):
+        """
+        This method tests circuit breakers and deadlines of calls to data 
+        providers, and degrading to stored data.
+        """
+
+        self.app.config['CIRCUIT_BREAKER_FAILURES'] = 2
+        self.app.config['CIRCUIT_BREAKER_COOLDOWN_SECONDS'] = 0.3
+        self.app.config['PROVIDER_TIMEOUT_SECONDS'] = {'slow_provider': 0.1}
+        calls = []
+
+        def call(value):
+            calls.append(value)
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        # the breaker opens after enough failures, and closes again after a 
+        # successful trial call once cooled down
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                call_provider('test_provider', call, ValueError())
+        with self.assertRaises(CircuitOpenError):
+            call_provider('test_provider', call, 1)
+        self.assertEqual(len(calls), 2)
+        sleep(0.35)
+        self.assertEqual(call_provider('test_provider', call, 2), 2)
+        self.assertEqual(call_provider('test_provider', call, 3), 3)
+
+        # calls running out of time are abandoned
+        with self.assertRaises(DeadlineExceededError):
+            call_provider('slow_provider', sleep, 1)
+
+        # no calls are made after the request deadline, and the stored data 
+        # is used instead if any
+        stock = Stock(symbol='AAPL', financials_history_payload='{"a": 1}')
+        db.session.add(stock)
+        db.session.commit()
+        with self.app.test_request_context():
+            set_request_deadline(monotonic() - 1)
+            with self.assertRaises(DeadlineExceededError):
+                call_provider('test_provider', call, 4)
+            self.app.config['GURU_API_KEY'] = 'key'
+            self.assertEqual(stock.get_financials_history_data(), {'a': 1})
+            self.assertFalse(stock._is_financials_history_due())
+        self.assertEqual(calls, [calls[0], calls[1], 2, 3])
+
+    def test_data_providers(self):
+        """
+        This method tests getting data from the providers configured for 
+        datasets, with fallbacks and hedged requests.
+        """
+
+        class FailingClient(object):
+            def company_profile2(self, symbol):
+                raise ConnectionError(symbol)
+
+        self.assertTrue(providers['stub'].provides('quote'))
+        self.assertFalse(providers['gurufocus'].provides('quote'))
+        register_provider(StubProvider(latency=1., name='slow_stub'))
+        self.app.config['HEDGE_DELAY_DEFAULT_SECONDS'] = 0.05
+        self.app.config['DATASET_PROVIDERS'] = dict(
+            self.app.config['DATASET_PROVIDERS'], 
+            quote=['slow_stub', 'stub'], 
+            company_profile=['finnhub', 'stub'])
+        try:
+            # failed providers fall back to the next ones
+            self.app.finnhub_client = FailingClient()
+            self.assertEqual(get_company_profile('AAPL'), 
+                             {'name': 'AAPL Inc.'})
+
+            # a slow provider is hedged by the next one
+            start = monotonic()
+            self.assertEqual(get_quote('AAPL')['c'], 
+                             providers['stub'].get_quote('AAPL')['c'])
+            self.assertLess(monotonic() - start, 0.5)
+            self.assertEqual(get_hedge_delay('slow_stub', 'quote'), 0.05)
+        finally:
+            providers.pop('slow_stub')
+
+    def test_quote_streaming(self):
+        """
+        This method tests aggregating trades into quotes, and ingesting them 
+        from a local stand-in of the trade stream.
+        """
+
+        aggregator = QuoteAggregator()
+        aggregator.set_quote('AAPL', {'c': 10., 'h': 10.5, 'l': 9.5, 
+                                      'pc': 8.})
+        self.assertEqual(aggregator.add_trades([
+            {'s': 'AAPL', 'p': 11., 't': 0, 'v': 1}, 
+            {'s': 'AMZN', 'p': 20., 't': 0, 'v': 1}]), {'AAPL'})
+        quote = aggregator.quotes['AAPL']
+        self.assertEqual((quote['c'], quote['h'], quote['l'], quote['d']), 
+                         (11., 11., 9.5, 3.))
+        self.assertAlmostEqual(quote['dp'], 37.5)
+
+        # streamed quotes are cached for quote polling
+        self.app.config['DATASET_PROVIDERS'] = dict(
+            self.app.config['DATASET_PROVIDERS'], quote=['stub'])
+        stream = StubTradeStream(price=100.)
+
+        async def ingest():
+            await stream.serve()
+            ingester = QuoteStreamIngester(stream.get_url(), 
+                                           get_symbols=lambda: {'AAPL'}, 
+                                           subscription_seconds=0.05)
+            try:
+                await asyncio.wait_for(ingester.run(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                stream.server.close()
+                await stream.server.wait_closed()
+
+        asyncio.run(ingest())
+        self.assertEqual(stream.subscriptions, [('subscribe', 'AAPL')])
+        quote = get_cached_quote('AAPL')[0]
+        self.assertGreater(quote['c'], 100.)
+        self.assertEqual(quote['pc'], providers['stub'].get_quote('AAPL')['pc'])
+
+    def test_fundamentals_frame(self):
+        """
+        This method tests building, reading and serializing fundamentals
+        frames.
+        """
+
+        # mock up a financials history payload
+        financials_history = {'financials': {'annuals': {
+            'Fiscal Year': ['2019-12', '2020-12', '2021-12', 'TTM'],
+            'income_statement': {
+                'Revenue': ['100', '200', '300', '350'],
+                'Net Income': ['10', '-', '30', 'N/A']
+            },
+            'common_size_ratios': {'ROE %': ['10', '20', '30', '40']}
+        }}}
+        frame = FundamentalsFrame.from_payload(financials_history)
+        self.assertEqual(frame.values.shape, (3, 3))
+        self.assertEqual(frame.fiscal_years, ('2019-12', '2020-12', '2021-12'))
+        self.assertTrue(frame.has('income_statement', 'Net Income'))
+        self.assertFalse(frame.has('balance_sheet', 'Net Income'))
+        self.assertTrue(np.isnan(frame.column('income_statement',
+                                              'Net Income')[1]))
+        self.assertEqual(frame.ttm_value('income_statement', 'Revenue'), 350)
+
+        # metrics are views of the frame, with non-numeric values defaulted
+        metric_graph = MetricGraph(fundamentals_frame=frame)
+        revenue = metric_graph.get('Revenue')
+        self.assertTrue(np.shares_memory(
+            revenue.array, frame.column('income_statement', 'Revenue')))
+        self.assertEqual(revenue.values, (100, 200, 300))
+        self.assertEqual(revenue.TTM_value, 350)
+        net_income = metric_graph.get('Net Income')
+        self.assertEqual(net_income.values, (10, 0, 30))
+        self.assertEqual(net_income.TTM_value, 0)
+        roe = metric_graph.get('ROE %', scale_factor=1/100)
+        self.assertAlmostEqual(roe.TTM_value, 0.4)
+
+        # serialization
+        frame_copy = FundamentalsFrame.from_bytes(frame.to_bytes())
+        self.assertEqual(frame_copy.keys, frame.keys)
+        np.testing.assert_array_equal(frame_copy.values, frame.values)
+        np.testing.assert_array_equal(frame_copy.ttm_values, frame.ttm_values)
+        self.assertTrue(frame_copy.has_ttm)
+
+        # the frame of a saved payload
+        stock = Stock(symbol='AAPL',
+                      financials_history_payload=json.dumps(financials_history),
+                      last_financials_history_update=datetime.utcnow())
+        self.assertEqual(stock.get_fundamentals_frame().keys, frame.keys)
+
     def test_metric_valid_values(self):
         """
         This method tests the logic to get valid values for metrics.